@@ -0,0 +1,80 @@
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyhpweb.template import Bytecode_Cache, Template_Cache
+from pyhpweb.tools import _walk_web_files
+
+"""
+5000 个页面的网站冷启动时第一次获取所有页面的时间
+
+运行: python benchmark/cold_start.py
+compile 为没有磁盘缓存时读取并编译所有页面 (新进程第一次访问每个页面)
+precompile 为 python -m pyhpweb compile 预先编译整个网站的时间 (部署时运行一次)
+load 为设置 bytecode_cache_path 后从磁盘缓存读取所有页面
+"""
+
+PAGE_COUNT = 5000
+
+
+def make_page(index: int, block_count: int) -> str:
+    """有 block_count 个代码块的页面"""
+    rows = "".join(
+        f"<tr><td>{row}</td><?py\n"
+        f"total = sum(range({row}))\n"
+        f"if total % 2:\n"
+        f"    print(f'<td>{{total}}</td>')\n"
+        f"else:\n"
+        f"    print('<td>' + str([item * 2 for item in range(3)]) + '</td>')\n"
+        f"?></tr>\n"
+        for row in range(block_count)
+    )
+    return f"<html><head><title>page {index}</title></head><body><table>\n{rows}</table></body></html>\n"
+
+
+def make_site(web_path: str):
+    """PAGE_COUNT 个页面, 每个目录 100 个页面, 代码块数量 5 - 40"""
+    for index in range(PAGE_COUNT):
+        dir_path = os.path.join(web_path, f"section_{index // 100}")
+        os.makedirs(dir_path, exist_ok=True)
+        with open(os.path.join(dir_path, f"page_{index}.pyhtml"), "w", encoding="utf-8") as _file:
+            _file.write(make_page(index, 5 + index % 36))
+
+
+def load_all(pages: list[str], bytecode_cache: Bytecode_Cache = None) -> float:
+    """使用新的 Template_Cache 获取所有页面, 返回秒数"""
+    cache = Template_Cache(len(pages))
+    cache.bytecode_cache = bytecode_cache
+    start = perf_counter()
+    for file_path in pages:
+        cache.get(file_path)
+    return perf_counter() - start
+
+
+def main():
+    tmp_path = tempfile.mkdtemp()
+    try:
+        web_path = os.path.join(tmp_path, "web")
+        cache_path = os.path.join(tmp_path, "pyhp_cache")
+        make_site(web_path)
+        pages = [file_path for file_path, _ in _walk_web_files(web_path)]
+
+        compile_ = load_all(pages)
+        start = perf_counter()
+        Bytecode_Cache(cache_path).compile_web_path(web_path)
+        precompile = perf_counter() - start
+        load = load_all(pages, Bytecode_Cache(cache_path))
+
+        print(f"{'pages':>8} {'compile s':>12} {'precompile s':>14} {'load s':>10} {'speedup':>10}")
+        print(f"{len(pages):>8} {compile_:>12.3f} {precompile:>14.3f} {load:>10.3f} {compile_ / load:>9.1f}x")
+        print(f"\nfirst hit per page: compile {compile_ / len(pages) * 1000:.3f} ms, load {load / len(pages) * 1000:.3f} ms")
+    finally:
+        shutil.rmtree(tmp_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyhpweb import Py_Html
+from pyhpweb.error import IncludeImportError
+from pyhpweb.template import Py_Template_Cache
+from pyhpweb.tools import _get_include_path
+
+"""
+每个页面 include 1000 次的生成时间
+
+运行: python benchmark/include.py
+legacy 为每次 include 复制包含它的页面的全局变量与局部变量的旧方式
+vars 为包含页面已有的局部变量数量
+"""
+
+# 被包含页面只能读取包含它的页面的全局变量, 每行的数据使用 global 传递
+ROW_PAGE = "<li><?py row_html = f'{row_index}: {get.get(\"q\", \"\")}'; print(row_html) ?></li>\n"
+
+
+def make_page(var_count: int, include_count: int) -> str:
+    """有 var_count 个局部变量, include include_count 次的页面"""
+    return (
+        "<?py\n"
+        + "".join(f"var_{index} = {index}\n" for index in range(var_count))
+        + "global row_index\n"
+        + f"for row_index in range({include_count}):\n"
+        + "    include('row.pyhtml')\n"
+        + "?>\n"
+    )
+
+
+class Legacy_Py_Html(Py_Html):
+    """旧 include 方式"""
+
+    def include(self, pyhtm_path: str, update_header: bool = False):
+        try:
+            include_file_path = _get_include_path(self._Py_Html__html_path, pyhtm_path)
+            py_html = Legacy_Py_Html(
+                Py_Template_Cache.get(include_file_path, self._Py_Html__encoding),
+                include_file_path, self._Py_Html__encoding, self.response.copy(),
+                self._vals.copy(), self._run_py_vals.copy()
+            )
+
+            self._run_py_vals.update(py_html._run_py_vals)
+            self.print(f"{py_html.get_html()}\n")
+        except Exception as err:
+            raise IncludeImportError(str(err))
+
+
+def timeit(func, number: int, repeat: int = 5) -> float:
+    """repeat 次中最快一次的每次毫秒数"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (perf_counter() - start) / number * 1000)
+    return best
+
+
+def main():
+    work_path = tempfile.mkdtemp(prefix="pyhp-include-")
+    try:
+        with open(os.path.join(work_path, "row.pyhtml"), "w") as _file:
+            _file.write(ROW_PAGE)
+
+        page_path = os.path.join(work_path, "page.pyhtml")
+        vals = lambda: {"get": {"q": "pyhp"}}
+        print(f"{'vars':>8} {'legacy ms':>12} {'layered ms':>12} {'speedup':>9}")
+        for var_count in (10, 100, 500, 1000, 5000):
+            with open(page_path, "w") as _file:
+                _file.write(make_page(var_count, 1000))
+
+            Py_Template_Cache.clear()
+            template = Py_Template_Cache.get(page_path)
+            html = Py_Html(template, page_path, vals=vals()).get_html()
+            assert "Error" not in html and Legacy_Py_Html(template, page_path, vals=vals()).get_html() == html
+
+            legacy = timeit(lambda: Legacy_Py_Html(template, page_path, vals=vals()), 5)
+            layered = timeit(lambda: Py_Html(template, page_path, vals=vals()), 5)
+            print(f"{var_count:>8} {legacy:>12.2f} {layered:>12.2f} {legacy / layered:>8.2f}x")
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import socket
+import sys
+from threading import Thread
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyhpweb import PyHP_Server
+
+"""
+保持连接与每个请求新建连接的每秒请求数
+
+运行: python benchmark/keep_alive.py
+"""
+
+HOST, PORT = "127.0.0.1", 5070
+WEB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "demo", "demo")
+
+
+def run_server(server: PyHP_Server, started: list):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server._server = loop.run_until_complete(asyncio.start_server(server._client_connected, HOST, PORT))
+    started.append(loop)
+    loop.run_forever()
+
+
+def read_response(sock_file) -> bytes:
+    """读取一个响应"""
+    content_length = 0
+    while True:
+        line = sock_file.readline()
+        if line in (b"\n", b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            content_length = int(line.split(b":")[1])
+    return sock_file.read(content_length)
+
+
+def bench(path: str, number: int, keep_alive: bool) -> float:
+    connection = b"keep-alive" if keep_alive else b"close"
+    request = b"GET %b HTTP/1.1\r\nHost: %b\r\nConnection: %b\r\n\r\n" % (
+        path.encode(), HOST.encode(), connection
+    )
+
+    start = perf_counter()
+    sock = None
+    for _ in range(number):
+        if sock is None:
+            sock = socket.create_connection((HOST, PORT))
+            sock_file = sock.makefile("rb")
+
+        sock.sendall(request)
+        read_response(sock_file)
+
+        if not keep_alive:
+            sock_file.close()
+            sock.close()
+            sock = None
+
+    if sock is not None:
+        sock.close()
+    return number / (perf_counter() - start)
+
+
+def main():
+    server = PyHP_Server(web_path=WEB_PATH, port=PORT, keep_alive_max_requests=1 << 30)
+    started = []
+    Thread(target=run_server, args=(server, started), daemon=True).start()
+    while not started:
+        pass
+
+    print(f"{'path':<16} {'close req/s':>12} {'keep-alive req/s':>18}")
+    for path in ("/index.pyh", "/test.pyhtml"):
+        bench(path, 200, True)
+        close = bench(path, 2000, False)
+        keep_alive = bench(path, 2000, True)
+        print(f"{path:<16} {close:>12.0f} {keep_alive:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyhpweb import Py_Html
+from pyhpweb.constant import Py_Code_Pattern
+from pyhpweb.template import Py_Template, _format_py_code_block
+
+"""
+页面生成时间与代码块数量
+
+运行: python benchmark/render_blocks.py
+legacy 为逐个代码块 exec 源码并用 Py_Code_Pattern.sub 替换整个页面的旧生成方式
+"""
+
+
+def make_page(block_count: int) -> str:
+    """生成有 block_count 个代码块的页面"""
+    return "".join(
+        f"<div><p>row {index}</p><?py print(f'<span>{{{index} * 2}}</span>') ?></div>\n"
+        for index in range(block_count)
+    )
+
+
+def legacy_render(html: str) -> str:
+    """旧生成方式"""
+    echo_list: list[str] = []
+    vals = {"print": lambda *args: echo_list.append("\n".join(str(arg) for arg in args))}
+    run_py_vals = {}
+    for py_code_block in list(Py_Code_Pattern.finditer(html)):
+        exec(_format_py_code_block(py_code_block.group()), vals, run_py_vals)
+        html = Py_Code_Pattern.sub("".join(echo_list), html, count=1)
+        echo_list.clear()
+    return html
+
+
+def timeit(func, number: int) -> float:
+    start = perf_counter()
+    for _ in range(number):
+        func()
+    return (perf_counter() - start) / number * 1000
+
+
+def main():
+    print(f"{'blocks':>8} {'legacy ms':>12} {'compile ms':>12} {'render ms':>12}")
+    for block_count in (10, 100, 500, 1000, 2000, 5000):
+        html = make_page(block_count)
+        number = max(1, 2000 // block_count)
+
+        template = Py_Template(html, "bench.pyhtml")
+        legacy = timeit(lambda: legacy_render(html), number)
+        compile_ = timeit(lambda: Py_Template(html, "bench.pyhtml"), number)
+        render = timeit(lambda: Py_Html(template, "bench.pyhtml", vals={}), number)
+        print(f"{block_count:>8} {legacy:>12.3f} {compile_:>12.3f} {render:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
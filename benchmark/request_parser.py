@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyhpweb.parser import Request_Head_End, _parse_request_head, httptools
+
+"""
+解析常见浏览器请求头的时间
+
+运行: python benchmark/request_parser.py
+legacy 为每行 await readline() 后 decode 与 split(": ") 的旧解析方式
+"""
+
+BROWSER_REQUEST = (
+    b"GET /index.pyh?page=2&sort=desc HTTP/1.1\r\n"
+    b"Host: 127.0.0.1:5000\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Cache-Control: max-age=0\r\n"
+    b"sec-ch-ua: \"Chromium\";v=\"118\", \"Google Chrome\";v=\"118\", \"Not=A?Brand\";v=\"99\"\r\n"
+    b"sec-ch-ua-mobile: ?0\r\n"
+    b"sec-ch-ua-platform: \"Linux\"\r\n"
+    b"Upgrade-Insecure-Requests: 1\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    b"Chrome/118.0.0.0 Safari/537.36\r\n"
+    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,"
+    b"image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7\r\n"
+    b"Sec-Fetch-Site: same-origin\r\n"
+    b"Sec-Fetch-Mode: navigate\r\n"
+    b"Sec-Fetch-User: ?1\r\n"
+    b"Sec-Fetch-Dest: document\r\n"
+    b"Referer: http://127.0.0.1:5000/index.pyh\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Accept-Language: zh-CN,zh;q=0.9,en;q=0.8\r\n"
+    b"Cookie: text=30%E7%A7%92%E5%90%8E%E8%BF%87%E6%9C%9F; session=8f3a2c1d9e7b4a6f\r\n"
+    b"\r\n"
+)
+
+
+async def legacy_parse(reader: asyncio.StreamReader):
+    """旧解析方式"""
+    request_line = (await reader.readline()).decode("utf-8").rstrip("\r\n").split(" ")
+    request_header = {}
+    while True:
+        data = await reader.readline()
+        if data == b"\r\n":
+            return request_line, request_header
+
+        key, val = data.decode("utf-8").rstrip("\r\n").split(": ")
+        request_header[key.lower()] = val
+
+
+async def head_parse(reader: asyncio.StreamReader, use_httptools: bool):
+    """读取整个请求头后一次解析"""
+    return _parse_request_head(await reader.readuntil(Request_Head_End), "utf-8", use_httptools)
+
+
+async def bench(parse, number: int) -> float:
+    """每次解析的微秒数, 数据已经在 StreamReader 缓冲区中 (与管线化请求相同)"""
+    reader = asyncio.StreamReader()
+    start = perf_counter()
+    for _ in range(number):
+        reader.feed_data(BROWSER_REQUEST)
+        await parse(reader)
+    return (perf_counter() - start) / number * 1e6
+
+
+async def main():
+    number = 50000
+    results = {
+        "legacy readline": await bench(legacy_parse, number),
+        "one-pass python": await bench(lambda reader: head_parse(reader, False), number),
+    }
+    if httptools is not None:
+        results["one-pass httptools"] = await bench(lambda reader: head_parse(reader, True), number)
+    else:
+        print("httptools not installed, skip (pip install httptools)")
+
+    legacy = results["legacy readline"]
+    print(f"{'parser':<20} {'us / request':>14} {'speedup':>9}")
+    for name, us in results.items():
+        print(f"{name:<20} {us:>14.2f} {legacy / us:>8.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+from threading import Thread
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyhpweb import PyHP_Server
+
+"""
+上传大文件 (multipart/form-data) 的速度与服务端内存峰值
+
+运行: python benchmark/upload.py [上传大小 MB, 默认 1024]
+"""
+
+HOST, PORT = "127.0.0.1", 5071
+BOUNDARY = b"----PyHPBenchmarkBoundary7MA4YWxkTrZu0gW"
+BLOCK = os.urandom(1024 * 1024)
+
+
+def run_server(server: PyHP_Server, started: list):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server._server = loop.run_until_complete(asyncio.start_server(server._client_connected, HOST, PORT))
+    started.append(loop)
+    loop.run_forever()
+
+
+def upload(size_mb: int) -> tuple[float, bytes]:
+    """上传 size_mb MB 文件, 返回 (秒, 响应)"""
+    head = b"--%b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"upload.bin\"\r\n" \
+        b"Content-Type: application/octet-stream\r\n\r\n" % BOUNDARY
+    tail = b"\r\n--%b--\r\n" % BOUNDARY
+    content_length = len(head) + size_mb * len(BLOCK) + len(tail)
+
+    sock = socket.create_connection((HOST, PORT))
+    start = perf_counter()
+    sock.sendall(
+        b"POST /upload.pyhtml HTTP/1.1\r\nHost: %b\r\nConnection: close\r\n"
+        b"Content-Type: multipart/form-data; boundary=%b\r\nContent-Length: %d\r\n\r\n" % (
+            HOST.encode(), BOUNDARY, content_length
+        )
+    )
+    sock.sendall(head)
+    for _ in range(size_mb):
+        sock.sendall(BLOCK)
+    sock.sendall(tail)
+
+    response = b""
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        response += data
+
+    sock.close()
+    return perf_counter() - start, response
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    work_path = tempfile.mkdtemp(prefix="pyhp-upload-")
+    with open(os.path.join(work_path, "upload.pyhtml"), "w") as _file:
+        _file.write("<?py print(files[0]['file_size']) ?>")
+
+    cwd = os.getcwd()
+    # 上传文件保存在 ./web_upload_file
+    os.chdir(work_path)
+    try:
+        server = PyHP_Server(web_path=work_path, port=PORT, request_upload_max_size=(size_mb + 1) * 1024)
+        started = []
+        Thread(target=run_server, args=(server, started), daemon=True).start()
+        while not started:
+            pass
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        seconds, response = upload(size_mb)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        file_size = os.path.getsize(os.path.join(work_path, "web_upload_file", "upload.bin"))
+
+        print(f"upload {size_mb} MB: {seconds:.2f}s, {size_mb / seconds:.0f} MB/s")
+        print(f"saved file size: {file_size} ({'ok' if file_size == size_mb * len(BLOCK) else 'mismatch'})")
+        body = response.split(b"\n\n", 1)[-1].decode()
+        print(f"response body: {body}")
+        print(f"max rss: {rss_before / 1024:.0f} MB -> {rss_after / 1024:.0f} MB")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import sys
+from time import perf_counter
+
+from pyhpweb.template import Bytecode_Cache
+
+
+"""
+命令行工具
+
+预先编译网站目录中的页面: python -m pyhpweb compile <web_path> [--cache-path ./pyhp_cache]
+启动时设置 PyHP_Server(bytecode_cache_path=...) 为相同目录
+"""
+
+
+def _compile(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    result = Bytecode_Cache(args.cache_path).compile_web_path(args.web_path, args.encoding, args.force)
+    print(" * Compiled %s pages, %s already cached, %s failed in %.2fs to '%s'" % (
+        result["compiled"], result["cached"], result["failed"], perf_counter() - start, args.cache_path
+    ))
+    return 1 if result["failed"] else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pyhpweb")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = commands.add_parser("compile", help="precompile pages to the bytecode cache")
+    compile_parser.add_argument("web_path", help="website root directory")
+    compile_parser.add_argument(
+        "--cache-path", default="./pyhp_cache", help="bytecode cache directory (default: ./pyhp_cache)"
+    )
+    compile_parser.add_argument("--encoding", default="utf-8", help="page encoding (default: utf-8)")
+    compile_parser.add_argument("--force", action="store_true", help="recompile pages already cached")
+    compile_parser.set_defaults(func=_compile)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
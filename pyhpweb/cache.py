@@ -0,0 +1,288 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from types import ModuleType
+from typing import Any, Hashable, Optional
+
+
+# 可以在请求之间共享的值的类型
+Shareable_Types = (type(None), bool, int, float, complex, str, bytes, ModuleType)
+
+
+def _shareable(val: Any, depth: int = 0) -> bool:
+    """值是否可以在请求之间共享: 基本类型, 模块与由这些值组成的 list / tuple / set / dict (最多 8 层)\n
+    函数, 类与其他对象 (包括容器的子类) 可能引用生成它的请求的全局变量 (cookie, get, html 等), 不能共享"""
+    if isinstance(val, Shareable_Types):
+        return True
+
+    if depth >= 8:
+        return False
+
+    if type(val) in (list, tuple, set, frozenset):
+        return all(_shareable(item, depth + 1) for item in val)
+
+    if type(val) is dict:
+        return all(_shareable(key, depth + 1) and _shareable(item, depth + 1) for key, item in val.items())
+
+    return False
+
+
+def _copy_shareable(val: Any) -> Any:
+    """复制可以共享的值 (查看 _shareable) 中的容器, 基本类型与模块不复制\n
+    每个请求得到自己的 list / set / dict, 修改时不会影响缓存与其他请求"""
+    if type(val) in (list, tuple, set, frozenset):
+        return type(val)(_copy_shareable(item) for item in val)
+
+    if type(val) is dict:
+        return {key: _copy_shareable(item) for key, item in val.items()}
+
+    return val
+
+
+class Fragment_Cache_Entry:
+    """已缓存的 include 页面输出"""
+
+    __slots__ = ("version", "expires", "html", "cookies", "vals", "response", "header")
+
+    def __init__(
+        self,
+        version: Optional[tuple[int, int]],
+        expires: float,
+        html: str,
+        cookies: str,
+        vals: dict[str, Any],
+        response: dict[str, Any],
+        header: dict[str, Any]
+    ) -> None:
+        self.version = version
+        self.expires = expires
+        self.html = html
+        self.cookies = cookies
+        self.vals = vals
+        self.response = response
+        self.header = header
+
+
+class Fragment_Cache:
+    """
+    include 页面输出缓存
+    ----------------
+    进程内共享, 按 (页面路径, vary 值) 缓存被包含页面的输出, 设置的 Cookie, 写入的变量与响应头\n
+    写入的变量只能是可以在请求之间共享的值 (查看 _shareable), 否则不缓存, 每次使用时复制 (查看 _copy_shareable)\n
+    超过缓存时间或页面文件修改后失效, 超过 max_size 时淘汰最久未使用的输出
+
+    max_size:
+        最多缓存数量
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Fragment_Cache_Entry] = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        if hasattr(os, "register_at_fork"):
+            # fork 时锁可能正被其他线程持有
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = Lock()
+
+    def get(self, key: Hashable, version: tuple[int, int]) -> Optional[Fragment_Cache_Entry]:
+        """获取已缓存的输出, 没有, 已过期或页面已修改时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            if entry.version != version or entry.expires <= monotonic():
+                self._misses += 1
+                self._expired += 1
+                del self._entries[key]
+                return None
+
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, entry: Fragment_Cache_Entry):
+        """缓存输出, 超过 max_size 时删除最久没有使用的输出"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """缓存状态\n
+        entries: 缓存数量, max_size: 最多缓存数量, hits: 命中次数, misses: 没有命中次数 (包括过期),
+        expired: 过期或页面已修改次数, evictions: 超过 max_size 删除次数, hit_rate: 命中率"""
+        requests = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "expired": self._expired,
+            "evictions": self._evictions,
+            "hit_rate": self._hits / requests if requests else 0.0,
+        }
+
+
+class Page_Cache_Policy:
+    """页面使用 html.cache 声明的缓存策略"""
+
+    __slots__ = ("ttl", "stale_while_revalidate", "vary_get", "vary_cookie")
+
+    def __init__(
+        self, 
+        ttl: float, 
+        stale_while_revalidate: float = 0, 
+        vary_get: tuple[str, ...] = (), 
+        vary_cookie: tuple[str, ...] = ()
+    ) -> None:
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.vary_get = vary_get
+        self.vary_cookie = vary_cookie
+
+
+class Page_Cache_Entry:
+    """
+    已缓存的页面响应
+    ----------------
+    生成页面时创建, response 为 None 时页面只声明了缓存策略, 本次响应不能缓存 (例如设置了 Cookie)
+    """
+
+    __slots__ = (
+        "policy", "version", "response", "date", "header", "etag", "last_modified", "expires", "stale_until"
+    )
+
+    def __init__(
+        self,
+        policy: Page_Cache_Policy,
+        version: tuple[int, int],
+        response: Optional[bytes] = None,
+        date: bytes = b"",
+        header: Optional[dict[str, Any]] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[float] = None
+    ) -> None:
+        self.policy = policy
+        self.version = version
+        self.response = response
+        self.date = date
+        self.header = header
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = 0.0
+        self.stale_until = 0.0
+
+
+class Page_Cache:
+    """
+    页面响应缓存
+    ----------------
+    页面使用 html.cache 声明缓存后, 按页面路径记录缓存策略, 
+    之后的请求按 (页面路径, vary_get 参数, vary_cookie Cookie, 压缩方式) 缓存完整响应\n
+    超过 ttl 秒后在 stale_while_revalidate 秒内仍然使用旧响应 (同时在后台重新生成页面), 
+    超过 max_size 时淘汰最久未使用的响应\n
+    只在事件循环所在线程中使用
+
+    max_size:
+        最多缓存响应数量
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        # 已生成过的页面的缓存策略, 没有声明缓存的页面为 None
+        self.policies: dict[str, Optional[Page_Cache_Policy]] = {}
+        self._entries: OrderedDict[Hashable, Page_Cache_Entry] = OrderedDict()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def get(
+        self, 
+        key: Hashable, 
+        version: tuple[int, int], 
+        count: bool = True
+    ) -> tuple[Optional[Page_Cache_Entry], bool]:
+        """获取已缓存的响应, 返回 (响应, 是否没有过期), 没有, 超过 stale_while_revalidate 或页面已修改时响应为 None\n
+        count 为 False 时不记录命中次数 (等待其他请求生成页面后再次获取)"""
+        entry = self._entries.get(key)
+        now = monotonic()
+        if entry is None or entry.version != version or entry.stale_until <= now:
+            self._misses += count
+            if entry is not None:
+                del self._entries[key]
+            return None, False
+
+        self._entries.move_to_end(key)
+        if entry.expires > now:
+            self._hits += count
+            return entry, True
+
+        self._stale_hits += count
+        return entry, False
+
+    def set(self, key: Hashable, entry: Page_Cache_Entry):
+        """缓存响应, 超过 max_size 时删除最久没有使用的响应"""
+        now = monotonic()
+        entry.expires = now + entry.policy.ttl
+        entry.stale_until = entry.expires + entry.policy.stale_while_revalidate
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def coalesced(self):
+        """记录一次等待相同页面生成的请求"""
+        self._coalesced += 1
+
+    def clear(self):
+        """清空缓存"""
+        self.policies.clear()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """缓存状态\n
+        entries: 缓存响应数, max_size: 最多缓存响应数, hits: 命中次数, stale_hits: 使用过期响应次数, 
+        misses: 没有命中次数, coalesced: 等待其他请求生成相同页面的次数, evictions: 超过 max_size 删除次数, 
+        hit_rate: 命中率 (包括过期响应)"""
+        requests = self._hits + self._stale_hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self._hits,
+            "stale_hits": self._stale_hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "evictions": self._evictions,
+            "hit_rate": (self._hits + self._stale_hits) / requests if requests else 0.0,
+        }
+
+
+# 进程内 include 页面输出缓存
+Py_Fragment_Cache = Fragment_Cache()
@@ -1,8 +1,12 @@
-import asyncio, aiofiles
-import os
-from typing import TYPE_CHECKING, Any, Union
+import asyncio
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Optional, Union
 from urllib import parse
 from pyhpweb.constant import Header_Data_Pattern
+from pyhpweb.error import BadRequestError, PayloadTooLargeError, RequestTimeoutError
+from pyhpweb.lazy import Lazy_Data, Lazy_List
+from pyhpweb.multipart import Multipart_Parser
+from pyhpweb.parser import _parse_request_head
 
 
 if TYPE_CHECKING:
@@ -11,55 +15,54 @@ if TYPE_CHECKING:
 
 class Request:
     """客户端请求\n
-    使用 Request.request 获取本次请求体数据"""
+    使用 Request.request 获取本次请求体数据\n
+    request_head 为已经读取的请求行与请求头 (以 \\r\\n\\r\\n 结尾), None 为请求头超过 request_header_max_size\n
+    GET / POST 数据, 上传文件与 Cookie 为延迟解析的 Lazy_Data / Lazy_List, 第一次访问时才解析\n
+    请求体在第一次访问 POST 数据或上传文件时读取, 没有读取的请求体在响应后由 discard_body 丢弃
+
+    body_time 为读取并解析请求体的耗时 (秒), 没有读取时为 None"""
 
     def __init__(
         self,
         reader: asyncio.StreamReader,
         server: "PyHP_Server",
+        request_head: Optional[bytes]
     ) -> None:
         self._server = server
         self._reader = reader
+        self._request_head = request_head
         self._encoding = server._encoding
+        self._loop = asyncio.get_running_loop()
+        self._body_task: Optional[asyncio.Task] = None
+        self.body_time: Optional[float] = None
         self.__request_get_in = False
         self.__data: dict[str, Any] = {
-            "GET": {},
-            "POST": {},
-            "Files": {}
+            "GET": Lazy_Data(self._get_request_get_data),
+            "POST": Lazy_Data(lambda: self._get_body_data()[0], lambda: self._load_body_data(0)),
+            "Files": Lazy_List(lambda: self._get_body_data()[1], lambda: self._load_body_data(1))
         }
         self.__request: dict[str, Any] = {
             "request_data": self.__data,
-            "cookie": {},
+            "cookie": Lazy_Data(self._get_request_cookie),
         }
 
-    async def _get_request_line(self) -> dict[str, Any]:
-        """解析客户端请求行"""
-        data = await self._reader.readline()
-        request_path = data.decode(self._encoding).rstrip("\r\n").split(" ")
+    def _get_request_head(self, request_head: bytes) -> dict[str, Any]:
+        """一次解析请求行与请求头"""
+        mode, url, http_version, request_header = _parse_request_head(
+            request_head, self._encoding, self._server._request_parser == "httptools"
+        )
 
         return {
             "request_path": {
-                "mode": request_path[0],
-                "path": request_path[1].rsplit("?", maxsplit=1)[0],
-                "http_version": request_path[2],
+                "mode": mode,
+                "path": url.rsplit("?", maxsplit=1)[0],
+                "http_version": http_version,
             },
-            "url": request_path[1]
+            "url": url,
+            "request_header": request_header
         }
-
-    async def _get_request_header(self) -> tuple[int, dict[str, Any]]:
-        """解析客户端请求头"""
-        all_data_size = 0
-        request_header: dict[str, Any] = {}
-        while True:
-            data = await self._reader.readline()
-            all_data_size += len(data)
-            if data == b"\r\n" or all_data_size > self._server._request_header_max_size:
-                return all_data_size, request_header
-
-            key, val = data.decode(self._encoding).rstrip("\r\n").split(": ")
-            request_header[key.lower()] = val
     
-    async def _get_request_get_data(self):
+    def _get_request_get_data(self):
         """分解 get 数据"""
         url_data =  self.__request["url"].rsplit("?", maxsplit=1)
 
@@ -67,16 +70,39 @@ class Request:
         if len(url_data) == 2 and url_data[-1]:
             for data_item in url_data[-1].split("&"):
                 item = parse.unquote(data_item).split("=")
+                if len(item) < 2:
+                    raise BadRequestError(f"Bad Request: invalid query {item[0]!r}")
+
                 data[item[0]] = item[1]
 
         return data
 
-    async def _get_form_urlencoded_data(self):
+    async def _read_chunks(self, size: int, keep: bool = True) -> bytes:
+        """按块读取 size 字节, 每次读取超过 request_body_timeout 秒时抛出 asyncio.TimeoutError\n
+        keep 为 False 时丢弃读取的数据"""
+        chunks = []
+        while size > 0:
+            chunk = await asyncio.wait_for(
+                self._reader.readexactly(min(size, 65536)), self._server._request_body_timeout
+            )
+            size -= len(chunk)
+            if keep:
+                chunks.append(chunk)
+
+        return b"".join(chunks)
+
+    async def _get_request_body(self) -> bytes:
+        """按 Content-Length 读取完整请求体, 保持连接时下一个请求才能正确读取"""
+        return await self._read_chunks(int(self.__request["request_header"]["content-length"]))
+
+    async def _get_form_urlencoded_data(self, data: bytes):
         """解析 application/x-www-form-urlencoded 表单请求格式的数据"""
-        data = await self._reader.read(self._server._request_body_max_size)
         request_form_data = data.decode(self._encoding)
 
-        form_data = {}
+        form_data: dict[str, str] = {}
+        if not request_form_data:
+            return form_data
+
         for data_item in request_form_data.replace("+", " ").split("&"):
             item = data_item.split("=")
             form_data[item[0]] = parse.unquote(item[1])
@@ -84,58 +110,112 @@ class Request:
         return form_data
 
     async def _get_form_multipart_data(self):
-        """解析 multipart/form-data 表单请求格式的数据"""
-        data = await self._reader.read(self._server._request_body_max_size)
+        """流式解析 multipart/form-data 表单请求格式的数据, 上传文件按块写入 ./web_upload_file"""
         # multipart/form-data 表单数据分割符
-        boundary = b"--%b\r\n" % Header_Data_Pattern["boundary"].search(
+        boundary = Header_Data_Pattern["boundary"].search(
             self.__request["request_header"]["content-type"]
-        ).group().encode(self._encoding)
-
-        form_data, files = {}, []
-        data_list = data.replace(boundary, b'').split(b'\r\n')
-        for index, data_line in enumerate(data_list):
-            if data_line == boundary or not data_line:
-                continue
-            try:
-                form_data_head = data_line.decode(self._encoding)
-            except UnicodeDecodeError:
-                # 解码了文件数据直接跳过
-                continue
-
-            if "filename" in form_data_head:
-                file_name = Header_Data_Pattern["filename"].search(form_data_head).group()
-                file_data = data_list[index + 2]
-                file_path = f"./web_upload_file/{file_name}"
-
-                if not os.path.isdir("./web_upload_file"):
-                    os.makedirs("./web_upload_file")
-
-                async with aiofiles.open(file_path, "wb") as _file:
-                    await _file.write(file_data)
-                
-                files.append({
-                    "file_name": file_name,
-                    "file_size": len(file_data),
-                    "file_path": file_path
-                })
-            else:
-                name = Header_Data_Pattern["name"].search(form_data_head)
-                if name is None:
-                    continue
-                
-                form_data[name.group()] = data_list[index + 2].decode(self._encoding)
-        
-        return form_data, files
+        ).group().strip('"').encode(self._encoding)
+
+        return await Multipart_Parser(
+            self._reader,
+            boundary,
+            int(self.__request["request_header"]["content-length"]),
+            self._encoding,
+            max_field_size=self._server._request_body_max_size,
+            read_timeout=self._server._request_body_timeout
+        ).parse()
     
     def _get_request_cookie(self):
         """解析请求头 cookie"""
         cookie = {}
+        if "cookie" not in self.__request.get("request_header", {}):
+            return cookie
+
         for cookie_key in self.__request["request_header"]["cookie"].split("; "):
             cookie_key = cookie_key.split("=")
+            if len(cookie_key) < 2:
+                raise BadRequestError(f"Bad Request: invalid cookie {cookie_key[0]!r}")
+
             cookie[cookie_key[0]] = cookie_key[1]
 
         return cookie
 
+    async def _read_body(self) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """读取并解析请求体, 返回 (POST 数据, 上传文件)"""
+        if "content-length" not in self.__request["request_header"]:
+            return {}, []
+
+        start = perf_counter()
+        try:
+            return await self._parse_body()
+        finally:
+            self.body_time = perf_counter() - start
+
+    async def _parse_body(self) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """按 Content-Type 解析请求体"""
+        request_header = self.__request["request_header"]
+
+        content_type = request_header.get("content-type", "")
+        try:
+            if "multipart/form-data" in content_type:
+                return await self._get_form_multipart_data()
+
+            data = await self._get_request_body()
+            if "application/x-www-form-urlencoded" in content_type:
+                return await self._get_form_urlencoded_data(data), []
+        except (PayloadTooLargeError, ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except asyncio.TimeoutError as err:
+            raise RequestTimeoutError("Request Timeout: reading the request body timed out") from err
+        except Exception as err:
+            raise BadRequestError(f"Bad Request: {err}") from err
+
+        return {}, []
+
+    async def load_body(self) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """读取并解析请求体 (只读取一次), 返回 (POST 数据, 上传文件), 在事件循环中调用"""
+        if self._body_task is None:
+            self._body_task = self._loop.create_task(self._read_body())
+
+        return await asyncio.shield(self._body_task)
+
+    def _get_body_data(self) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """在生成页面的线程中读取请求体, 请求体由事件循环读取"""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            if self._body_task is not None and self._body_task.done():
+                return self._body_task.result()
+
+            raise RuntimeError("Request body must be loaded with 'await load_body()' in the event loop")
+
+        return asyncio.run_coroutine_threadsafe(self.load_body(), self._loop).result()
+
+    async def _load_body_data(self, index: int) -> Any:
+        """在事件循环中读取请求体, index 为 0 时返回 POST 数据, 为 1 时返回上传文件"""
+        return (await self.load_body())[index]
+
+    async def _discard(self) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """读取并丢弃请求体"""
+        await self._read_chunks(int(self.__request["request_header"].get("content-length", 0)), False)
+        return {}, []
+
+    async def discard_body(self) -> bool:
+        """丢弃没有读取的请求体, 保持连接时下一个请求才能正确读取\n
+        返回连接是否还可以继续使用 (请求体读取失败时为 False)"""
+        if self._body_task is None:
+            self._body_task = self._loop.create_task(self._discard())
+
+        try:
+            await asyncio.shield(self._body_task)
+        except Exception:
+            return False
+
+        return True
+
     @property
     async def request(self) -> Union[dict[str, Any], tuple[Union[str, int], bytes, dict[str, Any]]]:
         """解析客户端请求\n
@@ -145,22 +225,17 @@ class Request:
             return self.__request
         
         try:
-            self.__request.update(await self._get_request_line())
-            request_header_size, request_header = await self._get_request_header()
-            self.__request["request_header"] = request_header
-
-            if "cookie" in request_header:
-                self.__request["cookie"] = self._get_request_cookie()
-
-            if request_header_size > self._server._request_header_max_size:
+            # 超过大小限制的请求头不解析
+            if self._request_head is None or len(self._request_head) > self._server._request_header_max_size:
                 code, body = await self._server._get_error_response_body(
                     self.__request, 431, "Request Header Fields Too Large"
                 )
                 return code, body, self.__request
 
-            self.__data["GET"] = await self._get_request_get_data()
-            if "content-type" not in request_header:
-                self.__request["request_data"] = self.__data
+            self.__request.update(self._get_request_head(self._request_head))
+            request_header = self.__request["request_header"]
+            if "content-length" not in request_header and "transfer-encoding" not in request_header:
+                self.__request_get_in = True
                 return self.__request
 
             if "content-length" not in request_header:
@@ -169,15 +244,15 @@ class Request:
                 )
                 return code, body, self.__request
 
-            if "application/x-www-form-urlencoded" in request_header["content-type"]:
-                self.__data["POST"] = await self._get_form_urlencoded_data()
-            
-            if "multipart/form-data" in request_header["content-type"]:
-                form_data, files = await self._get_form_multipart_data()
-                self.__data["POST"] = form_data
-                self.__data["Files"] = files
-            
-            self.__request["request_data"] = self.__data
+            # 上传文件不会读入内存, 使用单独的大小限制
+            multipart = "multipart/form-data" in request_header.get("content-type", "")
+            max_size = self._server._request_upload_max_size if multipart else self._server._request_body_max_size
+            if int(request_header["content-length"]) > max_size:
+                code, body = await self._server._get_error_response_body(
+                    self.__request, 413, "Payload Too Large"
+                )
+                return code, body, self.__request
+
             self.__request_get_in = True
         except Exception:
             # 无法解析请求头时 400
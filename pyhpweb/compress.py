@@ -0,0 +1,90 @@
+import gzip
+from typing import Callable, Optional
+
+
+def _gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+# 可以使用的压缩方式, key 为 Content-Encoding, 按优先顺序排列
+Compressors: dict[str, Callable[[bytes], bytes]] = {}
+
+try:
+    import brotli  # type: ignore[import-not-found]
+    Compressors["br"] = lambda data: brotli.compress(data, quality=5)
+except ModuleNotFoundError:
+    pass
+
+try:
+    import zstandard  # type: ignore[import-not-found]
+    Compressors["zstd"] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+except ModuleNotFoundError:
+    pass
+
+Compressors["gzip"] = _gzip_compress
+
+
+# 磁盘上预先压缩的文件后缀
+Precompressed_Suffix: dict[str, str] = {
+    "br": ".br",
+    "zstd": ".zst",
+    "gzip": ".gz",
+}
+
+
+# 除 text/* 以外需要压缩的数据类型
+Compressible_Content_Type = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+def _compressible(content_type: str) -> bool:
+    """该数据类型是否需要压缩"""
+    content_type = content_type.split(";", maxsplit=1)[0].strip().lower()
+    return content_type.startswith("text/") or content_type in Compressible_Content_Type
+
+
+def _select_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """按请求头 Accept-Encoding 选择压缩方式, 客户端不接受任何可以使用的压缩方式时返回 None\n
+    q 值相同时按 Compressors 顺序选择"""
+    if not accept_encoding:
+        return None
+
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+
+        accepted[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in Compressors:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+
+    return best
+
+
+def _compress(data: bytes, coding: str) -> bytes:
+    """使用 coding 压缩数据"""
+    return Compressors[coding](data)
+
+
+def _add_vary(header: dict, field: str = "Accept-Encoding"):
+    """在响应头 Vary 中添加 field"""
+    vary = header.get("Vary")
+    if not vary:
+        header["Vary"] = field
+    elif field.lower() not in (item.strip().lower() for item in vary.split(",")):
+        header["Vary"] = f"{vary}, {field}"
@@ -71,4 +71,31 @@ Content_Type: dict[str, str] = {
     "mp4": "audio/mp4",
     "flv": "audio/mp4",
     "avi": "audio/mp4",
-}
\ No newline at end of file
+}
+
+# 静态文件缓存策略 (响应头 Cache-Control), key 为文件后缀, 没有设置的后缀使用 "default"
+# "no-cache" 允许浏览器缓存, 但每次使用前需要通过 ETag / Last-Modified 验证
+Static_Cache_Control: dict[str, str] = {
+    "default": "no-cache",
+    "css": "public, max-age=3600",
+    "bmp": "public, max-age=86400",
+    "png": "public, max-age=86400",
+    "jpg": "public, max-age=86400",
+    "gif": "public, max-age=86400",
+    "ico": "public, max-age=86400",
+    "mp3": "public, max-age=86400",
+    "mp4": "public, max-age=86400",
+    "flv": "public, max-age=86400",
+    "avi": "public, max-age=86400",
+}
+
+# 延迟解析的请求数据
+Request_Data_Names: frozenset[str] = frozenset(("get", "post", "files", "cookie"))
+
+# 页面使用这些名称时可能间接访问请求数据, 运行前解析所有延迟解析的请求数据
+Request_Data_Indirect_Names: frozenset[str] = frozenset((
+    "request", "request_data", "eval", "exec", "globals", "vars", "locals"
+))
+
+# Prometheus 文本格式指标的响应类型
+Metrics_Content_Type: str = "text/plain; version=0.0.4"
@@ -8,4 +8,69 @@ class IncludeImportError(Exception):
         self.msg = msg
     
     def __str__(self) -> str:
-        return self.msg
\ No newline at end of file
+        return self.msg
+
+class HeadersSentError(Exception):
+    """响应头已经发送 (分块传输已经开始), 无法再修改响应头与 Cookie"""
+
+    def __init__(self, msg="Headers already sent", *args: object) -> None:
+        super().__init__(*args)
+        self.msg = msg
+    
+    def __str__(self) -> str:
+        return self.msg
+
+
+class RangeNotSatisfiableError(Exception):
+    """请求头 Range 超出文件范围"""
+
+    def __init__(self, msg="Range Not Satisfiable", *args: object) -> None:
+        super().__init__(*args)
+        self.msg = msg
+    
+    def __str__(self) -> str:
+        return self.msg
+
+
+class PayloadTooLargeError(Exception):
+    """请求体超过大小限制"""
+
+    def __init__(self, msg="Payload Too Large", *args: object) -> None:
+        super().__init__(*args)
+        self.msg = msg
+    
+    def __str__(self) -> str:
+        return self.msg
+
+
+class BadRequestError(Exception):
+    """请求体格式错误"""
+
+    def __init__(self, msg="Bad Request", *args: object) -> None:
+        super().__init__(*args)
+        self.msg = msg
+    
+    def __str__(self) -> str:
+        return self.msg
+
+
+class ServiceUnavailableError(Exception):
+    """服务端已达到连接数或页面生成数上限"""
+
+    def __init__(self, msg="Service Unavailable", *args: object) -> None:
+        super().__init__(*args)
+        self.msg = msg
+    
+    def __str__(self) -> str:
+        return self.msg
+
+
+class RequestTimeoutError(Exception):
+    """读取请求体超时 (客户端发送过慢)"""
+
+    def __init__(self, msg="Request Timeout", *args: object) -> None:
+        super().__init__(*args)
+        self.msg = msg
+    
+    def __str__(self) -> str:
+        return self.msg
@@ -0,0 +1,378 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from multiprocessing.context import ForkContext
+from multiprocessing.reduction import recv_handle, send_handle
+from threading import Lock
+from typing import Any, Callable, Optional
+from pyhpweb.error import ServiceUnavailableError
+
+
+class Render_Executor:
+    """
+    页面生成线程池
+    ----------------
+    每个任务生成一整个页面, 可以通过 stats 获取排队中的任务数与正在生成页面的线程数
+
+    max_workers:
+        最大线程数, 默认 None 使用 ThreadPoolExecutor 默认值
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="pyhp-render")
+        self._lock = Lock()
+        self._queue_depth = 0
+        self._active_workers = 0
+
+    def _run(self, func: Callable, args: tuple, kwargs: dict[str, Any]):
+        """在线程池中运行任务"""
+        with self._lock:
+            self._queue_depth -= 1
+            self._active_workers += 1
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active_workers -= 1
+
+    def _done(self, future: Future):
+        """任务没有运行就被取消时从排队数中移除"""
+        if future.cancelled():
+            with self._lock:
+                self._queue_depth -= 1
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """提交任务, 返回 concurrent.futures.Future"""
+        with self._lock:
+            self._queue_depth += 1
+
+        future = self._executor.submit(self._run, func, args, kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """在线程池中运行任务并等待结果"""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """线程池状态\n
+        max_workers: 最大线程数, queue_depth: 排队中的任务数, active_workers: 正在运行任务的线程数"""
+        return {
+            "max_workers": self._executor._max_workers,
+            "queue_depth": self._queue_depth,
+            "active_workers": self._active_workers,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        self._executor.shutdown(wait, cancel_futures=True)
+
+
+class Render_Limiter:
+    """
+    页面生成并发限制
+    ----------------
+    同时最多 max_renders 个页面在生成, 其他页面按顺序等待, 
+    等待的页面已经有 max_queue 个时直接抛出 ServiceUnavailableError (响应 503), 不再排队\n
+    只在事件循环所在线程中使用
+
+    max_renders:
+        同时生成的最多页面数
+    max_queue:
+        最多等待的页面数
+    """
+
+    def __init__(self, max_renders: int, max_queue: int = 100) -> None:
+        self.max_renders = max_renders
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._rejected = 0
+
+    async def acquire(self):
+        """等待可以生成页面, 等待队列已满时抛出 ServiceUnavailableError"""
+        if self._active < self.max_renders and not self._waiters:
+            self._active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._rejected += 1
+            raise ServiceUnavailableError("Service Unavailable: too many pages waiting to render")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已经得到位置后被取消, 交给下一个等待的页面
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        """页面生成结束, 位置直接交给等待的页面"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self._active -= 1
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """并发限制状态\n
+        max_renders: 同时生成的最多页面数, active: 正在生成的页面数 (包括超时后还没有结束的页面), 
+        waiting: 等待的页面数, rejected: 等待队列已满拒绝的页面数"""
+        return {
+            "max_renders": self.max_renders,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "rejected": self._rejected,
+        }
+
+
+def _render_process_main(conn: Connection, target: Callable):
+    """页面生成进程, 接收 (args, kwargs) 运行 target 后返回 (是否成功, 结果或错误)"""
+    while True:
+        try:
+            args, kwargs = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        try:
+            result = (True, target(*args, **kwargs))
+        except Exception as err:
+            result = (False, err)
+
+        try:
+            conn.send(result)
+        except Exception as err:
+            # 结果或错误无法序列化
+            conn.send((False, RuntimeError(f"{type(err).__name__}: {err}")))
+        except KeyboardInterrupt:
+            break
+
+
+def _render_fork_server_main(conn: Connection, target: Callable):
+    """fork 页面生成进程的进程\n
+    在服务端还没有客户端连接与线程时启动, 由它 fork 出的页面生成进程不会继承客户端连接"""
+    # 页面生成进程退出时自动回收, 由服务端统一处理 CTRL+C
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            conn.recv()
+        except EOFError:
+            break
+
+        parent_sock, child_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            conn.close()
+            parent_sock.close()
+            _render_process_main(Connection(child_sock.detach()), target)
+            os._exit(0)
+
+        child_sock.close()
+        conn.send(pid)
+        send_handle(conn, parent_sock.fileno(), os.getppid())
+        parent_sock.close()
+
+
+class _Render_Fork_Server:
+    """启动 _render_fork_server_main 进程, 通过它 fork 页面生成进程"""
+
+    def __init__(self, context: ForkContext, target: Callable) -> None:
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_render_fork_server_main, 
+            args=(child_conn, target), 
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._lock = Lock()
+
+    def fork(self) -> tuple[int, Connection]:
+        """fork 页面生成进程, 返回 (进程 pid, 与进程通信的连接)"""
+        with self._lock:
+            self._conn.send(None)
+            pid = self._conn.recv()
+            fd = recv_handle(self._conn)
+
+        return pid, Connection(fd)
+
+    def stop(self):
+        """停止进程"""
+        self._conn.close()
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+
+
+class _Render_Process_Exited(RuntimeError):
+    """页面生成进程意外退出"""
+
+
+class _Render_Process:
+    """页面生成进程"""
+
+    def __init__(self, fork_server: _Render_Fork_Server) -> None:
+        self._fork_server = fork_server
+        self._start()
+
+    def _start(self):
+        """启动进程"""
+        self.pid, self._conn = self._fork_server.fork()
+        self.requests = 0
+
+    def stop(self, kill: bool = False):
+        """停止进程, 关闭连接后进程会自己退出, kill 为 True 时直接结束进程"""
+        self._conn.close()
+        if kill:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def restart(self, kill: bool = False):
+        """重启进程"""
+        self.stop(kill)
+        self._start()
+
+    def render(self, args: tuple, kwargs: dict[str, Any], timeout: Optional[float] = None):
+        """在进程中运行任务并等待结果, 超时时抛出 TimeoutError"""
+        try:
+            self._conn.send((args, kwargs))
+            ready = self._conn.poll(timeout)
+            if ready:
+                ok, result = self._conn.recv()
+        except (EOFError, OSError) as err:
+            raise _Render_Process_Exited("Render process exited unexpectedly") from err
+
+        if not ready:
+            raise TimeoutError(f"Render timed out after {timeout} seconds")
+
+        self.requests += 1
+        if not ok:
+            raise result
+
+        return result
+
+
+class Process_Render_Pool:
+    """
+    页面生成进程池
+    ----------------
+    启动后保持 processes 个进程, 每个进程生成 max_requests 个页面后重启\n
+    生成页面超过 timeout 秒时结束该进程并启动新进程, 页面中的死循环不会占用服务器\n
+    进程使用 fork 启动, target 无需序列化, 参数与返回值需要可以 pickle\n
+    需要在创建监听 socket 与其他线程前调用 start
+
+    target:
+        在进程中运行的函数
+    processes:
+        进程数, 默认 None 使用 CPU 核心数
+    max_requests:
+        每个进程生成多少页面后重启, 0 为不重启
+    timeout:
+        生成页面超时时间 (秒), 默认 None 不超时
+    """
+
+    def __init__(
+        self, 
+        target: Callable, 
+        processes: Optional[int] = None,
+        max_requests: int = 1000,
+        timeout: Optional[float] = None
+    ) -> None:
+        self._context = multiprocessing.get_context("fork")
+        self._target = target
+        self._processes = processes or os.cpu_count() or 1
+        self._max_requests = max_requests
+        self._timeout = timeout
+        self._idle: Optional[asyncio.Queue] = None
+        self._fork_server: Optional[_Render_Fork_Server] = None
+        self._all: list[_Render_Process] = []
+        # 等待进程结果的线程
+        self._waiter = ThreadPoolExecutor(self._processes, thread_name_prefix="pyhp-render-process")
+        self._recycled = 0
+        self._killed = 0
+        # 等待空闲进程的任务数
+        self._queue_depth = 0
+
+    def start(self):
+        """启动所有进程, 需要在事件循环所在线程中调用"""
+        self._idle = asyncio.Queue()
+        self._fork_server = _Render_Fork_Server(self._context, self._target)
+        for _ in range(self._processes):
+            render_process = _Render_Process(self._fork_server)
+            self._all.append(render_process)
+            self._idle.put_nowait(render_process)
+
+    def _render(self, render_process: _Render_Process, args: tuple, kwargs: dict[str, Any]):
+        """在等待线程中运行, 任务完成后按需重启进程"""
+        try:
+            return render_process.render(args, kwargs, self._timeout)
+        except TimeoutError:
+            self._killed += 1
+            render_process.restart(kill=True)
+            raise
+        except _Render_Process_Exited:
+            self._killed += 1
+            render_process.restart(kill=True)
+            raise
+        finally:
+            if self._max_requests and render_process.requests >= self._max_requests:
+                self._recycled += 1
+                render_process.restart()
+
+    async def run(self, *args, **kwargs):
+        """在空闲进程中运行 target 并等待结果"""
+        loop = asyncio.get_running_loop()
+        self._queue_depth += 1
+        try:
+            render_process = await self._idle.get()
+        finally:
+            self._queue_depth -= 1
+
+        future = self._waiter.submit(self._render, render_process, args, kwargs)
+        # 等待线程结束后进程才重新空闲, 等待被取消时不会提前放回
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._idle.put_nowait, render_process)
+        )
+        return await asyncio.wrap_future(future)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """进程池状态\n
+        processes: 进程数, idle_processes: 空闲进程数, queue_depth: 等待空闲进程的任务数, 
+        recycled: 达到 max_requests 重启次数, killed: 超时或意外退出重启次数"""
+        return {
+            "processes": self._processes,
+            "idle_processes": self._idle.qsize() if self._idle is not None else 0,
+            "queue_depth": self._queue_depth,
+            "recycled": self._recycled,
+            "killed": self._killed,
+        }
+
+    def shutdown(self):
+        """停止所有进程"""
+        self._waiter.shutdown(wait=False, cancel_futures=True)
+        for render_process in self._all:
+            render_process.stop(kill=True)
+
+        if self._fork_server is not None:
+            self._fork_server.stop()
@@ -0,0 +1,103 @@
+from threading import Lock
+from typing import Awaitable, Callable, Optional
+
+
+class _Lazy:
+    """
+    延迟解析的数据
+    ----------------
+    第一次访问时调用 loader 解析数据, 之后与普通 dict / list 相同 (多个线程同时访问时只解析一次)\n
+    json.dumps 等直接读取 dict / list 内容的函数不会触发解析, 需要先调用 load\n
+    pickle / copy 时解析后转换为普通 dict / list\n
+    async_loader 存在时可以在事件循环中使用 await aload() 解析 (例如需要读取请求体的 POST 数据)
+    """
+
+    def __init__(self, loader: Callable, async_loader: Optional[Callable[[], Awaitable]] = None) -> None:
+        super().__init__()
+        self._loader = loader
+        self._async_loader = async_loader
+        self._lock = Lock()
+        self.loaded = False
+
+    def load(self):
+        """解析数据, 已经解析时直接返回"""
+        if self.loaded:
+            return self
+
+        with self._lock:
+            if not self.loaded:
+                self._set_data(self._loader())
+                self._loaded()
+
+        return self
+
+    async def aload(self):
+        """在事件循环中解析数据, 没有 async_loader 时与 load 相同"""
+        if self.loaded or self._async_loader is None:
+            return self.load()
+
+        data = await self._async_loader()
+        with self._lock:
+            if not self.loaded:
+                self._set_data(data)
+                self._loaded()
+
+        return self
+
+    def _loaded(self):
+        self._loader = self._async_loader = None
+        self.loaded = True
+
+    def _set_data(self, data):
+        raise NotImplementedError
+
+
+def _lazy_method(base: type, name: str):
+    """访问前先解析数据的方法"""
+    method = getattr(base, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class Lazy_Data(_Lazy, dict):
+    """延迟解析的 dict (GET / POST 数据, Cookie)"""
+
+    def _set_data(self, data: dict):
+        dict.update(self, data)
+
+    def __reduce__(self):
+        return (dict, (dict(self.load()),))
+
+
+class Lazy_List(_Lazy, list):
+    """延迟解析的 list (上传文件)"""
+
+    def _set_data(self, data: list):
+        list.extend(self, data)
+
+    def __reduce__(self):
+        return (list, (list(self.load()),))
+
+
+for _name in (
+    "__getitem__", "__setitem__", "__delitem__", "__contains__", "__iter__", "__reversed__", "__len__",
+    "__repr__", "__eq__", "__ne__", "__or__", "__ror__", "__ior__",
+    "get", "keys", "values", "items", "copy", "pop", "popitem", "setdefault", "update", "clear",
+):
+    setattr(Lazy_Data, _name, _lazy_method(dict, _name))
+
+for _name in (
+    "__getitem__", "__setitem__", "__delitem__", "__contains__", "__iter__", "__reversed__", "__len__",
+    "__repr__", "__eq__", "__ne__", "__lt__", "__le__", "__gt__", "__ge__",
+    "__add__", "__iadd__", "__mul__", "__rmul__", "__imul__",
+    "append", "extend", "insert", "pop", "remove", "index", "count", "sort", "reverse", "clear", "copy",
+):
+    setattr(Lazy_List, _name, _lazy_method(list, _name))
+
+del _name
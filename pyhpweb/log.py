@@ -1,15 +1,74 @@
 import logging
 from logging import handlers
 import os
+import queue
+import threading
+from typing import Optional
+
+
+class _Batch_Flush:
+    """一批日志全部写入后再 flush, 不在每条日志后 flush"""
+
+    batching = False
+
+    def flush(self):
+        if not self.batching:
+            super().flush()
+
+
+class _Stream_Handler(_Batch_Flush, logging.StreamHandler):
+    pass
+
+
+class _Timed_Rotating_File_Handler(_Batch_Flush, handlers.TimedRotatingFileHandler):
+    pass
+
+
+class _Queue_Handler(handlers.QueueHandler):
+    """
+    将日志放入队列, 由后台线程写入
+    ----------------
+    只在进程内传递, 日志在后台线程中格式化 (记录日志的线程不需要格式化日志)\n
+    close 时等待队列中的日志全部写入 (logging.shutdown 会在退出时调用)
+    """
+
+    def __init__(self, server_log: "Server_Log") -> None:
+        super().__init__(server_log.queue)
+        self.server_log = server_log
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def close(self):
+        self.server_log.stop()
+        super().close()
 
 
 class Server_Log:
+    """
+    服务端日志
+    ----------------
+    根日志只添加一个 _Queue_Handler, 记录日志时只放入队列,
+    后台线程从队列中每次最多取出 batch_size 条日志写入终端与文件后再 flush,
+    写入终端与文件不会阻塞事件循环\n
+    fork 出的子进程 (工作进程) 中重新创建队列与后台线程
 
-    def __init__(self, level=logging.DEBUG, 
-            logPath="./logs", 
-            when="d", 
+    level:
+        日志等级
+    logPath:
+        日志文件目录
+    when / interval / backupCount:
+        日志文件轮换方式, 见 TimedRotatingFileHandler
+    batch_size:
+        每次最多写入的日志数量
+    """
+
+    def __init__(self, level=logging.DEBUG,
+            logPath="./logs",
+            when="d",
             interval=1,
-            backupCount=7
+            backupCount=7,
+            batch_size=256
         ):
 
         logger = logging.getLogger()
@@ -18,22 +77,78 @@ class Server_Log:
         if not os.path.isdir(logPath):
             os.makedirs(logPath)
 
-        sh = logging.StreamHandler()
-        rh = handlers.TimedRotatingFileHandler(
-            os.path.join(logPath, "pyhp.log"), 
+        sh = _Stream_Handler()
+        rh = _Timed_Rotating_File_Handler(
+            os.path.join(logPath, "pyhp.log"),
             when,
             interval,
             backupCount
         )
-        
-        logger.addHandler(sh)
-        logger.addHandler(rh)
 
         formatter = logging.Formatter(
             self.setFormat()
         )
         sh.setFormatter(formatter)
         rh.setFormatter(formatter)
-        
+
+        self.handlers = (sh, rh)
+        self.batch_size = batch_size
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start()
+
+        self.queue_handler = _Queue_Handler(self)
+        logger.addHandler(self.queue_handler)
+        if hasattr(os, "register_at_fork"):
+            # 子进程中没有后台线程, 父进程队列中的日志已经由父进程写入
+            os.register_at_fork(after_in_child=self._start_in_child)
+
     def setFormat(self):
-        return "\033[0m[%(asctime)s][%(levelname)s] %(message)s\033[0m"
\ No newline at end of file
+        return "\033[0m[%(asctime)s][%(levelname)s] %(message)s\033[0m"
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._monitor, name="PyHP-Log", daemon=True)
+        self._thread.start()
+
+    def _start_in_child(self):
+        self.queue = queue.SimpleQueue()
+        self.queue_handler.queue = self.queue
+        self._start()
+
+    def _monitor(self):
+        """后台线程: 取出日志批量写入, 收到 None 时退出"""
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = records[-1] is None
+            self._handle(record for record in records if record is not None)
+            if stop:
+                return
+
+    def _handle(self, records):
+        for handler in self.handlers:
+            handler.batching = True
+
+        try:
+            for record in records:
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+        finally:
+            for handler in self.handlers:
+                handler.batching = False
+                handler.flush()
+
+    def stop(self):
+        """等待队列中的日志全部写入后停止后台线程"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,157 @@
+import os
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Collection, Iterable, Optional
+
+
+# 耗时直方图的桶 (单位: 秒)
+Metrics_Buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 请求阶段: 解析请求头, 读取请求体, 读取静态文件, 生成页面, 发送响应, 整个请求
+Request_Phases = ("parse", "body", "file", "render", "write", "total")
+
+# 路径数量超过 max_paths 后的路径名
+Metrics_Other_Path = "other"
+
+
+def _escape_label(val: Any) -> str:
+    """转义 Prometheus 标签值"""
+    return str(val).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, Any]) -> str:
+    return ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+
+
+def _format_value(val: float) -> str:
+    return repr(float(val)) if isinstance(val, float) else str(val)
+
+
+class Histogram:
+    """耗时直方图, buckets 为每个桶的上限 (不包括 +Inf)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = Metrics_Buckets) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, val: float):
+        self.counts[bisect_left(self.buckets, val)] += 1
+        self.sum += val
+        self.count += 1
+
+    def lines(self, name: str, labels: dict[str, Any]) -> Iterable[str]:
+        """Prometheus 文本格式的行 (桶为累计数量)"""
+        label = _format_labels(labels)
+        total = 0
+        for bucket, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield f'{name}_bucket{{{label},le="{bucket}"}} {total}'
+
+        yield f"{name}_sum{{{label}}} {self.sum!r}"
+        yield f"{name}_count{{{label}}} {self.count}"
+
+
+class Server_Metrics:
+    """
+    服务端指标
+    ----------------
+    按路径记录每个请求各阶段 (Request_Phases) 的耗时直方图与 include 页面的生成耗时直方图,
+    按响应码计数, 使用 render 输出 Prometheus 文本格式\n
+    路径数量超过 max_paths 后的路径记录为 "other" (例如大量不同的 404 路径)\n
+    可以在生成页面的线程中记录, 每个进程分别记录
+
+    web_path:
+        网站根目录, include 页面的路径记录为相对网站根目录的路径
+    max_paths:
+        最多分别记录的路径数量 (请求与 include 页面分别计算)
+    buckets:
+        耗时直方图的桶 (单位: 秒)
+    """
+
+    def __init__(
+        self,
+        web_path: str,
+        max_paths: int = 256,
+        buckets: tuple[float, ...] = Metrics_Buckets
+    ) -> None:
+        self.web_path = web_path
+        self.max_paths = max_paths
+        self.buckets = buckets
+        self._requests: dict[tuple[str, str], Histogram] = {}
+        self._request_paths: set[str] = set()
+        self._includes: dict[str, Histogram] = {}
+        self._responses: dict[str, int] = {}
+        self._lock = Lock()
+        if hasattr(os, "register_at_fork"):
+            # fork 时锁可能正被其他线程持有
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = Lock()
+
+    def _get_path(self, path: str, paths: Collection[str]) -> str:
+        if path in paths or len(paths) < self.max_paths:
+            return path
+
+        return Metrics_Other_Path
+
+    def observe_request(self, path: Optional[str], code: Any, timings: dict[str, float]):
+        """记录一个请求, timings 为 {阶段: 耗时 (秒)}, path 为 None 时 (请求没有解析完) 只记录响应码"""
+        with self._lock:
+            code = str(code)
+            self._responses[code] = self._responses.get(code, 0) + 1
+            if path is None:
+                return
+
+            path = self._get_path(path, self._request_paths)
+            self._request_paths.add(path)
+            for phase, seconds in timings.items():
+                histogram = self._requests.get((path, phase))
+                if histogram is None:
+                    histogram = self._requests[(path, phase)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+    def observe_include(self, file_path: str, seconds: float):
+        """记录生成一个 include 页面的耗时"""
+        if file_path.startswith(self.web_path):
+            file_path = file_path[len(self.web_path):]
+
+        with self._lock:
+            path = self._get_path(file_path, self._includes)
+            histogram = self._includes.get(path)
+            if histogram is None:
+                histogram = self._includes[path] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def render(self, gauges: Iterable[tuple[str, str, str, float]] = ()) -> str:
+        """Prometheus 文本格式的指标, gauges 为额外的指标 (名称, 类型, 说明, 值)"""
+        lines = []
+        for name, type_, help_, val in gauges:
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} {type_}", f"{name} {_format_value(val)}"]
+
+        with self._lock:
+            lines += [
+                "# HELP pyhp_responses_total Responses by status code",
+                "# TYPE pyhp_responses_total counter",
+            ]
+            lines += [f'pyhp_responses_total{{code="{code}"}} {count}' for code, count in sorted(self._responses.items())]
+
+            lines += [
+                "# HELP pyhp_request_duration_seconds Request phase latency by path",
+                "# TYPE pyhp_request_duration_seconds histogram",
+            ]
+            for (path, phase), histogram in sorted(self._requests.items()):
+                lines += histogram.lines("pyhp_request_duration_seconds", {"path": path, "phase": phase})
+
+            lines += [
+                "# HELP pyhp_include_duration_seconds Included page render latency by path",
+                "# TYPE pyhp_include_duration_seconds histogram",
+            ]
+            for path, histogram in sorted(self._includes.items()):
+                lines += histogram.lines("pyhp_include_duration_seconds", {"path": path})
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,217 @@
+import asyncio
+import aiofiles
+import os
+from typing import Any, Optional
+from pyhpweb.constant import Header_Data_Pattern
+from pyhpweb.error import PayloadTooLargeError
+
+
+def _get_part_header(data: bytes, encoding: str) -> dict[str, str]:
+    """解析 multipart 每个部分的头, key 为小写"""
+    part_header = {}
+    for line in data.decode(encoding).split("\r\n"):
+        key, sep, val = line.partition(":")
+        if not sep:
+            continue
+
+        part_header[key.strip().lower()] = val.strip()
+
+    return part_header
+
+
+class Multipart_Parser:
+    """
+    multipart/form-data 流式解析
+    ----------------
+    按 Content-Length 每次从 reader 读取 chunk_size 字节, 在缓冲区中查找分割符\n
+    文件部分按块写入 upload_path, 内存中只保留一块数据, 文件中的 \\r\\n 不会被破坏\n
+    读取完整个请求体后才返回, 保持连接时下一个请求可以正确读取
+
+    reader:
+        客户端连接
+    boundary:
+        请求头 Content-Type 中的 boundary
+    content_length:
+        请求体长度
+    encoding:
+        表单编码
+    upload_path:
+        上传文件保存目录
+    max_field_size:
+        普通表单字段最大字节数, 超过时抛出 PayloadTooLargeError
+    chunk_size:
+        每次读取的字节数
+    read_timeout:
+        每次读取的超时时间 (秒), 超时时抛出 asyncio.TimeoutError, 默认 None 不超时
+    """
+
+    # 每个部分的头最大字节数
+    max_part_header_size = 16384
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        boundary: bytes,
+        content_length: int,
+        encoding: str = "utf-8",
+        upload_path: str = "./web_upload_file",
+        max_field_size: int = 20480 * 1024,
+        chunk_size: int = 65536,
+        read_timeout: Optional[float] = None
+    ) -> None:
+        self._reader = reader
+        self._delimiter = b"\r\n--" + boundary
+        self._remaining = content_length
+        self._encoding = encoding
+        self._upload_path = upload_path
+        self._max_field_size = max_field_size
+        self._chunk_size = chunk_size
+        self._read_timeout = read_timeout
+        # 请求体前加上 \r\n, 第一个分割符与之后的分割符格式一致
+        self._buffer = bytearray(b"\r\n")
+        self.form_data: dict[str, str] = {}
+        self.files: list[dict[str, Any]] = []
+
+    async def _read(self) -> bool:
+        """读取一块数据到缓冲区, 请求体已经读取完时返回 False"""
+        if self._remaining <= 0:
+            return False
+
+        data = await asyncio.wait_for(
+            self._reader.read(min(self._chunk_size, self._remaining)), self._read_timeout
+        )
+        if not data:
+            raise asyncio.IncompleteReadError(bytes(self._buffer), self._remaining)
+
+        self._remaining -= len(data)
+        self._buffer += data
+        return True
+
+    async def _find(self, sep: bytes, start: int = 0) -> int:
+        """在缓冲区中查找 sep, 没有时继续读取, 读取完还没有找到时抛出 ValueError"""
+        while True:
+            index = self._buffer.find(sep, start)
+            if index >= 0:
+                return index
+
+            if not await self._read():
+                raise ValueError("Malformed multipart/form-data body")
+
+    async def _skip_preamble(self):
+        """跳过第一个分割符前的数据"""
+        while True:
+            index = self._buffer.find(self._delimiter)
+            if index >= 0:
+                del self._buffer[:index + len(self._delimiter)]
+                return
+
+            # 保留可能是分割符开头的数据
+            del self._buffer[:max(len(self._buffer) - len(self._delimiter) + 1, 0)]
+            if not await self._read():
+                raise ValueError("Malformed multipart/form-data body")
+
+    async def _read_part_header(self) -> Optional[dict[str, str]]:
+        """读取分割符后的部分头, 遇到结束分割符时返回 None"""
+        while len(self._buffer) < 2:
+            if not await self._read():
+                raise ValueError("Malformed multipart/form-data body")
+
+        if self._buffer[:2] == b"--":
+            return None
+
+        # 分割符后可以有空白
+        index = await self._find(b"\r\n")
+        del self._buffer[:index + 2]
+
+        index = self._buffer.find(b"\r\n\r\n")
+        while index < 0:
+            if len(self._buffer) > self.max_part_header_size:
+                raise PayloadTooLargeError("Multipart part header too large")
+
+            if not await self._read():
+                raise ValueError("Malformed multipart/form-data body")
+            index = self._buffer.find(b"\r\n\r\n")
+
+        part_header = _get_part_header(bytes(self._buffer[:index]), self._encoding)
+        del self._buffer[:index + 4]
+        return part_header
+
+    async def _read_part_body(self, write):
+        """读取部分内容直到下一个分割符, 每块数据调用 await write(data)"""
+        while True:
+            index = self._buffer.find(self._delimiter)
+            if index >= 0:
+                if index:
+                    await write(bytes(self._buffer[:index]))
+                del self._buffer[:index + len(self._delimiter)]
+                return
+
+            # 缓冲区末尾可能是分割符的开头, 保留到下次读取
+            safe_size = len(self._buffer) - len(self._delimiter) + 1
+            if safe_size > 0:
+                await write(bytes(self._buffer[:safe_size]))
+                del self._buffer[:safe_size]
+
+            if not await self._read():
+                raise ValueError("Malformed multipart/form-data body")
+
+    async def _read_file(self, file_name: str, part_header: dict[str, str]):
+        """将文件部分按块写入 upload_path"""
+        if not os.path.isdir(self._upload_path):
+            os.makedirs(self._upload_path, exist_ok=True)
+
+        # 只使用文件名, 不允许写入上传目录以外的位置
+        file_path = os.path.join(self._upload_path, os.path.basename(file_name.replace("\\", "/")))
+        file_size = 0
+        async with aiofiles.open(file_path, "wb") as _file:
+            async def write(data: bytes):
+                nonlocal file_size
+                file_size += len(data)
+                await _file.write(data)
+
+            await self._read_part_body(write)
+
+        self.files.append({
+            "file_name": file_name,
+            "file_size": file_size,
+            "file_path": file_path,
+            "content_type": part_header.get("content-type", "application/octet-stream"),
+            "headers": part_header
+        })
+
+    async def _read_field(self, name: Optional[str]):
+        """读取普通表单字段"""
+        value = bytearray()
+
+        async def write(data: bytes):
+            value.extend(data)
+            if len(value) > self._max_field_size:
+                raise PayloadTooLargeError("Multipart form field too large")
+
+        await self._read_part_body(write)
+        if name is not None:
+            self.form_data[name] = value.decode(self._encoding)
+
+    async def parse(self) -> tuple[dict[str, str], list[dict[str, Any]]]:
+        """解析请求体, 返回 (表单数据, 上传文件列表)"""
+        await self._skip_preamble()
+        while True:
+            part_header = await self._read_part_header()
+            if part_header is None:
+                break
+
+            disposition = part_header.get("content-disposition", "")
+            file_name = Header_Data_Pattern["filename"].search(disposition)
+            if file_name is not None and file_name.group():
+                await self._read_file(file_name.group(), part_header)
+                continue
+
+            name = Header_Data_Pattern["name"].search(disposition)
+            await self._read_field(None if file_name is not None or name is None else name.group())
+
+        # 丢弃结束分割符后的数据
+        self._buffer.clear()
+        while await self._read():
+            self._buffer.clear()
+
+        return self.form_data, self.files
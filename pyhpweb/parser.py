@@ -0,0 +1,95 @@
+try:
+    import httptools
+except ModuleNotFoundError:
+    httptools = None  # type: ignore[assignment]
+
+
+# 请求行与请求头结束
+Request_Head_End = b"\r\n\r\n"
+
+
+def _set_header(request_header: dict[str, str], key: str, val: str):
+    """设置请求头, 重复的请求头使用 ", " 合并 (Cookie 使用 "; ")"""
+    if key in request_header:
+        val = f"{request_header[key]}{'; ' if key == 'cookie' else ', '}{val}"
+
+    request_header[key] = val
+
+
+def _parse_request_head_python(data: bytes, encoding: str) -> tuple[str, str, str, dict[str, str]]:
+    """只解码一次, 在 str 上一次解析请求行与所有请求头"""
+    lines = data.decode(encoding).split("\r\n")
+    mode, url, http_version = lines[0].split(" ")
+    if not http_version.startswith("HTTP/"):
+        raise ValueError(f"Invalid request line {lines[0]!r}")
+
+    request_header: dict[str, str] = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+
+        key, sep, val = line.partition(":")
+        if not sep or not key or key[-1] in " \t":
+            raise ValueError(f"Invalid header line {line!r}")
+
+        _set_header(request_header, key.lower(), val.strip())
+
+    return mode, url, http_version, request_header
+
+
+class _Request_Head_Protocol:
+    """httptools 解析回调"""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        self.url = b""
+        self.request_header: dict[str, str] = {}
+        self.complete = False
+
+    def on_url(self, url: bytes):
+        self.url += url
+
+    def on_header(self, name: bytes, value: bytes):
+        _set_header(self.request_header, name.decode(self.encoding).lower(), value.decode(self.encoding).strip())
+
+    def on_headers_complete(self):
+        self.complete = True
+
+
+def _parse_request_head_httptools(data: bytes, encoding: str) -> tuple[str, str, str, dict[str, str]]:
+    """使用 httptools 解析请求行与请求头"""
+    protocol = _Request_Head_Protocol(encoding)
+    parser = httptools.HttpRequestParser(protocol)
+    try:
+        parser.feed_data(data)
+    except httptools.HttpParserUpgrade:
+        # Upgrade 请求只需要请求头
+        pass
+    except httptools.HttpParserError as err:
+        raise ValueError(str(err)) from err
+
+    if not protocol.complete:
+        raise ValueError("Incomplete request head")
+
+    return (
+        parser.get_method().decode(encoding),
+        protocol.url.decode(encoding),
+        f"HTTP/{parser.get_http_version()}",
+        protocol.request_header
+    )
+
+
+def _parse_request_head(
+    data: bytes,
+    encoding: str = "utf-8",
+    use_httptools: bool = False
+) -> tuple[str, str, str, dict[str, str]]:
+    """
+    解析请求行与请求头 (以 \\r\\n\\r\\n 结尾的 bytes), 返回 (请求模式, URL, HTTP 版本, 请求头)\n
+    请求头 key 为小写, 格式错误时抛出 ValueError\n
+    use_httptools 为 True 且安装了 httptools 时使用 httptools 解析 (更严格的格式检查)
+    """
+    if use_httptools and httptools is not None:
+        return _parse_request_head_httptools(data, encoding)
+
+    return _parse_request_head_python(data, encoding)
@@ -0,0 +1,164 @@
+import cProfile
+import logging
+import os
+import re
+from contextlib import contextmanager
+from itertools import count
+from random import random
+from threading import Lock
+from time import perf_counter, strftime
+from typing import Iterator, Optional
+
+from pyhpweb.template import Py_Template
+
+
+class Block_Timer:
+    """
+    记录一个页面每个代码块的耗时
+    ----------------
+    提供给 Py_Template.profiled_code 的 __pyhp_block_start__ / __pyhp_block_end__,
+    代码块的耗时包括其中 include 页面的耗时
+    """
+
+    __slots__ = ("profile", "template", "_starts")
+
+    def __init__(self, profile: "Render_Profile", template: Py_Template) -> None:
+        self.profile = profile
+        self.template = template
+        self._starts: list[float] = []
+
+    def start(self, block_index: int):
+        self._starts.append(perf_counter())
+
+    def end(self, block_index: int):
+        self.profile.blocks.append((
+            self.template.path, block_index, self.template.block_lines[block_index],
+            perf_counter() - self._starts.pop()
+        ))
+
+
+class Render_Profile:
+    """
+    一次页面生成的分析结果
+    ----------------
+    blocks 为页面与被包含页面每个代码块的 (页面路径, 代码块序号, 起始行, 耗时), 按代码块结束顺序
+    """
+
+    __slots__ = ("html_path", "url", "reason", "blocks")
+
+    def __init__(self, html_path: str, url: str, reason: str) -> None:
+        self.html_path = html_path
+        self.url = url
+        self.reason = reason
+        self.blocks: list[tuple[str, int, int, float]] = []
+
+    def timer(self, template: Py_Template) -> Block_Timer:
+        """页面 (或被包含页面) 使用的 Block_Timer"""
+        return Block_Timer(self, template)
+
+    def summary(self, elapsed: float) -> str:
+        """每个代码块耗时的文本, 按耗时从大到小"""
+        lines = [
+            f"url: {self.url}",
+            f"page: {self.html_path}",
+            f"reason: {self.reason}",
+            f"elapsed: {elapsed * 1000:.3f} ms",
+            "",
+            f"{'ms':>12}  block",
+        ]
+        for path, index, lineno, seconds in sorted(self.blocks, key=lambda block: block[3], reverse=True):
+            lines.append(f"{seconds * 1000:>12.3f}  {path}:{lineno} (block {index})")
+
+        return "\n".join(lines) + "\n"
+
+
+class Render_Profiler:
+    """
+    页面生成分析
+    ----------------
+    按 sample_rate 随机选择页面生成, 在 cProfile 下生成并记录每个代码块的耗时,
+    在 path 目录中写入 .pstats 文件 (使用 pstats / snakeviz 等查看) 与每个代码块耗时的 .txt 文件\n
+    没有被选择的页面只记录生成时间, 超过 slow_threshold 秒时记录警告日志, 该页面的下一次生成会被分析\n
+    cProfile 同时只分析一个页面 (其他同时被选择的页面只记录代码块耗时),
+    使用了 await 的页面在事件循环中运行, 只记录代码块耗时
+
+    path:
+        分析结果目录
+    sample_rate:
+        被分析的页面生成比例 (0 - 1)
+    slow_threshold:
+        生成时间超过该值 (秒) 的页面下一次生成时被分析, None 为不检查
+    """
+
+    def __init__(self, path: str, sample_rate: float = 0, slow_threshold: Optional[float] = None) -> None:
+        self.path = os.path.abspath(path)
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self._slow_pages: set[str] = set()
+        self._cprofile_lock = Lock()
+        self._count = count(1)
+        os.makedirs(self.path, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            # fork 时锁可能正被其他线程持有
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._cprofile_lock = Lock()
+
+    def _get_reason(self, html_path: str) -> Optional[str]:
+        """页面本次生成是否需要分析, 返回原因"""
+        if html_path in self._slow_pages:
+            self._slow_pages.discard(html_path)
+            return "slow"
+
+        if self.sample_rate > 0 and (self.sample_rate >= 1 or random() < self.sample_rate):
+            return "sample"
+
+        return None
+
+    @contextmanager
+    def render(self, html_path: str, url: str, use_cprofile: bool = True) -> Iterator[Optional[Render_Profile]]:
+        """在 with 中生成页面, 需要分析时得到 Render_Profile (传给 Py_Html), 否则为 None\n
+        use_cprofile 为 False 时只记录代码块耗时"""
+        reason = self._get_reason(html_path)
+        start = perf_counter()
+        if reason is None:
+            yield None
+            self._check_slow(html_path, url, perf_counter() - start)
+            return
+
+        profile = Render_Profile(html_path, url, reason)
+        cprofile = None
+        if use_cprofile and self._cprofile_lock.acquire(blocking=False):
+            cprofile = cProfile.Profile()
+
+        try:
+            if cprofile is not None:
+                cprofile.enable()
+            yield profile
+        finally:
+            if cprofile is not None:
+                cprofile.disable()
+                self._cprofile_lock.release()
+
+            self._dump(profile, cprofile, perf_counter() - start)
+
+    def _check_slow(self, html_path: str, url: str, elapsed: float):
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            self._slow_pages.add(html_path)
+            logging.warning("slow render %s %.2fms, profiling the next render", url, elapsed * 1000)
+
+    def _dump(self, profile: Render_Profile, cprofile: Optional[cProfile.Profile], elapsed: float):
+        """写入 .pstats 与代码块耗时文件"""
+        name = re.sub(r"[^\w.-]+", "_", profile.url.split("?", 1)[0]).strip("_") or "index"
+        file_name = os.path.join(
+            self.path, f"{strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._count)}-{name}"
+        )
+        try:
+            if cprofile is not None:
+                cprofile.dump_stats(f"{file_name}.pstats")
+
+            with open(f"{file_name}.txt", "w", encoding="utf-8") as _file:
+                _file.write(profile.summary(elapsed))
+        except OSError:
+            logging.exception(f"write profile {file_name} failed")
@@ -1,17 +1,40 @@
 import asyncio
 import platform
-import aiofiles
 import logging
 import os
+import signal
+import socket
+import stat
 import sys
-from time import time
-from typing import Any, Optional, Union
-from threading import Thread
+from concurrent.futures import Future
+from contextlib import nullcontext
+from functools import partial
+from random import random
+from time import monotonic, perf_counter, time
+from types import CodeType
+from typing import Any, Callable, Iterable, Optional, Union
+from pyhpweb.cache import Fragment_Cache_Entry, Page_Cache, Page_Cache_Entry, Page_Cache_Policy, Py_Fragment_Cache, _copy_shareable, _shareable
 from pyhpweb.client import Request
 from pyhpweb.constant import *
-from pyhpweb.error import IncludeImportError
+from pyhpweb.error import (
+    BadRequestError, HeadersSentError, IncludeImportError, PayloadTooLargeError, RangeNotSatisfiableError, 
+    RequestTimeoutError, ServiceUnavailableError
+)
+from pyhpweb.executor import Process_Render_Pool, Render_Executor, Render_Limiter
+from pyhpweb.lazy import _Lazy
 from pyhpweb.log import Server_Log
-from pyhpweb.tools import full_date, _traceback_to_html, _get_response_header, _get_include_path
+from pyhpweb.metrics import Server_Metrics
+from pyhpweb.parser import Request_Head_End, httptools
+from pyhpweb.profiler import Render_Profile, Render_Profiler
+from pyhpweb.scope import Include_Scope
+from pyhpweb.compress import _add_vary, _compress, _compressible, _select_encoding
+from pyhpweb.static import ETag_Cache, Static_Cache_Entry, Static_File, Static_File_Cache, _file_etag, _parse_range, _read_static_body
+from pyhpweb.stream import Response_Stream
+from pyhpweb.template import Bytecode_Cache, Py_Template, Py_Template_Cache, _format_py_code_block
+from pyhpweb.tools import (
+    full_date, _traceback_to_html, _get_response_header, _get_include_path, _set_connection_header, _not_modified, 
+    _add_response_header, _walk_web_files
+)
 
 
 class Py_Html:
@@ -21,7 +44,7 @@ class Py_Html:
     初始化时将动态生成页面
 
     html_data:
-        HTML 数据 (str)
+        HTML 数据 (str) 或已解析的页面 (Py_Template)
     html_path:
         HTML 文件路径 (用于处理代码块中的相对路径)
     encoding: 
@@ -30,20 +53,35 @@ class Py_Html:
         响应行
     vals:
         可在 HTML 中 Pythom 代码块使用的数据, 为一个字典\n
-        key 为在代码块时的变量名, val 为变量数据
+        key 为在代码块时的变量名, val 为变量数据\n
+        被包含页面的 vals 为 {"__builtins__": Include_Scope}, 没有的变量从包含它的页面的全局变量读取
     include_run_py_vals:
         包含该 PyHP HTML 对象的页面的已经运行代码块的变量\n
         存在时在该页面可以获取包含该 PyHP HTML 对象的页面的变量
+    stream:
+        分块传输响应, 存在时第一个代码块运行完后, 代码块之间的静态 HTML 与已输出的数据会立即发送给客户端
+        (第一个代码块中可以设置响应头与 Cookie)\n
+        第一次发送后不能再修改响应头, 响应行与 Cookie
+    executor:
+        include_parallel 生成被包含页面使用的线程池, None 时按顺序生成
+    metrics:
+        记录被包含页面生成耗时的 Server_Metrics, None 时不记录
+    profile:
+        记录每个代码块耗时的 Render_Profile (被包含页面记录到同一个 Render_Profile), None 时不记录
     """
 
     def __init__(
         self, 
-        html_data: str, 
+        html_data: Union[str, Py_Template], 
         html_path: str, 
         encoding: str = "utf-8",
-        response: dict[str, Union[str, int]] = None,
+        response: Optional[dict[str, Union[str, int]]] = None,
         vals: dict[str, Any] = {},
         include_run_py_vals: dict[str, Any] = {},
+        stream: Optional[Response_Stream] = None,
+        executor: Optional[Render_Executor] = None,
+        metrics: Optional[Server_Metrics] = None,
+        profile: Optional[Render_Profile] = None,
     ) -> None:
         self.__response: dict[str, Union[str, int]] = {
             "http_version": "1.1",
@@ -54,9 +92,13 @@ class Py_Html:
         if not response is None:
             self.__response.update(response)
 
+        if isinstance(html_data, str):
+            html_data = Py_Template(html_data, html_path)
+
         self.__ehco_list: list[str] = []
         self.__html_path = html_path
-        self.__html = html_data
+        self.__template = html_data
+        self.__html = ""
         self.__encoding = encoding
         self.__header: dict[str, Any] = Http_Response_Header.copy()
         self._vals: dict[str, Any] = vals
@@ -64,71 +106,143 @@ class Py_Html:
         # 存储所有已经运行代码块的变量
         self._run_py_vals: dict[str, Any] = {}
         self._set_cookies = ""
+        self.__stream = stream
+        # 第一个代码块前的静态 HTML 不立即发送, 第一个代码块运行完后才发送响应头
+        self.__stream_ready = not self.__template.leading_html
+        self.__executor = executor
+        self.__metrics = metrics
+        self.__profile = profile
+        self.__last_modified: Optional[float] = None
+        # 页面是否输出了错误 (输出错误的页面不缓存)
+        self._has_error = False
+        self.__cache_policy: Optional[Page_Cache_Policy] = None
         
-        self._run_py_code_block(self._vals)
+        if self.__template.is_async:
+            # 使用了 await 的页面由 _run_py_code_block_async 在事件循环中运行
+            self._set_py_vals(self._vals)
+        else:
+            self._run_py_code_block(self._vals)
 
     @staticmethod
     def _get_py_code_block(html_code: str):
         """获取文件中的代码块"""
         return Py_Code_Pattern.finditer(html_code)
     
-    @staticmethod
-    def _format_py_code_block(py_code_block: str):
-        """格式化代码块为 exec 可运行代码"""
-        py_code_lines = py_code_block.replace("<?py ", "", 1).replace("<?py", "", 1) \
-            .rstrip("?>").strip("\n").splitlines(True)
-
-        remove_indent = ""
-        for str_ in py_code_lines[0]:
-            if str_ != " ":
-                break
-            remove_indent = f"{remove_indent}{str_}"
-
-        return "".join(
-            py_code.replace(remove_indent, "", 1) for py_code in py_code_lines
-        )
+    _format_py_code_block = staticmethod(_format_py_code_block)
 
-    def _run_py_code_block(self, vals: dict[str, Any] = {}):
-        """运行文件中的代码块"""
-        py_code_block_list = self._get_py_code_block(self.__html)
+    def _set_py_vals(self, vals: dict[str, Any] = {}):
+        """设置代码块可以使用的内置方法与变量"""
         # 设置内置方法
         self._vals["html"] = self
         self._vals["print"] = self.print
         self._vals["set_cookies"] = self.set_cookies
         self._vals["include"] = self.include
+        self._vals["include_parallel"] = self.include_parallel
+        self._vals["include_async"] = self.include_async
+        self._vals["__pyhp_run_sync__"] = self._run_sync
         self._vals["__name__"] = __name__
         self._vals.update(vals)
 
-        for py_code_block in py_code_block_list:
-            def run_py_code(py_code_block):
-                try:
-                    exec(
-                        self._format_py_code_block(py_code_block.group()), 
-                        self._vals, 
-                        self._run_py_vals
-                    )
-                except Exception:
-                    self.print(PyHP_Server._get_error_body(
-                            sys.exc_info(), 
-                            "PyHtml", 
-                            "Error"
-                        )
-                    )
+        # 页面代码使用的输出与错误处理
+        self._vals["__pyhp_echo__"] = self.__ehco_list.append if self.__stream is None else self._echo_flush
+        self._vals["__pyhp_error__"] = self._print_error
+
+    def _run_py_code_block(self, vals: dict[str, Any] = {}):
+        """运行文件中的代码块"""
+        self._set_py_vals(vals)
+        self._load_request_data()
+
+        exec(self._get_code(), self._vals, self._run_py_vals)
+
+        self.__html = "".join(self.__ehco_list)
+        self.__ehco_list = []
+
+    async def _run_py_code_block_async(self):
+        """在事件循环中运行使用了 await 的页面, 等待 io 时不占用线程\n
+        页面中没有 await 的阻塞代码会阻塞事件循环"""
+        for val in self._get_request_data():
+            await val.aload()
+
+        await eval(self._get_code(), self._vals, self._run_py_vals)
+
+        self.__html = "".join(self.__ehco_list)
+        self.__ehco_list = []
 
-            thread = Thread(target=run_py_code, args=(py_code_block, ))
-            thread.setDaemon(True)
-            thread.start()
-            thread.join()
+    def _get_code(self) -> CodeType:
+        """运行的代码对象, 分析页面时使用记录每个代码块耗时的 profiled_code"""
+        if self.__profile is None:
+            return self.__template.code
+
+        timer = self.__profile.timer(self.__template)
+        self._vals["__pyhp_block_start__"] = timer.start
+        self._vals["__pyhp_block_end__"] = timer.end
+        return self.__template.profiled_code
+
+    def _get_val(self, name: str, default: Any = None) -> Any:
+        """获取代码块可以使用的变量, 被包含页面同时查找包含它的页面的变量"""
+        if name in self._vals:
+            return self._vals[name]
+
+        scope = self._vals.get("__builtins__")
+        if isinstance(scope, Include_Scope):
+            return scope.lookup(name, default)
+
+        return default
+
+    def _get_request_data(self) -> list[_Lazy]:
+        """页面使用的延迟解析请求数据, 页面可能通过 request / eval 等间接访问时为所有请求数据"""
+        names = self.__template.names
+        if names.isdisjoint(Request_Data_Indirect_Names):
+            names = Request_Data_Names & names
+        else:
+            names = Request_Data_Names
 
-            self.__html = Py_Code_Pattern.sub(
-                "".join(self.__ehco_list), 
-                self.__html, 
-                count=1
+        return [val for val in map(self._get_val, names) if isinstance(val, _Lazy)]
+
+    def _load_request_data(self):
+        """提前解析页面使用的延迟解析请求数据\n
+        json.dumps 等直接读取 dict 内容的函数不会触发解析, 页面使用到的 get / post / files / cookie 在运行前解析,
+        解析失败时抛出 PayloadTooLargeError / BadRequestError"""
+        for val in self._get_request_data():
+            val.load()
+
+    def _echo_flush(self, html_data: str):
+        """分块传输时输出静态 HTML, 并发送下一个代码块运行前已有的输出\n
+        第一个代码块前的静态 HTML 等第一个代码块运行完后与其输出一起发送"""
+        self.__ehco_list.append(html_data)
+        if not self.__stream_ready:
+            self.__stream_ready = True
+            return
+
+        self.flush()
+
+    def flush(self):
+        """分块传输时立即发送已输出的数据, 第一次发送时发送响应头"""
+        if self.__stream is None or not self.__ehco_list:
+            return
+
+        if not self.__stream.started:
+            self.__stream.start(self.get_stream_header())
+
+        self.__stream.write("".join(self.__ehco_list).encode(self.__encoding))
+        self.__ehco_list.clear()
+
+    def _check_headers_sent(self):
+        if self.__stream is not None and self.__stream.started:
+            raise HeadersSentError()
+
+    def _print_error(self):
+        """输出当前代码块的错误"""
+        self._has_error = True
+        self.print(PyHP_Server._get_error_body(
+                sys.exc_info(), 
+                "PyHtml", 
+                "Error"
             )
-            self.__ehco_list = []
+        )
     
     def print(self, *args):
-        """保存数据, 在代码块运行完成后替换为保存数据"""
+        """向页面输出数据, 输出在代码块所在位置"""
         self.__ehco_list.append("\n".join(str(arg) for arg in args))
 
     def set_cookies(
@@ -142,6 +256,7 @@ class Py_Html:
         if not cookies:
             return
 
+        self._check_headers_sent()
         expires = ""
         if not max_age is None:
             if max_age > 0:
@@ -153,29 +268,258 @@ class Py_Html:
         
         for key, val in cookies.items():
             self._set_cookies += cookie_.format(key=key, val=val)
-        
-        self._set_cookies.rstrip("\n")
     
-    def include(self, pyhtm_path: str, update_header: bool = False):
-        """包含页面"""
+    def _set_revalidate(self):
+        """设置验证器后允许浏览器缓存页面 (每次使用前验证)"""
+        if self.__header.get("Cache-Control") == "no-store":
+            self.__header["Cache-Control"] = "no-cache"
+
+    def set_etag(self, etag: str, weak: bool = False):
+        """设置页面 ETag, 请求头 If-None-Match 一致时响应 304 Not Modified (不发送页面)"""
+        self._check_headers_sent()
+        if not etag.startswith(('"', 'W/"')):
+            etag = f'"{etag}"'
+
+        if weak and not etag.startswith("W/"):
+            etag = f"W/{etag}"
+
+        self.__header["ETag"] = etag
+        self._set_revalidate()
+
+    def set_last_modified(self, time_: float):
+        """设置页面修改时间 (时间戳), 请求头 If-Modified-Since 不早于修改时间时响应 304 Not Modified"""
+        self._check_headers_sent()
+        self.__last_modified = float(time_)
+        self.__header["Last-Modified"] = full_date(self.__last_modified)
+        self._set_revalidate()
+
+    def cache(
+        self, 
+        ttl: float, 
+        vary_get: Optional[list[str]] = None, 
+        vary_cookie: Optional[list[str]] = None, 
+        stale_while_revalidate: float = 0
+    ):
+        """声明页面响应可以缓存 ttl 秒, 缓存时间内服务端直接使用缓存的响应, 不再生成页面 (查看 Page_Cache)\n
+        vary_get / vary_cookie 为影响页面内容的 GET 参数名与 Cookie 名, 不同的值分别缓存\n
+        超过 ttl 后 stale_while_revalidate 秒内仍然使用旧响应, 同时在后台重新生成页面\n
+        只缓存没有请求体的 GET / HEAD 请求的 200 响应, 设置了 Cookie 或输出了错误的响应不缓存"""
+        self.__cache_policy = Page_Cache_Policy(
+            ttl, stale_while_revalidate, tuple(vary_get or ()), tuple(vary_cookie or ())
+        )
+
+    def get_cache_entry(
+        self, version: Optional[tuple[int, int]], response: Optional[bytes]
+    ) -> Optional[Page_Cache_Entry]:
+        """页面声明了缓存时返回缓存的响应, 响应不能缓存时 Page_Cache_Entry.response 为 None\n
+        没有文件版本 (不是从文件读取) 的页面不缓存"""
+        if self.__cache_policy is None or version is None:
+            return None
+
+        if (response is None or str(self.__response["code"]) != "200" 
+                or self._set_cookies or self._has_error):
+            return Page_Cache_Entry(self.__cache_policy, version)
+
+        return Page_Cache_Entry(
+            self.__cache_policy, 
+            version, 
+            response, 
+            b"Date: %b" % self.__header["Date"].encode(self.__encoding),
+            self.__header.copy(),
+            self.__header.get("ETag"),
+            self.__last_modified
+        )
+
+    def not_modified(self, request_header: dict[str, str]) -> bool:
+        """按页面设置的 ETag / 修改时间判断是否可以响应 304 Not Modified"""
+        if str(self.__response["code"]) != "200":
+            return False
+
+        return _not_modified(request_header, self.__header.get("ETag"), self.__last_modified)
+
+    def include(
+        self, 
+        pyhtm_path: str, 
+        update_header: bool = False, 
+        cache: Optional[float] = None, 
+        vary: Optional[list[Any]] = None
+    ):
+        """包含页面\n
+        cache 为缓存时间 (秒), 设置时缓存被包含页面的输出, 设置的 Cookie, 写入的变量与响应头 (查看 Fragment_Cache),
+        缓存时间内直接使用缓存不再运行被包含页面, 被包含页面输出错误时不缓存\n
+        被包含页面写入的变量只能是基本类型, 模块与由它们组成的 list / tuple / set / dict, 
+        写入了函数, 类或其他对象 (可能引用本次请求的 cookie, get 等) 时不缓存, 每次都运行被包含页面\n
+        vary 为影响被包含页面输出的值的列表 (例如 [get.get("id"), cookie.get("lang")]), 不同的值分别缓存"""
         try:
-            # 处理页面
-            include_file_path = _get_include_path(self.__html_path, pyhtm_path)
-            with open(include_file_path, "r", encoding=self.__encoding) as _file:
-                py_html = Py_Html(
-                    _file.read(), include_file_path, self.__encoding, self.__response.copy(), self._vals.copy(), self._run_py_vals.copy()
-                )
+            entry, has_error = self._render_include(pyhtm_path, cache, vary)
+            self._include_update(entry, has_error, update_header)
+        except Exception as err:
+            raise IncludeImportError(str(err))
 
-            # 更新包含它的页面数据
-            if update_header:
-                self.__response.update(py_html.response)
-                self.__header.update(py_html.header)
-            self._run_py_vals.update(py_html._run_py_vals)
-            self._set_cookies = f"{self._set_cookies}\n{py_html._set_cookies}" if self._set_cookies else py_html._set_cookies
-            self.print(f"{py_html.get_html()}\n")
+    async def include_async(
+        self, 
+        pyhtm_path: str, 
+        update_header: bool = False, 
+        cache: Optional[float] = None, 
+        vary: Optional[list[Any]] = None
+    ):
+        """在使用了 await 的页面中包含页面 (await include_async(...)), 参数与 include 相同\n
+        被包含页面使用了 await 时在事件循环中等待被包含页面, 否则在生成页面的线程池中生成, 不阻塞事件循环\n
+        使用了 await 的页面中顶层的 include(...) 会作为 await include_async(...) 运行"""
+        try:
+            template, key, entry = self._get_include_cache(pyhtm_path, cache, vary)
+            has_error = False
+            if entry is None and not template.is_async:
+                entry, has_error = await self._run_sync(self._render_include, pyhtm_path, cache, vary)
+            elif entry is None:
+                start = perf_counter()
+                py_html = self._new_include(template)
+                await py_html._run_py_code_block_async()
+                entry, has_error = self._get_include_entry(template, key, cache, py_html)
+                self._observe_include(template, start)
+
+            self._include_update(entry, has_error, update_header)
         except Exception as err:
             raise IncludeImportError(str(err))
 
+    async def _run_sync(self, func: Callable, *args, **kwargs) -> Any:
+        """在生成页面的线程池中运行 func (没有线程池时使用事件循环默认线程池), 在事件循环中等待结果"""
+        if self.__executor is None:
+            return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+        return await asyncio.wrap_future(self.__executor.submit(func, *args, **kwargs))
+
+    def include_parallel(self, *pyhtm_paths: Union[str, dict[str, Any]], update_header: bool = False):
+        """同时生成多个互相独立的被包含页面, 按参数顺序写入页面, 结果与按顺序 include 相同\n
+        参数为页面路径或 include 的参数 (例如 {"pyhtm_path": "nav.pyhtml", "cache": 60}), 
+        被包含页面之间不能读取对方写入的变量\n
+        除当前线程外的页面在生成页面的线程池中生成, 线程池中还没有开始生成的页面由当前线程生成, 
+        线程池占满时不会互相等待, render_mode 为 "process" 时按顺序生成"""
+        includes = [
+            include if isinstance(include, dict) else {"pyhtm_path": include} for include in pyhtm_paths
+        ]
+        results: dict[int, tuple] = {}
+        futures: dict[int, Future] = {}
+        if self.__executor is not None:
+            for index in range(1, len(includes)):
+                futures[index] = self.__executor.submit(self._render_include_result, includes[index])
+
+        # 从后向前生成, 线程池从前向后生成
+        for index in reversed(range(len(includes))):
+            future = futures.get(index)
+            if future is None or future.cancel():
+                results[index] = self._render_include_result(includes[index])
+
+        for index, future in futures.items():
+            if index not in results:
+                results[index] = future.result()
+
+        for index in range(len(includes)):
+            entry, has_error, err = results[index]
+            try:
+                if err is not None:
+                    raise err
+
+                self._include_update(entry, has_error, update_header)
+            except Exception as err:
+                raise IncludeImportError(str(err))
+
+    def _render_include(
+        self, 
+        pyhtm_path: str, 
+        cache: Optional[float] = None, 
+        vary: Optional[list[Any]] = None
+    ) -> tuple[Fragment_Cache_Entry, bool]:
+        """生成被包含页面 (不修改该页面), 返回 (被包含页面的输出, 是否输出了错误)\n
+        被包含页面使用了 await 时在当前线程的新事件循环中运行, 在事件循环中需要使用 include_async"""
+        template, key, entry = self._get_include_cache(pyhtm_path, cache, vary)
+        if entry is not None:
+            return entry, False
+
+        start = perf_counter()
+        py_html = self._new_include(template)
+        if template.is_async:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                asyncio.run(py_html._run_py_code_block_async())
+            else:
+                raise RuntimeError(f"'{pyhtm_path}' uses await, include it with 'await include_async(...)'")
+
+        result = self._get_include_entry(template, key, cache, py_html)
+        self._observe_include(template, start)
+        return result
+
+    def _observe_include(self, template: Py_Template, start: float):
+        """记录被包含页面的生成耗时 (使用缓存的输出时不记录)"""
+        if self.__metrics is not None:
+            self.__metrics.observe_include(template.path, perf_counter() - start)
+
+    def _get_include_cache(
+        self, 
+        pyhtm_path: str, 
+        cache: Optional[float] = None, 
+        vary: Optional[list[Any]] = None
+    ) -> tuple[Py_Template, Optional[tuple], Optional[Fragment_Cache_Entry]]:
+        """获取被包含页面, 返回 (页面, 缓存 key, 已缓存的输出), 没有设置 cache 时缓存 key 为 None"""
+        include_file_path = _get_include_path(self.__html_path, pyhtm_path)
+        template = Py_Template_Cache.get(include_file_path, self.__encoding)
+        if cache is None or template.version is None:
+            return template, None, None
+
+        key = (include_file_path, tuple(repr(val) for val in vary or ()))
+        return template, key, Py_Fragment_Cache.get(key, template.version)
+
+    def _new_include(self, template: Py_Template) -> "Py_Html":
+        """创建被包含页面, 没有使用 await 的页面在创建时生成"""
+        # 被包含页面通过 Include_Scope 读取该页面的全局变量, 不复制该页面的变量
+        return Py_Html(
+            template, template.path, self.__encoding, self.__response.copy(), 
+            {"__builtins__": Include_Scope(self._vals)}, self._run_py_vals, 
+            executor=self.__executor, metrics=self.__metrics, profile=self.__profile
+        )
+
+    def _get_include_entry(
+        self, 
+        template: Py_Template, 
+        key: Optional[tuple], 
+        cache: Optional[float], 
+        py_html: "Py_Html"
+    ) -> tuple[Fragment_Cache_Entry, bool]:
+        """被包含页面生成后的输出, key 存在, 没有输出错误并且写入的变量都可以共享时缓存输出"""
+        if key is not None and cache is not None and not py_html._has_error and _shareable(py_html._run_py_vals):
+            entry = Fragment_Cache_Entry(
+                template.version, monotonic() + cache, py_html.get_html(), py_html._set_cookies, 
+                dict(py_html._run_py_vals), py_html.response.copy(), py_html.header.copy()
+            )
+            Py_Fragment_Cache.set(key, entry)
+            return entry, False
+
+        return Fragment_Cache_Entry(
+            template.version, 0, py_html.get_html(), py_html._set_cookies, 
+            py_html._run_py_vals, py_html.response, py_html.header
+        ), py_html._has_error
+
+    def _render_include_result(self, include: dict[str, Any]) -> tuple[Optional[Fragment_Cache_Entry], bool, Optional[Exception]]:
+        """生成被包含页面, 返回 (被包含页面的输出, 是否输出了错误, 错误)"""
+        try:
+            return (*self._render_include(**include), None)
+        except Exception as err:
+            return None, False, err
+
+    def _include_update(self, entry: Fragment_Cache_Entry, has_error: bool, update_header: bool):
+        """更新包含它的页面数据, 只合并被包含页面写入的变量"""
+        if update_header or entry.cookies:
+            self._check_headers_sent()
+        if update_header:
+            self.__response.update(entry.response)
+            self.__header.update(entry.header)
+        self._has_error = self._has_error or has_error
+        # 缓存的变量在请求之间共享, 复制后再使用, 页面修改变量时不会改变缓存
+        self._run_py_vals.update(_copy_shareable(entry.vals) if entry.expires else entry.vals)
+        self._set_cookies = f"{self._set_cookies}\n{entry.cookies}" if self._set_cookies else entry.cookies
+        self.print(f"{entry.html}\n")
+
     @property
     def html(self) -> bytes:
         return self.__html.encode(self.__encoding)
@@ -186,6 +530,7 @@ class Py_Html:
 
     @header.setter
     def header(self, header: dict[str, Union[str, int]]):
+        self._check_headers_sent()
         self.__header.update(header)
 
     @property
@@ -194,6 +539,7 @@ class Py_Html:
 
     @response.setter
     def response(self, response: dict[str, Union[str, int]]):
+        self._check_headers_sent()
         self.__response.update(response)
     
     def get_html(self):
@@ -206,17 +552,53 @@ class Py_Html:
             self.__response["msg"]
         )
 
-    def get_header(self) -> bytes:
+    def get_header(self, body: Optional[bytes] = None) -> bytes:
         return _get_response_header(
             header=self.__header,
             response=self.get_response(),
-            body=self.html,
+            body=self.html if body is None else body,
             encoding=self.__encoding,
             cookies=self._set_cookies
         )
 
-    def get_response_body(self) -> bytes:
-        return b"%b\n%b" % (self.get_header(), self.html)
+    def get_stream_header(self) -> bytes:
+        """分块传输的响应头"""
+        header = self.__header.copy()
+        del header["Content-Length"]
+        header["Transfer-Encoding"] = "chunked"
+        return _get_response_header(
+            header=header,
+            response=self.get_response(),
+            body=b"",
+            encoding=self.__encoding,
+            cookies=self._set_cookies
+        )
+
+    @property
+    def streamed(self) -> bool:
+        """是否已经开始分块传输"""
+        return self.__stream is not None and self.__stream.started
+
+    def get_response_body(self, coding: Optional[str] = None) -> bytes:
+        """完整响应, coding 存在时使用 coding 压缩页面"""
+        html = self.html
+        if coding is not None:
+            html = _compress(html, coding)
+            self.__header["Content-Encoding"] = coding
+
+        return b"%b\n%b" % (self.get_header(html), html)
+
+    def get_not_modified_body(self) -> bytes:
+        """304 Not Modified 响应 (没有响应体)"""
+        header = self.__header.copy()
+        del header["Content-Length"]
+        return b"%b\n" % _get_response_header(
+            header=header,
+            response="HTTP/%s 304 Not Modified" % self.__response["http_version"],
+            body=b"",
+            encoding=self.__encoding,
+            cookies=self._set_cookies
+        )
 
 
 class PyHP_Server:
@@ -234,10 +616,96 @@ class PyHP_Server:
         网站主页
     web_error_page:
         网站错误页, 默认 None 使用 PyHP 内置错误页
+    request_upload_max_size:
+        multipart/form-data 请求体最大大小 (单位: KB), 上传文件按块写入 ./web_upload_file 不会读入内存\n
+        其他请求体使用 request_body_max_size, 超过时响应 413
+    request_parser:
+        请求头解析方式, "python" 读取整个请求头后一次解析, "httptools" 使用 httptools 解析 (需要安装 httptools, 格式检查更严格)
     encoding:
         网站编码
+    template_cache_size:
+        已编译页面缓存最多缓存页面数量 (进程内共享)
+    bytecode_cache_path:
+        已编译页面的磁盘缓存目录 (查看 Bytecode_Cache), 启动与新进程中读取已编译的页面而不是重新编译, 
+        可以使用 python -m pyhpweb compile <web_path> 预先编译, 默认 None 不使用
+    fragment_cache_size:
+        include(cache=...) 页面输出缓存最多缓存数量 (进程内共享)
+    render_workers:
+        生成页面的最大线程数, 默认 None 使用 ThreadPoolExecutor 默认值
+    render_mode:
+        页面生成方式, "thread" 在线程池中生成, "process" 在进程池中生成 (需要系统支持 fork)\n
+        CPU 密集的页面使用 "process" 不会受 GIL 影响阻塞其他页面
+    render_processes:
+        render_mode 为 "process" 时的进程数, 默认 None 使用 CPU 核心数
+    render_process_max_requests:
+        render_mode 为 "process" 时每个进程生成多少页面后重启, 0 为不重启
+    render_timeout:
+        生成页面的最长时间 (秒, 包括等待 max_renders 的时间), 超时时响应 504, 默认 None 不超时\n
+        render_mode 为 "process" 时结束该进程, 线程中的页面无法结束, 超时后仍然在运行并占用 max_renders, 
+        服务器关闭时 (SIGTERM / CTRL+C) 还有页面在线程中运行则直接结束进程
+    max_renders:
+        同时生成的最多页面数, 默认 None 不限制 (线程池排队)
+    render_queue_size:
+        设置 max_renders 时最多等待生成的页面数, 已满时直接响应 503
+    max_connections:
+        最多同时处理的连接数, 超过时响应 503 后关闭连接, 默认 None 不限制
+    overload_retry_after:
+        响应 503 时响应头 Retry-After 的秒数
+    request_header_timeout:
+        连接的第一个请求读取请求头的超时时间 (秒), 超时时关闭连接
+    request_body_timeout:
+        读取请求体时每次读取的超时时间 (秒), 超时时响应 408 后关闭连接, None 为不超时
+    stream_pages:
+        是否分块传输动态页面 (Transfer-Encoding: chunked), 页面代码块之间的静态 HTML 与已输出的数据会在生成时发送\n
+        也可以在代码块中调用 html.flush() 立即发送, 第一次发送后不能再修改响应头与 Cookie (render_mode 为 "thread" 时可用)
+    keep_alive_timeout:
+        保持连接时等待下一个请求的超时时间 (秒)
+    keep_alive_max_requests:
+        一个连接最多处理多少个请求, 1 为不保持连接
+    static_cache_control:
+        静态文件缓存策略, key 为文件后缀, val 为响应头 Cache-Control, 与 Static_Cache_Control 合并 ("default" 为其他后缀)
+    static_etag:
+        静态文件 ETag, "weak" 由文件大小与修改时间生成, "strong" 为文件内容摘要 (每个文件版本计算一次), None 不设置
+    static_file_cache_size:
+        静态文件响应缓存大小 (单位: KB), 0 为不缓存
+    static_file_cache_max_file_size:
+        可以缓存的最大静态文件大小 (单位: KB), 更大的文件每次使用 sendfile 发送
+    compression:
+        是否按请求头 Accept-Encoding 压缩文本类型的响应 (gzip, 安装 brotli / zstandard 时支持 br / zstd)
+    compression_min_size:
+        小于该大小 (单位: 字节) 的响应不压缩
+    compression_max_file_size:
+        大于该大小 (单位: KB) 的静态文件不压缩
+    compression_cache_size:
+        压缩后的静态文件缓存大小 (单位: KB), 每个文件版本只压缩一次, 0 为不缓存
+    static_precompressed:
+        是否优先使用磁盘上预先压缩的静态文件 (例如 style.css.gz, style.css.br)
+    page_cache_size:
+        页面使用 html.cache 声明缓存时最多缓存的响应数量, 为 0 时不缓存页面
+    workers:
+        工作进程数, 大于 1 时启动多个进程共享同一个监听 socket (需要系统支持 fork)\n
+        主进程负责重启意外退出的工作进程, 收到 SIGTERM / SIGINT 时关闭所有工作进程\n
+        主进程收到 SIGHUP 时平滑重载: 使用新的解释器启动工作进程, 新进程开始接受连接后关闭旧进程 (查看 Worker_Supervisor)\n
+        为 1 时收到 SIGHUP 启动新的解释器重新运行启动命令, 新进程开始接受连接后当前进程平滑退出 (进程 pid 会改变)
+    shutdown_timeout:
+        收到 SIGTERM 时停止接受新连接, 等待正在处理的请求完成的最长时间 (秒), 超过时直接关闭
+    warm_up:
+        启动 (与 SIGHUP 重载的新进程开始接受连接) 前是否预先编译页面并缓存静态文件, 查看 warm_up
     debug:
         是否开启 debug 日志输出
+    debug_log_body:
+        debug 模式下记录完整响应 (响应头与响应体) 的请求比例, 1 为全部记录, 0 为不记录
+    metrics_path:
+        Prometheus 文本格式指标的路径 (例如 "/metrics"), 设置时记录每个请求各阶段的耗时, 默认 None 不记录
+    metrics_hosts:
+        可以访问 metrics_path 的客户端 IP, 其他客户端按普通路径处理, None 为不限制
+    profile_path:
+        页面生成分析结果目录, 设置时按 profile_sample_rate / profile_slow_threshold 分析页面生成 (查看 Render_Profiler), 
+        默认 None 不分析
+    profile_sample_rate:
+        在 cProfile 下生成并记录每个代码块耗时的页面生成比例 (0 - 1)
+    profile_slow_threshold:
+        生成时间超过该值 (秒) 的页面下一次生成时被分析, 默认 None 不检查
     """
 
     def __init__(
@@ -249,8 +717,46 @@ class PyHP_Server:
         web_error_page: Optional[str] = None,
         request_body_max_size: int = 20480,
         request_header_max_size: int = 2048,
+        request_upload_max_size: int = 1048576,
+        request_parser: str = "python",
         encoding: str = "utf-8",
-        debug: bool = False
+        template_cache_size: int = 256,
+        bytecode_cache_path: Optional[str] = None,
+        fragment_cache_size: int = 1024,
+        render_workers: Optional[int] = None,
+        render_mode: str = "thread",
+        render_processes: Optional[int] = None,
+        render_process_max_requests: int = 1000,
+        render_timeout: Optional[float] = None,
+        max_renders: Optional[int] = None,
+        render_queue_size: int = 100,
+        max_connections: Optional[int] = None,
+        overload_retry_after: int = 1,
+        request_header_timeout: float = 5,
+        request_body_timeout: Optional[float] = 30,
+        stream_pages: bool = False,
+        keep_alive_timeout: float = 5,
+        keep_alive_max_requests: int = 100,
+        static_cache_control: Optional[dict[str, str]] = None,
+        static_etag: Optional[str] = "weak",
+        static_file_cache_size: int = 32768,
+        static_file_cache_max_file_size: int = 256,
+        compression: bool = True,
+        compression_min_size: int = 1024,
+        compression_max_file_size: int = 4096,
+        compression_cache_size: int = 32768,
+        static_precompressed: bool = True,
+        page_cache_size: int = 1024,
+        workers: int = 1,
+        shutdown_timeout: float = 30,
+        warm_up: bool = True,
+        debug: bool = False,
+        debug_log_body: float = 1,
+        metrics_path: Optional[str] = None,
+        metrics_hosts: Optional[Iterable[str]] = ("127.0.0.1", "::1"),
+        profile_path: Optional[str] = None,
+        profile_sample_rate: float = 0,
+        profile_slow_threshold: Optional[float] = None
     ) -> None:
         # 如果可以使用 uvloop 则使用
         try:
@@ -265,7 +771,7 @@ class PyHP_Server:
         # 设置日志输出
         Server_Log(logging.INFO if not debug else logging.DEBUG)
 
-        self._server = None
+        self._server: Optional[asyncio.Server] = None
         self._host = host
         self._port = port
         self._web_path = os.path.abspath(web_path)
@@ -273,7 +779,260 @@ class PyHP_Server:
         self._web_error_page = web_error_page
         self._request_body_max_size = request_body_max_size * 1024
         self._request_header_max_size = request_header_max_size * 1024
+        self._request_upload_max_size = request_upload_max_size * 1024
+        if request_parser not in ("python", "httptools"):
+            raise ValueError(f"request_parser must be 'python' or 'httptools', not {request_parser!r}")
+
+        if request_parser == "httptools" and httptools is None:
+            print("\n * httptools is not installed (pip install httptools), request_parser fall back to 'python'")
+            request_parser = "python"
+
+        self._request_parser = request_parser
+        # 读取请求头时的缓冲区上限, 超过时不再读取直接响应 431
+        self._stream_limit = max(self._request_header_max_size, 2 ** 16)
         self._encoding = encoding
+        self._stream_pages = stream_pages
+        self._keep_alive_timeout = keep_alive_timeout
+        self._request_header_timeout = request_header_timeout
+        self._request_body_timeout = request_body_timeout
+        self._render_timeout = render_timeout
+        self._render_limiter = Render_Limiter(max_renders, render_queue_size) if max_renders is not None else None
+        self._max_connections = max_connections
+        self._overload_retry_after = overload_retry_after
+        # 正在处理的连接数与超过 max_connections 拒绝的连接数
+        self._connections = 0
+        self._rejected_connections = 0
+        # 收到 SIGTERM 后停止接受新连接, 之后的响应都关闭连接
+        self._shutdown_timeout = shutdown_timeout
+        self._draining = False
+        self._drain_task: Optional[asyncio.Task] = None
+        # 单进程运行时的监听 socket 与 SIGHUP 重载启动的新进程 pid
+        self._listen_sock: Optional[socket.socket] = None
+        self._reload_pid: Optional[int] = None
+        self._keep_alive_max_requests = keep_alive_max_requests
+        self._static_cache_control = {**Static_Cache_Control, **(static_cache_control or {})}
+        self._etag_cache = ETag_Cache()
+        self._compression = compression
+        self._compression_min_size = compression_min_size
+        self._compression_max_file_size = compression_max_file_size * 1024
+        self._static_precompressed = static_precompressed
+        self._compressed_cache = None
+        if compression and compression_cache_size > 0:
+            self._compressed_cache = Static_File_Cache(
+                compression_cache_size * 1024, self._compression_max_file_size
+            )
+
+        self._static_file_cache = None
+        if static_file_cache_size > 0:
+            self._static_file_cache = Static_File_Cache(
+                static_file_cache_size * 1024, static_file_cache_max_file_size * 1024
+            )
+        self._page_cache = Page_Cache(page_cache_size) if page_cache_size > 0 else None
+        # 正在生成的可缓存页面, 相同缓存 key 的请求等待同一次生成
+        self._page_renders: dict[tuple, asyncio.Future] = {}
+        self._page_revalidate_tasks: set[asyncio.Task] = set()
+        # 页面是否使用了 await, 在线程中获取页面时更新, 事件循环中不读取页面文件
+        self._async_pages: dict[str, bool] = {}
+        Py_Template_Cache.max_size = template_cache_size
+        if bytecode_cache_path is not None:
+            Py_Template_Cache.bytecode_cache = Bytecode_Cache(bytecode_cache_path)
+        Py_Fragment_Cache.max_size = fragment_cache_size
+        self._render_executor = Render_Executor(render_workers)
+
+        if render_mode not in ("thread", "process"):
+            raise ValueError(f"render_mode must be 'thread' or 'process', not {render_mode!r}")
+
+        if render_mode == "process" and not hasattr(os, "fork"):
+            print("\n * Your system does not support fork, render_mode 'process' fall back to 'thread'")
+            render_mode = "thread"
+
+        if static_etag not in ("weak", "strong", None):
+            raise ValueError(f"static_etag must be 'weak', 'strong' or None, not {static_etag!r}")
+
+        self._static_etag = static_etag
+
+        if workers > 1 and not hasattr(os, "fork"):
+            print("\n * Your system does not support fork, workers fall back to 1")
+            workers = 1
+
+        self._workers = workers
+        self._warm_up = warm_up
+        self._debug_log_body = debug_log_body
+        self._metrics_path = metrics_path
+        self._metrics_hosts = None if metrics_hosts is None else set(metrics_hosts)
+        self._metrics = Server_Metrics(self._web_path) if metrics_path is not None else None
+        self._profiler = None
+        if profile_path is not None and (profile_sample_rate > 0 or profile_slow_threshold is not None):
+            self._profiler = Render_Profiler(profile_path, profile_sample_rate, profile_slow_threshold)
+        self._render_mode = render_mode
+        self._process_render_pool = None
+        if render_mode == "process":
+            self._process_render_pool = Process_Render_Pool(
+                self._run_html_py_code, 
+                render_processes, 
+                render_process_max_requests, 
+                render_timeout
+            )
+
+    @property
+    def static_file_cache_stats(self) -> Optional[dict[str, int]]:
+        """静态文件响应缓存状态, 查看 Static_File_Cache.stats, 没有开启缓存时为 None"""
+        if self._static_file_cache is None:
+            return None
+
+        return self._static_file_cache.stats
+
+    @property
+    def compressed_cache_stats(self) -> Optional[dict[str, int]]:
+        """压缩后的静态文件缓存状态, 查看 Static_File_Cache.stats, 没有开启缓存时为 None"""
+        if self._compressed_cache is None:
+            return None
+
+        return self._compressed_cache.stats
+
+    @property
+    def page_cache_stats(self) -> Optional[dict[str, Any]]:
+        """页面响应缓存状态, 查看 Page_Cache.stats, 没有开启缓存时为 None"""
+        if self._page_cache is None:
+            return None
+
+        return self._page_cache.stats
+
+    @property
+    def fragment_cache_stats(self) -> dict[str, Any]:
+        """include 页面输出缓存状态, 查看 Fragment_Cache.stats\n
+        render_mode 为 "process" 时每个进程分别缓存, 这里只有当前进程的状态"""
+        return Py_Fragment_Cache.stats
+
+    @property
+    def render_stats(self) -> dict[str, int]:
+        """页面生成状态, render_mode 为 "thread" 时查看 Render_Executor.stats\n
+        render_mode 为 "process" 时查看 Process_Render_Pool.stats"""
+        if self._process_render_pool is not None:
+            return self._process_render_pool.stats
+
+        return self._render_executor.stats
+
+    @property
+    def admission_stats(self) -> dict[str, Any]:
+        """连接与页面生成限制状态\n
+        connections: 正在处理的连接数, rejected_connections: 超过 max_connections 拒绝的连接数, 
+        renders: 设置 max_renders 时为 Render_Limiter.stats, 否则为 None"""
+        return {
+            "connections": self._connections,
+            "rejected_connections": self._rejected_connections,
+            "renders": self._render_limiter.stats if self._render_limiter is not None else None,
+        }
+
+    @property
+    def metrics(self) -> Optional[str]:
+        """Prometheus 文本格式的指标, 没有设置 metrics_path 时为 None"""
+        if self._metrics is None:
+            return None
+
+        return self._metrics.render(self._get_metrics_gauges())
+
+    def _get_metrics_gauges(self) -> list[tuple[str, str, str, float]]:
+        """连接数, 页面生成状态 (查看 render_stats 与 admission_stats) 与缓存命中次数指标"""
+        gauges: list[tuple[str, str, str, float]] = [
+            ("pyhp_connections", "gauge", "Open client connections", self._connections),
+            (
+                "pyhp_rejected_connections_total", "counter", 
+                "Connections rejected by max_connections", self._rejected_connections
+            ),
+        ]
+        gauges += [
+            (f"pyhp_render_{name}", "gauge", f"render {name.replace('_', ' ')}", val) 
+            for name, val in self.render_stats.items()
+        ]
+        if self._render_limiter is not None:
+            gauges += [
+                (f"pyhp_render_limit_{name}", "gauge", f"render limit {name}", val) 
+                for name, val in self._render_limiter.stats.items()
+            ]
+        caches = (
+            ("page", self.page_cache_stats), 
+            ("fragment", self.fragment_cache_stats), 
+            ("static_file", self.static_file_cache_stats),
+            ("compressed", self.compressed_cache_stats),
+        )
+        for name, stats in caches:
+            if stats is None:
+                continue
+
+            gauges += [
+                (f"pyhp_{name}_cache_hits_total", "counter", f"{name} cache hits", stats["hits"]),
+                (f"pyhp_{name}_cache_misses_total", "counter", f"{name} cache misses", stats["misses"]),
+            ]
+
+        return gauges
+
+    def _metrics_request(self, request: dict[str, Any], writer: asyncio.StreamWriter) -> bool:
+        """是否为可以访问的指标路径"""
+        if self._metrics is None or request["request_path"]["path"] != self._metrics_path:
+            return False
+
+        if self._metrics_hosts is None:
+            return True
+
+        peername = writer.get_extra_info("peername")
+        return bool(peername) and peername[0] in self._metrics_hosts
+
+    async def _render_html(
+        self, html_path: str, *args, **kwargs
+    ) -> tuple[Union[str, int], Optional[bytes], Optional[Page_Cache_Entry]]:
+        """按 render_mode 在线程池或进程池中运行 _run_html_py_code\n
+        使用了 await 的页面在事件循环中运行\n
+        设置 max_renders 时等待可以生成页面 (等待队列已满时抛出 ServiceUnavailableError), 
+        超过 render_timeout 时抛出 TimeoutError, 已经开始分块传输的页面之后的数据不再发送"""
+        if self._render_timeout is None:
+            return await self._limit_render(html_path, *args, **kwargs)
+
+        try:
+            return await asyncio.wait_for(self._limit_render(html_path, *args, **kwargs), self._render_timeout)
+        except asyncio.TimeoutError:
+            stream = kwargs.get("stream")
+            if stream is not None:
+                stream.closed = True
+            raise TimeoutError(f"Render timed out after {self._render_timeout} seconds") from None
+
+    async def _limit_render(
+        self, html_path: str, *args, **kwargs
+    ) -> tuple[Union[str, int], Optional[bytes], Optional[Page_Cache_Entry]]:
+        """在 max_renders 限制内生成页面\n
+        线程中的页面超时后仍然在运行, 线程结束后才释放位置"""
+        limiter = self._render_limiter
+        release: Optional[Callable[[], None]] = None
+        if limiter is not None:
+            await limiter.acquire()
+            release = limiter.release
+
+        try:
+            if html_path not in self._async_pages:
+                template = await asyncio.get_running_loop().run_in_executor(
+                    None, Py_Template_Cache.get, html_path, self._encoding
+                )
+                self._async_pages[html_path] = template.is_async
+
+            if self._async_pages[html_path]:
+                kwargs.pop("stream", None)
+                return await self._run_html_py_code_async(html_path, *args, **kwargs)
+
+            if self._process_render_pool is not None:
+                # 进程中生成的页面不支持分块传输
+                kwargs.pop("stream", None)
+                return await self._process_render_pool.run(html_path, *args, **kwargs)
+
+            future = self._render_executor.submit(self._run_html_py_code, html_path, *args, **kwargs)
+            if release is not None:
+                # 线程结束后释放位置
+                release_later, release = release, None
+                loop = asyncio.get_running_loop()
+                future.add_done_callback(lambda _: loop.call_soon_threadsafe(release_later))
+            return await asyncio.wrap_future(future)
+        finally:
+            if release is not None:
+                release()
 
     @staticmethod
     def _get_content_type(file_path: str):
@@ -324,14 +1083,75 @@ class PyHP_Server:
     
     def _run_html_py_code(
         self, 
-        html: str, 
+        html_path: str,
         path: str, 
+        request: dict[str, Any], 
+        response: Optional[dict[str, Any]] = None,
+        expand_vals: Optional[dict[str, Any]] = None,
+        stream: Optional[Response_Stream] = None
+    ) -> tuple[Union[str, int], Optional[bytes], Optional[Page_Cache_Entry]]:
+        """动态生成页面, 页面从已编译页面缓存中获取, 返回 (响应码, 响应数据, 页面缓存)\n
+        使用 stream 分块传输并且已经开始发送时返回的响应数据为 None\n
+        页面使用 html.cache 声明缓存时返回 Page_Cache_Entry, 否则为 None"""
+        template = Py_Template_Cache.get(html_path, self._encoding)
+        self._async_pages[html_path] = template.is_async
+        executor: Optional[Render_Executor] = self._render_executor
+        metrics: Optional[Server_Metrics] = self._metrics
+        if self._process_render_pool is not None:
+            # 进程中生成页面时按顺序生成 include_parallel 的页面, 不记录 include 页面耗时
+            executor = metrics = None
+        if template.is_async:
+            # 页面修改后使用了 await, 本次在当前线程的新事件循环中运行 (不支持分块传输), 之后在事件循环中生成
+            stream = None
+
+        with self._profile_render(html_path, path) as profile:
+            pyhtml = Py_Html(
+                template, html_path, self._encoding, response, self._get_page_vals(path, request, expand_vals), 
+                stream=stream, executor=executor, metrics=metrics, profile=profile
+            )
+            if template.is_async:
+                asyncio.run(pyhtml._run_py_code_block_async())
+        return self._get_page_response(pyhtml, template, request, stream)
+
+    async def _run_html_py_code_async(
+        self, 
         html_path: str,
+        path: str, 
         request: dict[str, Any], 
-        response: dict[str, Any] = None,
-        expand_vals: dict[str, Any] = None
-    ) -> tuple[Union[str, int], bytes]:
-        """动态生成页面"""
+        response: Optional[dict[str, Any]] = None,
+        expand_vals: Optional[dict[str, Any]] = None,
+        stream: Optional[Response_Stream] = None
+    ) -> tuple[Union[str, int], Optional[bytes], Optional[Page_Cache_Entry]]:
+        """在事件循环中生成使用了 await 的页面, 返回值与 _run_html_py_code 相同\n
+        在事件循环中生成的页面不支持分块传输, 页面修改后不再使用 await 时在线程池中生成"""
+        template = await asyncio.get_running_loop().run_in_executor(
+            None, Py_Template_Cache.get, html_path, self._encoding
+        )
+        self._async_pages[html_path] = template.is_async
+        if not template.is_async:
+            return await self._render_executor.run(
+                self._run_html_py_code, html_path, path, request, response, expand_vals
+            )
+
+        # 事件循环中同时运行其他请求, 不使用 cProfile
+        with self._profile_render(html_path, path, use_cprofile=False) as profile:
+            pyhtml = Py_Html(
+                template, html_path, self._encoding, response, self._get_page_vals(path, request, expand_vals), 
+                executor=self._render_executor, metrics=self._metrics, profile=profile
+            )
+            await pyhtml._run_py_code_block_async()
+        return self._get_page_response(pyhtml, template, request, None)
+
+    def _profile_render(self, html_path: str, path: str, use_cprofile: bool = True):
+        """生成页面时使用的 with, 没有开启分析时为 nullcontext (得到 None), 查看 Render_Profiler.render"""
+        if self._profiler is None:
+            return nullcontext()
+
+        return self._profiler.render(html_path, path, use_cprofile)
+
+    @staticmethod
+    def _get_page_vals(path: str, request: dict[str, Any], expand_vals: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+        """页面代码块可以使用的请求数据"""
         if expand_vals is None:
             expand_vals = {}
 
@@ -347,9 +1167,44 @@ class PyHP_Server:
             "cookie": request["cookie"]
         }
         vals.update(expand_vals)
-        pyhtml = Py_Html(html, html_path, self._encoding, response, vals)
+        return vals
+
+    def _get_page_response(
+        self, 
+        pyhtml: "Py_Html", 
+        template: Py_Template, 
+        request: dict[str, Any], 
+        stream: Optional[Response_Stream] = None
+    ) -> tuple[Union[str, int], Optional[bytes], Optional[Page_Cache_Entry]]:
+        """已生成页面的响应, 按请求压缩页面或响应 304"""
+        if pyhtml.streamed and stream is not None:
+            stream.end(pyhtml.html)
+            return pyhtml.response["code"], None, pyhtml.get_cache_entry(template.version, None)
+
+        coding = self._get_page_coding(pyhtml, request["request_header"])
+        if request["request_path"]["mode"] in ("GET", "HEAD") and pyhtml.not_modified(request["request_header"]):
+            return 304, pyhtml.get_not_modified_body(), pyhtml.get_cache_entry(template.version, None)
 
-        return pyhtml.response["code"], pyhtml.get_response_body()
+        body = pyhtml.get_response_body(coding)
+        return pyhtml.response["code"], body, pyhtml.get_cache_entry(template.version, body)
+
+    def _get_page_coding(self, pyhtml: "Py_Html", request_header: dict[str, str]) -> Optional[str]:
+        """动态页面使用的压缩方式 (在生成页面的线程中压缩), 不压缩时返回 None\n
+        页面已经设置 Content-Encoding 时不压缩, 需要压缩时页面的 ETag 加上压缩方式"""
+        header = pyhtml.header
+        if not self._compression or "Content-Encoding" in header or not _compressible(str(header["Content-Type"])):
+            return None
+
+        _add_vary(header)
+        if len(pyhtml.html) < self._compression_min_size:
+            return None
+
+        coding = _select_encoding(request_header.get("accept-encoding"))
+        etag = header.get("ETag")
+        if coding is not None and isinstance(etag, str) and etag:
+            header["ETag"] = f'{etag[:-1]}-{coding}"'
+
+        return coding
 
     async def _get_error_response_body(
         self,
@@ -365,13 +1220,9 @@ class PyHP_Server:
 
             # 自定义错误页
             self._web_error_page_path = f"{self._web_path}/{self._web_error_page}"
-            async with aiofiles.open(self._web_error_page_path, "r") as _file:
-                html = await _file.read()
-
-            return await asyncio.to_thread(self._run_html_py_code,
-                html=html,
+            code, body, _ = await self._render_html(
+                html_path=self._web_error_page_path,
                 path=f"/{self._web_error_page}",
-                html_path=self._web_error_page,
                 request=request,
                 response={
                     "code": code,
@@ -382,6 +1233,7 @@ class PyHP_Server:
                     "error_url": request["url"],
                 }
             )
+            return code, body
         except Exception:
             # 如果自定义错误页执行失败, 重新启用内置错误页
             body = PyHP_Server._get_error_body(
@@ -395,100 +1247,788 @@ class PyHP_Server:
             encoding=self._encoding
         )
     
-    async def _get_connected_body(self, request: dict[str, dict[str, Any]]):
-        """获取响应该次客户端请求的数据, request 为 _set_request 返回值"""
+    async def _get_connected_body(
+        self, 
+        request: dict[str, dict[str, Any]], 
+        stream: Optional[Response_Stream] = None
+    ):
+        """获取响应该次客户端请求的数据, request 为 _set_request 返回值\n
+        stream 存在时动态页面使用分块传输"""
         file_path = self._web_path + request["request_path"]["path"]
         if request["request_path"]["path"] == "/":
             file_path += self._web_index
         
         # 解析文件
-        body = b""
-        async with aiofiles.open(file_path, "rb") as _file:
-            content_type = self._get_content_type(file_path)
-            body = await _file.read()
-            
-            if content_type == "text/html":
-                code, body = await asyncio.to_thread(self._run_html_py_code,
-                    body.decode(self._encoding), str(request["url"]), file_path, request
-                )
-            else:
-                body = self._get_response_body(
-                    body, 
-                    encoding=self._encoding, 
-                    type_=content_type
-                )
-                code = 200
+        content_type = self._get_content_type(file_path)
+        if content_type == "text/html":
+            return await self._get_page_body(file_path, request, stream)
 
-        return code, body
+        return await self._get_static_file(file_path, content_type, request)
+
+    @staticmethod
+    def _page_cacheable_request(request: dict[str, Any]) -> bool:
+        """只有没有请求体的 GET / HEAD 请求可以使用页面缓存"""
+        request_header = request["request_header"]
+        return (
+            request["request_path"]["mode"] in ("GET", "HEAD")
+            and "content-length" not in request_header 
+            and "transfer-encoding" not in request_header
+        )
+
+    def _get_page_cache_key(self, file_path: str, policy: Page_Cache_Policy, request: dict[str, Any]) -> tuple:
+        """页面缓存 key: (页面路径, vary_get 参数, vary_cookie Cookie, 压缩方式)"""
+        get, cookie = request["request_data"]["GET"], request["cookie"]
+        coding = None
+        if self._compression:
+            coding = _select_encoding(request["request_header"].get("accept-encoding"))
+
+        return (
+            file_path, 
+            tuple(get.get(name) for name in policy.vary_get), 
+            tuple(cookie.get(name) for name in policy.vary_cookie),
+            coding
+        )
+
+    def _get_cached_page(self, entry: Page_Cache_Entry, request: dict[str, Any]) -> tuple[int, bytes]:
+        """使用已缓存的页面响应"""
+        # Page_Cache 只缓存有完整响应的页面
+        assert entry.response is not None and entry.header is not None
+        if _not_modified(request["request_header"], entry.etag, entry.last_modified):
+            return 304, self._get_not_modified_body(entry.header)
+
+        return 200, entry.response.replace(entry.date, b"Date: %b" % full_date().encode(self._encoding), 1)
+
+    async def _get_page_body(
+        self, 
+        file_path: str, 
+        request: dict[str, Any], 
+        stream: Optional[Response_Stream] = None
+    ) -> tuple[Union[str, int], Optional[bytes]]:
+        """动态页面响应\n
+        页面使用 html.cache 声明缓存后, 缓存时间内直接使用缓存的响应, 
+        相同缓存 key 同时只生成一次页面, 其他请求等待生成完成后使用缓存 (本次响应不能缓存时再次检查, 
+        由一个请求重新生成, 其他请求继续等待), 响应过期但在 stale_while_revalidate 内时使用旧响应并在后台重新生成页面\n
+        第一次生成页面前不知道页面是否声明了缓存, 同一页面同时只生成一次, 其他请求等待记录缓存策略后再检查缓存"""
+        if self._page_cache is None or not self._page_cacheable_request(request):
+            code, body, _ = await self._render_html(file_path, str(request["url"]), request, stream=stream)
+            return code, body
+
+        # 还不知道页面的缓存策略时同时只生成一次页面, 其他请求等待页面记录缓存策略
+        policy_key = (file_path,)
+        policies = self._page_cache.policies
+        while file_path not in policies and policy_key in self._page_renders:
+            self._page_cache.coalesced()
+            await asyncio.shield(self._page_renders[policy_key])
+
+        policy = policies.get(file_path)
+        if policy is None:
+            return await self._render_page(
+                file_path, request, None if file_path in policies else policy_key, stream=stream
+            )
+
+        # 检查页面是否已修改, 不在事件循环中读取文件状态
+        stat = await asyncio.get_running_loop().run_in_executor(None, os.stat, file_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = self._get_page_cache_key(file_path, policy, request)
+        entry, fresh = self._page_cache.get(key, version)
+        while entry is None and key in self._page_renders:
+            self._page_cache.coalesced()
+            await asyncio.shield(self._page_renders[key])
+            entry, fresh = self._page_cache.get(key, version, count=False)
+            fresh = True
+
+        if entry is None:
+            return await self._render_page(file_path, request, key)
+
+        if not fresh and key not in self._page_renders:
+            task = asyncio.get_running_loop().create_task(self._revalidate_page(file_path, request, key))
+            self._page_revalidate_tasks.add(task)
+            task.add_done_callback(self._page_revalidate_tasks.discard)
+
+        return self._get_cached_page(entry, request)
+
+    async def _render_page(
+        self, 
+        file_path: str, 
+        request: dict[str, Any], 
+        key: Optional[tuple] = None, 
+        stream: Optional[Response_Stream] = None
+    ) -> tuple[Union[str, int], Optional[bytes]]:
+        """生成页面并按页面声明的缓存策略缓存响应, key 存在时相同 key 的请求等待本次生成"""
+        future = None
+        if key is not None:
+            future = asyncio.get_running_loop().create_future()
+            self._page_renders[key] = future
 
-    async def _client_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter): 
-        """处理请求"""
-        body = b""
         try:
-            request = await Request(reader, self).request
+            code, body, entry = await self._render_html(file_path, str(request["url"]), request, stream=stream)
+            if self._page_cache is None:
+                return code, body
 
-            if type(request) == dict:
-                code, body = await self._get_connected_body(request)
-            elif type(request) == tuple:
-                code, body, request = request
+            if entry is None:
+                self._page_cache.policies[file_path] = None
+                return code, body
+
+            self._page_cache.policies[file_path] = entry.policy
+            if entry.response is not None:
+                self._page_cache.set(self._get_page_cache_key(file_path, entry.policy, request), entry)
+            return code, body
+        finally:
+            if future is not None and key is not None:
+                # 只删除本次生成的 future
+                if self._page_renders.get(key) is future:
+                    del self._page_renders[key]
+                future.set_result(None)
+
+    async def _revalidate_page(self, file_path: str, request: dict[str, Any], key: tuple):
+        """在后台重新生成已过期的页面"""
+        try:
+            await self._render_page(file_path, request, key)
+        except Exception:
+            logging.exception(f"revalidate page {file_path} failed")
+
+    async def _get_static_etag(self, file_path: str, _file, file_stat: os.stat_result) -> Optional[str]:
+        """获取静态文件 ETag, 每个文件版本只计算一次 (强 ETag 在线程中计算)"""
+        if self._static_etag is None:
+            return None
+
+        etag = self._etag_cache.get(file_path, file_stat)
+        if etag is None:
+            etag = await asyncio.get_running_loop().run_in_executor(
+                None, _file_etag, _file, file_stat, self._static_etag == "strong"
+            )
+            self._etag_cache.set(file_path, file_stat, etag)
+
+        return etag
+
+    def _get_not_modified_body(self, response_header: dict[str, Any]) -> bytes:
+        """静态文件 304 Not Modified 响应 (没有响应体)"""
+        response_header = response_header.copy()
+        response_header.pop("Content-Length", None)
+        return b"%b\n" % _get_response_header(
+            response_header, "HTTP/1.1 304 Not Modified", b"", self._encoding
+        )
+
+    def _get_cached_static_file(self, entry: Static_Cache_Entry, request: dict[str, Any]) -> tuple[int, bytes]:
+        """使用已缓存的静态文件响应"""
+        if request["request_path"]["mode"] in ("GET", "HEAD") and _not_modified(
+                request["request_header"], entry.etag, entry.mtime):
+            return 304, self._get_not_modified_body(entry.header)
+
+        return 200, entry.response.replace(entry.date, b"Date: %b" % full_date().encode(self._encoding), 1)
+
+    def _get_static_header(
+        self, 
+        file_path: str, 
+        content_type: str, 
+        file_stat: os.stat_result, 
+        etag: Optional[str]
+    ) -> dict[str, Any]:
+        """静态文件响应头, 按文件后缀设置 Cache-Control"""
+        file_type = file_path.rsplit(".", maxsplit=1)[-1]
+        response_header = Http_Response_Header.copy()
+        response_header["Content-Type"] = content_type
+        response_header["Cache-Control"] = self._static_cache_control.get(
+            file_type, self._static_cache_control["default"]
+        )
+        response_header["Accept-Ranges"] = "bytes"
+        response_header["Last-Modified"] = full_date(file_stat.st_mtime)
+        if etag is not None:
+            response_header["ETag"] = etag
+
+        if self._compression and _compressible(content_type):
+            _add_vary(response_header)
+
+        return response_header
+
+    def _get_static_coding(self, content_type: str, request_header: dict[str, str], size: int) -> Optional[str]:
+        """静态文件使用的压缩方式, 不压缩时返回 None"""
+        if (not self._compression or not _compressible(content_type) or 
+                not self._compression_min_size <= size <= self._compression_max_file_size):
+            return None
+
+        return _select_encoding(request_header.get("accept-encoding"))
+
+    async def _get_static_file(
+        self, 
+        file_path: str, 
+        content_type: str, 
+        request: dict[str, Any]
+    ) -> tuple[int, Union[bytes, Static_File]]:
+        """静态文件响应, 文件由 Static_File 使用 sendfile 发送, 小文件的完整响应缓存在 Static_File_Cache 中\n
+        按文件后缀设置 Cache-Control, 设置 ETag 与 Last-Modified, 请求头 If-None-Match / If-Modified-Since 验证通过时响应 304\n
+        GET 请求支持单个范围的 Range (206 Partial Content), If-Range 与 ETag / Last-Modified 不一致时发送整个文件\n
+        客户端接受压缩时发送压缩后的文件 (Range 请求不压缩), 每个文件版本只压缩一次"""
+        request_header = request["request_header"]
+        if "range" not in request_header and (self._static_file_cache is not None or self._compressed_cache is not None):
+            file_stat = os.stat(file_path)
+            coding = self._get_static_coding(content_type, request_header, file_stat.st_size)
+            cache = self._static_file_cache if coding is None else self._compressed_cache
+            if cache is not None:
+                entry = cache.get(file_path if coding is None else f"{file_path}:{coding}", file_stat)
+                if entry is not None:
+                    return self._get_cached_static_file(entry, request)
+
+        _file = open(file_path, "rb")
+        try:
+            file_stat = os.fstat(_file.fileno())
+            if stat.S_ISDIR(file_stat.st_mode):
+                raise IsADirectoryError(file_path)
+
+            size = file_stat.st_size
+            etag = await self._get_static_etag(file_path, _file, file_stat)
+            coding = None
+            if "range" not in request_header:
+                coding = self._get_static_coding(content_type, request_header, size)
+
+            if coding is not None and etag is not None:
+                # 压缩后的文件使用不同的 ETag
+                etag = f'{etag[:-1]}-{coding}"'
+
+            response_header = self._get_static_header(file_path, content_type, file_stat, etag)
+            if request["request_path"]["mode"] in ("GET", "HEAD") and _not_modified(request_header, etag, file_stat.st_mtime):
+                _file.close()
+                if coding is not None:
+                    response_header["Content-Encoding"] = coding
+                return 304, self._get_not_modified_body(response_header)
+
+            if coding is not None:
+                return 200, await self._cache_static_file(file_path, _file, file_stat, etag, response_header, coding)
 
+            code, msg, offset, count = 200, "OK", 0, size
+            range_header = request_header.get("range")
+            if_range = request_header.get("if-range")
+            # If-Range 只能使用强 ETag 比较
+            if_range_match = if_range is None or if_range == response_header["Last-Modified"] or (
+                etag is not None and not etag.startswith("W/") and if_range == etag
+            )
+            if range_header and request["request_path"]["mode"] == "GET" and if_range_match:
+                try:
+                    byte_range = _parse_range(range_header, size)
+                except RangeNotSatisfiableError:
+                    _file.close()
+                    response_header["Content-Range"] = f"bytes */{size}"
+                    return 416, b"%b\n" % _get_response_header(
+                        response_header, "HTTP/1.1 416 Range Not Satisfiable", b"", self._encoding
+                    )
+
+                if byte_range is not None:
+                    code, msg = 206, "Partial Content"
+                    offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+                    response_header["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+
+            if code == 200 and self._static_file_cache is not None and self._static_file_cache.cacheable(size):
+                return 200, await self._cache_static_file(file_path, _file, file_stat, etag, response_header)
+
+            response_header["Content-Length"] = count
+            header = _get_response_header(response_header, f"HTTP/1.1 {code} {msg}", b"", self._encoding)
+        except BaseException:
+            _file.close()
+            raise
+
+        return code, Static_File(_file, b"%b\n" % header, offset, count)
+
+    async def _cache_static_file(
+        self,
+        file_path: str,
+        _file,
+        file_stat: os.stat_result,
+        etag: Optional[str],
+        response_header: dict[str, Any],
+        coding: Optional[str] = None
+    ) -> bytes:
+        """读取 (压缩) 文件生成完整响应并缓存, 返回响应\n
+        coding 存在时优先使用磁盘上预先压缩的文件 (例如 style.css.gz), 没有时在线程中压缩"""
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(
+                None, _read_static_body, file_path, _file, file_stat, coding, self._static_precompressed
+            )
+        finally:
+            _file.close()
+
+        if coding is not None:
+            response_header["Content-Encoding"] = coding
+
+        header = response_header.copy()
+        response = b"%b\n%b" % (
+            _get_response_header(header, "HTTP/1.1 200 OK", body, self._encoding), body
+        )
+        cache = self._static_file_cache if coding is None else self._compressed_cache
+        if cache is not None and (coding is not None or len(body) == file_stat.st_size) and cache.cacheable(len(body)):
+            cache.set(file_path if coding is None else f"{file_path}:{coding}", Static_Cache_Entry(
+                (file_stat.st_mtime_ns, file_stat.st_size),
+                etag,
+                file_stat.st_mtime,
+                response_header,
+                response,
+                b"Date: %b" % header["Date"].encode(self._encoding)
+            ))
+
+        return response
+
+    @staticmethod
+    def _request_keep_alive(request: dict[str, Any]) -> bool:
+        """客户端是否要求保持连接, HTTP/1.1 默认保持, HTTP/1.0 需要 Connection: keep-alive"""
+        if "request_header" not in request:
+            return False
+
+        connection = request["request_header"].get("connection", "").lower()
+        if request["request_path"]["http_version"] == "HTTP/1.1":
+            return "close" not in connection
+
+        return "keep-alive" in connection
+
+    async def _handle_request(
+        self, 
+        reader: asyncio.StreamReader, 
+        writer: asyncio.StreamWriter, 
+        request_head: Optional[bytes],
+        keep_alive: bool = True
+    ) -> bool:
+        """处理一个请求, 返回是否保持连接"""
+        request: dict[str, Any] = {}
+        code: Union[str, int]
+        body, stream = b"", None
+        start, parsed = perf_counter(), None
+        client = Request(reader, self, request_head)
+        try:
+            parsed_request = await client.request
+
+            if isinstance(parsed_request, dict):
+                request = parsed_request
+                parsed = perf_counter()
+                if self._metrics is not None and self._metrics_request(request, writer):
+                    code, body = 200, self._get_response_body(
+                        self._metrics.render(self._get_metrics_gauges()).encode(self._encoding), 
+                        type_=Metrics_Content_Type, 
+                        encoding=self._encoding
+                    )
+                else:
+                    if self._stream_pages and request["request_path"]["http_version"] == "HTTP/1.1":
+                        stream = Response_Stream(
+                            writer, 
+                            asyncio.get_running_loop(), 
+                            keep_alive and not self._draining and self._request_keep_alive(request)
+                        )
+
+                    code, body = await self._get_connected_body(request, stream)
+            else:
+                # 请求没有解析完, 无法继续读取下一个请求
+                code, body, request = parsed_request
+                keep_alive = False
+
+        except PayloadTooLargeError:
+            # 请求体没有读取完, 无法继续读取下一个请求
+            keep_alive = False
+            code, body = await self._get_error_response_body(request, 413, "Payload Too Large")
+        except BadRequestError:
+            keep_alive = False
+            code, body = await self._get_error_response_body(request, 400, "Bad Request")
+        except RequestTimeoutError:
+            # 请求体没有读取完, 无法继续读取下一个请求
+            keep_alive = False
+            code, body = await self._get_error_response_body(request, 408, "Request Timeout")
+        except ServiceUnavailableError:
+            code, body = await self._get_error_response_body(request, 503, "Service Unavailable")
+            body = _add_response_header(body, b"Retry-After: %d" % self._overload_retry_after)
         except PermissionError:
             code, body = await self._get_error_response_body(request, 403, "Forbidden")
         except FileNotFoundError:
             code, body = await self._get_error_response_body(request, 404, "Not Found")
+        except TimeoutError:
+            code, body = await self._get_error_response_body(request, 504, "Gateway Timeout")
         except Exception:
             code, body = await self._get_error_response_body(request)
         finally:
-            logging.debug(body)
+            responded = perf_counter()
+            if stream is not None and stream.started:
+                # 已经分块发送的响应无法再修改, 没有正常结束时关闭连接
+                keep_alive = stream.keep_alive and stream.ended
+            elif isinstance(body, Static_File):
+                body.header, keep_alive = _set_connection_header(
+                    body.header, keep_alive and not self._draining and self._request_keep_alive(request)
+                )
+                self._log_body(body.header)
+                await body.send(writer)
+            else:
+                body, keep_alive = _set_connection_header(
+                    body, keep_alive and not self._draining and self._request_keep_alive(request)
+                )
+                self._log_body(body)
+                writer.write(body)
 
-            writer.write(body)
             await writer.drain()
-            writer.close()
+            written = perf_counter()
 
+        if keep_alive and type(request) == dict:
+            # 静态文件与没有使用请求体的页面不会读取请求体, 丢弃后才能读取下一个请求
+            keep_alive = await client.discard_body()
+
+        timings = self._get_request_timings(request, client, start, parsed, responded, written)
         try:
             if type(request) == dict:
-                logging.info('- - %s - "%s %s" %s - %s' % (
-                    f"{self._host}:{self._port}",
+                # 日志在后台线程中格式化
+                logging.info(
+                    '- - %s:%s - "%s %s" %s - %s - %.2fms',
+                    self._host,
+                    self._port,
                     request["request_path"]["mode"],
                     request["request_path"]["http_version"],
                     code,
                     request["request_path"]["path"],
-                ))
+                    timings["total"] * 1000,
+                )
         except KeyError:
             pass
 
-    def start(self):
-        """启动服务器"""
-        loop = asyncio.get_event_loop()
-        try:
-            self._server = loop.run_until_complete(asyncio.start_server(
-                self._client_connected,
-                host = self._host,
-                port = self._port,
-                loop=loop
-            ))
-        except Exception as err:
-            print(f"* The Server Failed To Start: {err}")
+        if self._metrics is not None:
+            path = request["request_path"]["path"] if parsed is not None else None
+            self._metrics.observe_request(path, code, timings)
+
+        return keep_alive
+
+    def _get_request_timings(
+        self, 
+        request: dict[str, Any], 
+        client: Request, 
+        start: float, 
+        parsed: Optional[float], 
+        responded: float,
+        written: float
+    ) -> dict[str, float]:
+        """请求各阶段的耗时 (秒), 查看 Request_Phases
+
+        页面在生成时读取请求体时 render 包括 body 的耗时, 静态文件使用 sendfile 发送时 write 包括读取文件的耗时, 
+        total 包括响应后丢弃没有读取的请求体"""
+        end = perf_counter()
+        timings = {"parse": (parsed or responded) - start}
+        if client.body_time is not None:
+            timings["body"] = client.body_time
+
+        if parsed is not None:
+            phase = "render" if self._get_content_type(request["request_path"]["path"]) == "text/html" else "file"
+            timings[phase] = responded - parsed
+
+        timings["write"] = written - responded
+        timings["total"] = end - start
+        return timings
+
+    def _log_body(self, body: Any):
+        """debug 模式下按 debug_log_body 比例记录完整响应"""
+        if self._debug_log_body <= 0 or not logging.root.isEnabledFor(logging.DEBUG):
             return
 
+        if self._debug_log_body >= 1 or random() < self._debug_log_body:
+            logging.debug(body)
+
+    async def _client_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter): 
+        """处理连接\n
+        保持连接时按顺序处理同一连接上的多个请求 (包括管线化请求), 
+        空闲超过 keep_alive_timeout 秒或处理了 keep_alive_max_requests 个请求后关闭连接"""
+        if self._max_connections is not None and self._connections >= self._max_connections:
+            await self._reject_connection(reader, writer)
+            return
+
+        requests = 0
+        request_head: Optional[bytes]
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    # 连接的第一个请求使用 request_header_timeout, 之后使用 keep_alive_timeout
+                    request_head = await asyncio.wait_for(
+                        reader.readuntil(Request_Head_End), 
+                        self._keep_alive_timeout if requests else self._request_header_timeout
+                    )
+                except asyncio.TimeoutError:
+                    break
+                except asyncio.IncompleteReadError:
+                    # 客户端关闭连接
+                    break
+                except asyncio.LimitOverrunError:
+                    # 请求头超过大小限制, 响应 431 后关闭连接
+                    request_head = None
+                else:
+                    # 忽略请求之间多余的空行
+                    request_head = request_head.lstrip(b"\r\n")
+                    if not request_head:
+                        continue
+
+                requests += 1
+                keep_alive = request_head is not None and requests < self._keep_alive_max_requests
+                if not await self._handle_request(reader, writer, request_head, keep_alive):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+            self._connections -= 1
+
+    async def _reject_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """超过 max_connections 时读取请求头后响应 503 并关闭连接 (不读取请求头直接关闭时客户端可能收不到响应)"""
+        self._rejected_connections += 1
+        try:
+            await asyncio.wait_for(reader.readuntil(Request_Head_End), self._request_header_timeout)
+            body = self._get_response_body(b"", 503, "Service Unavailable", encoding=self._encoding)
+            body = _add_response_header(body, b"Retry-After: %d" % self._overload_retry_after)
+            writer.write(_set_connection_header(body, False)[0])
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    def _print_start_info(self, addr: tuple, workers: int = 1):
+        """输出启动信息"""
         from pyhpweb.constant import __version__
 
-        addr = self._server.sockets[0].getsockname()
         file_name = sys.argv[0].rsplit("/", maxsplit=1)[-1]
         print(
             f"\n * Serving PyHP {__version__}, Server '{file_name}' on ip: {addr[0]} port: {addr[1]}\n\n",
             f"* Website Root Directory '{self._web_path}'\n\n",
             f"* Web Index Page '{self._web_index}', Web Error Page '{self._web_error_page}', Encoding {self._encoding}\n\n",
-            "* DEBUG Mode %s, Used uvloop %s\n\n" % (logging.DEBUG == logging.root.level, self.__use_uvloop_in),
+            "* DEBUG Mode %s, Used uvloop %s, Workers %s\n\n" % (
+                logging.DEBUG == logging.root.level, self.__use_uvloop_in, workers
+            ),
             f'* Running on http://{addr[0]}:{addr[1]} (Press CTRL+C to quit)\n'
         )
-        del self.__use_uvloop_in
+
+    def _graceful_stop(self, loop: asyncio.AbstractEventLoop):
+        """SIGTERM: 停止接受新连接, 所有连接关闭 (最多等待 shutdown_timeout 秒) 后停止事件循环\n
+        之后的响应都关闭连接 (Connection: close), 空闲的保持连接继续等待下一个请求直到 keep_alive_timeout,
+        不直接关闭以免客户端同时发送的请求没有响应"""
+        if self._draining:
+            return
+
+        self._draining = True
+        if self._server is not None:
+            self._server.close()
+
+        self._drain_task = loop.create_task(self._drain(loop))
+
+    async def _drain(self, loop: asyncio.AbstractEventLoop):
+        """等待所有连接关闭后停止事件循环"""
+        deadline = loop.time() + self._shutdown_timeout
+        while self._connections and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._connections:
+            logging.warning("PyHP %s stop with %s connections still open", os.getpid(), self._connections)
+
+        loop.stop()
+
+    def _reload(self, loop: asyncio.AbstractEventLoop):
+        """SIGHUP (单进程运行时): 启动新的解释器重新运行启动命令 (使用修改后的代码), 继承监听 socket,
+        新进程开始接受连接后当前进程平滑退出 (查看 _graceful_stop)\n
+        Worker_Supervisor.ready_timeout 秒内新进程没有开始接受连接时 (例如新代码出错) 关闭新进程, 当前进程继续运行"""
+        from pyhpweb.supervisor import Worker_Supervisor, _spawn_interpreter
+
+        if self._draining or self._reload_pid is not None or self._listen_sock is None:
+            return
+
+        logging.info("PyHP %s reloading", os.getpid())
+        ready_r, ready_w = os.pipe()
+        try:
+            pid = _spawn_interpreter(self._listen_sock, ready_w)
+        finally:
+            os.close(ready_w)
+        self._reload_pid = pid
+
+        def done(ready: bool):
+            loop.remove_reader(ready_r)
+            timer.cancel()
+            os.close(ready_r)
+            self._reload_pid = None
+            if ready:
+                logging.info("PyHP reloaded, new process %s is ready, stopping %s", pid, os.getpid())
+                self._graceful_stop(loop)
+                return
+
+            logging.error("PyHP reload failed, new process %s is not ready, keep running", pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            loop.run_in_executor(None, os.waitpid, pid, 0)
+
+        # 新进程开始接受连接时写入一个字节, 启动失败退出时读取到 EOF
+        loop.add_reader(ready_r, lambda: done(bool(os.read(ready_r, 1))))
+        timer = loop.call_later(Worker_Supervisor.ready_timeout, done, False)
+
+    def _run_forever(self, loop: asyncio.AbstractEventLoop) -> bool:
+        """运行事件循环直到 CTRL+C 或 SIGTERM (等待正在处理的请求完成, 查看 _graceful_stop), 返回是否为 CTRL+C 退出\n
+        单进程运行时收到 SIGHUP 平滑重载 (查看 _reload)"""
+        if hasattr(signal, "SIGTERM") and platform.system() != "Windows":
+            loop.add_signal_handler(signal.SIGTERM, self._graceful_stop, loop)
+            if self._listen_sock is not None:
+                loop.add_signal_handler(signal.SIGHUP, self._reload, loop)
 
         try:
             loop.run_forever()
         except KeyboardInterrupt:
-            print("\n\n\r* PyHP Server Down")
+            return True
         finally:
-            self._server.close()
-            loop.run_until_complete(self._server.wait_closed())
-            loop.close()
\ No newline at end of file
+            if self._server is not None:
+                self._server.close()
+                loop.run_until_complete(self._server.wait_closed())
+            self._render_executor.shutdown(wait=False)
+            if self._process_render_pool is not None:
+                self._process_render_pool.shutdown()
+            loop.close()
+
+            rendering = self._render_executor.stats["active_workers"]
+            if rendering:
+                # 超时的页面仍然在线程中运行, 解释器退出时会一直等待线程池的线程结束
+                logging.warning("PyHP %s exit with %s pages still rendering", os.getpid(), rendering)
+                logging.shutdown()
+                os._exit(0)
+
+        return False
+
+    def _serve_socket(self, sock: socket.socket, ready: Optional[Callable[[], Any]] = None):
+        """在当前进程 (工作进程) 中使用已监听的 sock 运行服务, 开始接受连接后调用 ready"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if self._process_render_pool is not None:
+            self._process_render_pool.start()
+
+        self._server = loop.run_until_complete(asyncio.start_server(
+            self._client_connected,
+            sock=sock,
+            limit=self._stream_limit
+        ))
+        if ready is not None:
+            ready()
+
+        self._run_forever(loop)
+
+    def warm_up(self) -> dict[str, int]:
+        """预先编译网站目录中的页面 (.html / .pyhtml / .pyh) 并缓存可以缓存的静态文件, 
+        返回 {"pages": 编译的页面数, "static_files": 缓存的静态文件数}\n
+        最多编译 template_cache_size 个页面, 静态文件总大小不超过 static_file_cache_size, 编译失败的页面跳过\n
+        workers 大于 1 时在主进程中调用, fork 出的工作进程继承已预热的缓存, 不能在事件循环中调用"""
+        pages, static_files = [], []
+        for file_path, content_type in _walk_web_files(self._web_path):
+            if content_type == "text/html":
+                pages.append(file_path)
+            else:
+                static_files.append((file_path, content_type))
+
+        compiled = 0
+        for file_path in pages[:Py_Template_Cache.max_size]:
+            try:
+                Py_Template_Cache.get(file_path, self._encoding)
+            except Exception:
+                continue
+
+            compiled += 1
+
+        cached = 0
+        if self._static_file_cache is not None and static_files:
+            cached = asyncio.run(self._warm_up_static_files(self._static_file_cache, static_files))
+
+        return {"pages": compiled, "static_files": cached}
+
+    async def _warm_up_static_files(self, cache: Static_File_Cache, static_files: list[tuple[str, str]]) -> int:
+        """读取静态文件生成完整响应并缓存到 cache (不压缩), 返回缓存的文件数"""
+        request = {"request_header": {}, "request_path": {"mode": "GET", "path": "", "http_version": "HTTP/1.1"}}
+        cached, total = 0, 0
+        for file_path, content_type in static_files:
+            try:
+                size = os.path.getsize(file_path)
+                if not cache.cacheable(size) or total + size > cache.max_bytes:
+                    continue
+
+                code, body = await self._get_static_file(file_path, content_type, request)
+            except OSError:
+                continue
+
+            if isinstance(body, Static_File):
+                body.close()
+                continue
+
+            cached += 1
+            total += size
+
+        return cached
+
+    def start(self):
+        """启动服务器, workers 大于 1 时启动多个工作进程\n
+        由 SIGHUP 重载启动时使用继承的监听 socket, 开始接受连接后通知启动它的进程 (查看 _reload 与 Worker_Supervisor)"""
+        from pyhpweb.supervisor import _get_inherited_socket
+
+        inherited = _get_inherited_socket() if platform.system() != "Windows" else None
+        if self._warm_up:
+            self._log_warm_up()
+
+        if inherited is not None and inherited[2]:
+            # Worker_Supervisor 重载时启动的工作进程, SIGHUP 只由主进程处理
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            del self.__use_uvloop_in
+            try:
+                self._serve_socket(inherited[0], inherited[1])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        if self._workers > 1:
+            self._start_workers(inherited)
+            return
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if self._process_render_pool is not None:
+            # 在创建监听 socket 前启动页面生成进程
+            self._process_render_pool.start()
+
+        ready = None
+        try:
+            if inherited is None:
+                sock = socket.create_server((self._host, int(self._port)), backlog=1024)
+            else:
+                sock, ready, _ = inherited
+            self._server = loop.run_until_complete(asyncio.start_server(
+                self._client_connected,
+                sock = sock,
+                limit = self._stream_limit
+            ))
+        except Exception as err:
+            print(f"* The Server Failed To Start: {err}")
+            return
+
+        self._listen_sock = sock
+        if ready is None:
+            self._print_start_info(sock.getsockname())
+        else:
+            ready()
+        del self.__use_uvloop_in
+
+        if self._run_forever(loop):
+            print("\n\n\r* PyHP Server Down")
+
+    def _log_warm_up(self):
+        start = perf_counter()
+        result = self.warm_up()
+        logging.info("PyHP warm up %s pages, %s static files in %.2fms" % (
+            result["pages"], result["static_files"], (perf_counter() - start) * 1000
+        ))
+
+    def _start_workers(self, inherited: Optional[tuple[socket.socket, Callable[[], None], bool]] = None):
+        """启动 workers 个工作进程, 共享同一个监听 socket (SIGHUP 重载启动时使用继承的 socket)"""
+        from pyhpweb.supervisor import Worker_Supervisor
+
+        ready = None
+        if inherited is None:
+            try:
+                sock = socket.create_server((self._host, int(self._port)), backlog=1024)
+            except Exception as err:
+                print(f"* The Server Failed To Start: {err}")
+                return
+
+            self._print_start_info(sock.getsockname(), self._workers)
+        else:
+            sock, ready, _ = inherited
+        del self.__use_uvloop_in
+
+        Worker_Supervisor(self, sock, self._workers, ready).run()
+        print("\n\n\r* PyHP Server Down")
@@ -0,0 +1,42 @@
+import builtins
+from collections import ChainMap
+from types import ModuleType
+from typing import Any
+
+
+class Include_Scope(dict):
+    """
+    include 页面的内置名称作用域
+    ----------------
+    作为被包含页面的 __builtins__, 页面自身的全局变量中没有的名称按顺序在
+    包含它的页面的全局变量 (由近到远) 与 Python 内置名称中查找 (ChainMap)\n
+    第一次读取后保存在自身, 之后的读取与普通 dict 相同, 包含页面时不需要复制包含它的页面的变量\n
+    被包含页面的写入只会写入自己的全局变量 / 局部变量, 不会修改包含它的页面的全局变量
+
+    vals:
+        包含它的页面的全局变量
+    """
+
+    __slots__ = ("parents",)
+
+    def __init__(self, vals: dict[str, Any]) -> None:
+        super().__init__()
+        parent_builtins = vals.get("__builtins__", builtins.__dict__)
+        if isinstance(parent_builtins, ModuleType):
+            parent_builtins = parent_builtins.__dict__
+
+        self.parents = ChainMap(vals, parent_builtins)
+        # import 直接从 __builtins__ 读取 __import__, 不会调用 __missing__
+        self["__import__"] = parent_builtins["__import__"]
+
+    def __missing__(self, key: str) -> Any:
+        value = self.parents[key]
+        self[key] = value
+        return value
+
+    def lookup(self, key: str, default: Any = None) -> Any:
+        """在包含它的页面的全局变量与内置名称中查找, 没有时返回 default"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, BinaryIO, Optional
+from pyhpweb.compress import Precompressed_Suffix, _compress
+from pyhpweb.error import RangeNotSatisfiableError
+
+
+def _parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """解析请求头 Range, 返回 (起始位置, 结束位置) 包括结束位置\n
+    只支持单个范围, 格式不支持时返回 None 发送整个文件, 超出文件范围时抛出 RangeNotSatisfiableError"""
+    unit, _, byte_range = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_range:
+        return None
+
+    start_text, _, end_text = byte_range.strip().partition("-")
+    try:
+        if not start_text:
+            # bytes=-500 最后 500 字节
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiableError()
+            return max(size - length, 0), size - 1
+
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiableError()
+
+    return start, min(end, size - 1)
+
+
+def _file_etag(file: BinaryIO, file_stat: os.stat_result, strong: bool = False) -> str:
+    """计算文件 ETag\n
+    弱 ETag 由文件大小与修改时间生成, 强 ETag 为文件内容的 blake2b 摘要 (需要读取整个文件)"""
+    if not strong:
+        return 'W/"%x-%x"' % (file_stat.st_size, file_stat.st_mtime_ns)
+
+    digest = hashlib.blake2b(digest_size=16)
+    file.seek(0)
+    for data in iter(lambda: file.read(65536), b""):
+        digest.update(data)
+
+    return '"%s"' % digest.hexdigest()
+
+
+class ETag_Cache:
+    """
+    静态文件 ETag 缓存
+    ----------------
+    key 为文件路径, 文件修改时间与大小 (版本) 不变时直接使用已计算的 ETag\n
+    超过 max_size 时删除最久没有使用的 ETag
+
+    max_size:
+        最多缓存文件数量
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._etags: OrderedDict[str, tuple[tuple[int, int], str]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, file_path: str, file_stat: os.stat_result) -> Optional[str]:
+        """获取已计算的 ETag, 没有或文件已修改时返回 None"""
+        version = (file_stat.st_mtime_ns, file_stat.st_size)
+        with self._lock:
+            cached = self._etags.get(file_path)
+            if cached is None or cached[0] != version:
+                return None
+
+            self._etags.move_to_end(file_path)
+            return cached[1]
+
+    def set(self, file_path: str, file_stat: os.stat_result, etag: str):
+        """缓存 ETag"""
+        with self._lock:
+            self._etags[file_path] = ((file_stat.st_mtime_ns, file_stat.st_size), etag)
+            self._etags.move_to_end(file_path)
+            while len(self._etags) > self.max_size:
+                self._etags.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._etags.clear()
+
+    def __len__(self) -> int:
+        return len(self._etags)
+
+
+class Static_Cache_Entry:
+    """
+    已缓存的静态文件响应
+
+    version:
+        文件版本 (修改时间, 大小)
+    etag:
+        文件 ETag
+    mtime:
+        文件修改时间
+    header:
+        响应头 (没有 Content-Length), 用于生成 304 响应
+    response:
+        完整的 200 响应 (响应头与文件数据)
+    date:
+        response 中的响应头 Date 行, 发送前替换为当前时间
+    """
+
+    __slots__ = ("version", "etag", "mtime", "header", "response", "date")
+
+    def __init__(
+        self, 
+        version: tuple[int, int], 
+        etag: Optional[str], 
+        mtime: float, 
+        header: dict[str, Any], 
+        response: bytes, 
+        date: bytes
+    ) -> None:
+        self.version = version
+        self.etag = etag
+        self.mtime = mtime
+        self.header = header
+        self.response = response
+        self.date = date
+
+
+class Static_File_Cache:
+    """
+    静态文件响应缓存
+    ----------------
+    缓存小文件的完整响应, 命中时不需要打开与读取文件, 只通过 os.stat 检查文件修改时间与大小\n
+    所有响应总大小超过 max_bytes 时删除最久没有使用的响应, 大于 max_file_size 的文件不缓存\n
+    只在事件循环所在线程中使用
+
+    max_bytes:
+        最多缓存字节数
+    max_file_size:
+        可以缓存的最大文件大小 (字节)
+    """
+
+    def __init__(self, max_bytes: int, max_file_size: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._entries: OrderedDict[str, Static_Cache_Entry] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _remove(self, file_path: str):
+        entry = self._entries.pop(file_path)
+        self._bytes -= len(entry.response)
+
+    def get(self, file_path: str, file_stat: os.stat_result) -> Optional[Static_Cache_Entry]:
+        """获取已缓存的响应, 没有或文件已修改时返回 None"""
+        entry = self._entries.get(file_path)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        if entry.version != (file_stat.st_mtime_ns, file_stat.st_size):
+            self._misses += 1
+            self._remove(file_path)
+            return None
+
+        self._hits += 1
+        self._entries.move_to_end(file_path)
+        return entry
+
+    def cacheable(self, size: int) -> bool:
+        """该大小的文件是否可以缓存"""
+        return size <= self.max_file_size and size <= self.max_bytes
+
+    def set(self, file_path: str, entry: Static_Cache_Entry):
+        """缓存响应, 超过 max_bytes 时删除最久没有使用的响应"""
+        if file_path in self._entries:
+            self._remove(file_path)
+
+        self._entries[file_path] = entry
+        self._bytes += len(entry.response)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """缓存状态\n
+        entries: 缓存文件数, bytes: 缓存字节数, max_bytes: 最多缓存字节数, 
+        hits: 命中次数, misses: 没有命中次数 (包括文件已修改), evictions: 超过 max_bytes 删除次数"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+        }
+
+
+def _read_file(file: BinaryIO) -> bytes:
+    """从头读取整个文件"""
+    file.seek(0)
+    return file.read()
+
+
+def _read_static_body(
+    file_path: str, 
+    file: BinaryIO, 
+    file_stat: os.stat_result, 
+    coding: Optional[str] = None, 
+    precompressed: bool = True
+) -> bytes:
+    """读取静态文件, coding 存在时返回压缩后的文件\n
+    precompressed 为 True 时优先使用不早于原文件的预先压缩文件 (例如 style.css.gz)"""
+    if coding is None:
+        return _read_file(file)
+
+    if precompressed:
+        precompressed_path = file_path + Precompressed_Suffix[coding]
+        try:
+            if os.stat(precompressed_path).st_mtime_ns >= file_stat.st_mtime_ns:
+                with open(precompressed_path, "rb") as precompressed_file:
+                    return precompressed_file.read()
+        except OSError:
+            pass
+
+    return _compress(_read_file(file), coding)
+
+
+class Static_File:
+    """
+    静态文件响应
+    ----------------
+    使用 loop.sendfile 发送文件 (系统不支持时分块读取发送), 文件不会被整个读入内存
+
+    file:
+        已打开的文件 (二进制模式), 发送后关闭
+    header:
+        响应头 (包括结尾空行)
+    offset:
+        开始发送的位置
+    count:
+        发送字节数
+    """
+
+    # 不支持 sendfile 时每次读取的字节数
+    chunk_size = 65536
+
+    def __init__(self, file: BinaryIO, header: bytes, offset: int = 0, count: int = 0) -> None:
+        self.file = file
+        self.header = header
+        self.offset = offset
+        self.count = count
+
+    async def _send_chunks(self, writer: asyncio.StreamWriter):
+        """分块读取发送"""
+        loop = asyncio.get_running_loop()
+        self.file.seek(self.offset)
+        remaining = self.count
+        while remaining > 0:
+            data = await loop.run_in_executor(None, self.file.read, min(self.chunk_size, remaining))
+            if not data:
+                break
+
+            remaining -= len(data)
+            writer.write(data)
+            await writer.drain()
+
+    async def send(self, writer: asyncio.StreamWriter):
+        """发送响应头与文件"""
+        try:
+            writer.write(self.header)
+            if not self.count:
+                return
+
+            try:
+                await asyncio.get_running_loop().sendfile(
+                    writer.transport, self.file, self.offset, self.count
+                )
+            except NotImplementedError:
+                # 事件循环不支持 sendfile (例如 uvloop)
+                await self._send_chunks(writer)
+        finally:
+            self.file.close()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,70 @@
+import asyncio
+from pyhpweb.tools import _set_connection_header
+
+
+class Response_Stream:
+    """
+    分块传输 (Transfer-Encoding: chunked) 响应
+    ----------------
+    在生成页面的线程中使用, 数据按顺序交给事件循环写入客户端\n
+    每写入 drain_size 字节等待一次 writer.drain(), 客户端接收慢时生成页面的线程也会等待
+
+    writer:
+        客户端连接
+    loop:
+        客户端连接所在的事件循环
+    keep_alive:
+        响应后是否保持连接
+    drain_size:
+        每写入多少字节等待一次 writer.drain()
+    """
+
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        loop: asyncio.AbstractEventLoop,
+        keep_alive: bool = True,
+        drain_size: int = 65536
+    ) -> None:
+        self._writer = writer
+        self._loop = loop
+        self._drain_size = drain_size
+        self._pending_size = 0
+        self.keep_alive = keep_alive
+        self.started = False
+        self.ended = False
+        self.closed = False
+
+    def _write(self, data: bytes):
+        """交给事件循环写入, 写入足够多数据后等待 drain"""
+        if self.closed:
+            return
+
+        self._loop.call_soon_threadsafe(self._writer.write, data)
+        self._pending_size += len(data)
+        if self._pending_size < self._drain_size:
+            return
+
+        self._pending_size = 0
+        try:
+            asyncio.run_coroutine_threadsafe(self._writer.drain(), self._loop).result()
+        except ConnectionError:
+            # 客户端已断开, 之后的数据直接丢弃
+            self.closed = True
+
+    def start(self, header: bytes):
+        """发送响应头, header 为 _get_response_header 生成的响应头 (没有 Content-Length)"""
+        header, self.keep_alive = _set_connection_header(b"%b\n" % header, self.keep_alive)
+        self.started = True
+        self._write(header)
+
+    def write(self, data: bytes):
+        """发送一块数据"""
+        if data:
+            self._write(b"%x\r\n%b\r\n" % (len(data), data))
+
+    def end(self, data: bytes = b""):
+        """发送最后的数据与结束块"""
+        self.write(data)
+        self._write(b"0\r\n\r\n")
+        self.ended = True
@@ -0,0 +1,267 @@
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+
+if TYPE_CHECKING:
+    from pyhpweb import PyHP_Server
+
+
+# SIGHUP 重载时新进程继承的监听 socket, 开始接受连接后写入一个字节的管道, 是否为工作进程
+Listen_Fd_Env = "PYHP_LISTEN_FD"
+Ready_Fd_Env = "PYHP_READY_FD"
+Worker_Env = "PYHP_WORKER"
+
+
+def _spawn_interpreter(sock: socket.socket, ready_fd: int, worker: bool = False) -> int:
+    """fork 后 exec 新的 Python 解释器重新运行启动命令 (使用修改后的代码), 返回新进程 pid\n
+    新进程通过环境变量继承监听 socket 与 ready_fd, PyHP_Server.start 中使用 (查看 _get_inherited_socket)"""
+    argv = getattr(sys, "orig_argv", None) or [sys.executable, *sys.argv]
+    env = {**os.environ, Listen_Fd_Env: str(sock.fileno()), Ready_Fd_Env: str(ready_fd)}
+    if worker:
+        env[Worker_Env] = "1"
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.set_inheritable(sock.fileno(), True)
+            os.set_inheritable(ready_fd, True)
+            os.execve(sys.executable, argv, env)
+        finally:
+            os._exit(127)
+
+    return pid
+
+
+def _get_inherited_socket() -> Optional[tuple[socket.socket, Callable[[], None], bool]]:
+    """SIGHUP 重载启动的进程中返回 (继承的监听 socket, 开始接受连接后调用的 ready, 是否为工作进程), 否则返回 None"""
+    listen_fd = os.environ.pop(Listen_Fd_Env, None)
+    ready_fd = os.environ.pop(Ready_Fd_Env, None)
+    worker = os.environ.pop(Worker_Env, None) is not None
+    if listen_fd is None or ready_fd is None:
+        return None
+
+    sock = socket.socket(fileno=int(listen_fd))
+    os.set_inheritable(sock.fileno(), False)
+    fd = int(ready_fd)
+    os.set_inheritable(fd, False)
+
+    def ready():
+        os.write(fd, b"1")
+        os.close(fd)
+
+    return sock, ready, worker
+
+
+class Worker_Supervisor:
+    """
+    工作进程管理
+    ----------------
+    fork workers 个工作进程, 所有工作进程共享主进程创建的监听 socket\n
+    工作进程意外退出时重新启动, 主进程收到 SIGTERM / SIGINT 时关闭所有工作进程后退出
+    (工作进程收到 SIGTERM 后停止接受新连接, 等待正在处理的请求完成)\n
+    主进程收到 SIGHUP 时平滑重载: 启动新的 Python 解释器重新运行启动命令作为新的工作进程 (使用修改后的代码, 
+    接受连接前预热缓存), 新进程开始接受连接后关闭旧进程, 
+    ready_timeout 秒内没有新进程开始接受连接时 (例如新代码出错) 关闭新进程, 保留旧进程\n
+    重载后意外退出的工作进程同样使用新的解释器重启, 主进程自身的代码不会重新加载
+
+    server:
+        PyHP_Server 对象, 工作进程中调用 server._serve_socket(sock, ready) 运行服务
+    sock:
+        已监听的 socket
+    workers:
+        工作进程数
+    ready:
+        所有工作进程开始接受连接后调用 (主进程由 SIGHUP 重载启动时), None 为不调用
+    """
+
+    # 工作进程启动后多少秒内退出视为启动失败, 重启前等待
+    restart_delay = 1
+    # SIGHUP 重载时等待新工作进程开始接受连接的最长时间 (秒)
+    ready_timeout = 30
+    # 检查工作进程退出与 SIGHUP 的间隔 (秒)
+    poll_interval = 0.2
+
+    def __init__(
+        self, 
+        server: "PyHP_Server", 
+        sock: socket.socket, 
+        workers: int, 
+        ready: Optional[Callable[[], None]] = None
+    ) -> None:
+        self._server = server
+        self._sock = sock
+        self._workers = workers
+        self._on_ready = ready
+        # 重载后使用新的解释器启动工作进程
+        self._fresh = False
+        # 工作进程 pid: 启动时间
+        self._children: dict[int, float] = {}
+        # 重载后正在关闭的旧工作进程, 退出时不重启
+        self._retiring: set[int] = set()
+        self._stopping = False
+        self._reload_requested = False
+        # 工作进程开始接受连接后写入一个字节
+        self._ready_r, self._ready_w = os.pipe()
+        os.set_blocking(self._ready_r, False)
+
+    def _spawn(self):
+        """fork 一个工作进程, 重载后启动新的解释器"""
+        if self._fresh:
+            self._children[_spawn_interpreter(self._sock, self._ready_w, worker=True)] = time.monotonic()
+            return
+
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            # 终端关闭时 SIGHUP 会发送到整个进程组, 只由主进程处理
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            os.close(self._ready_r)
+            code = 0
+            try:
+                self._server._serve_socket(self._sock, self._ready)
+            except KeyboardInterrupt:
+                pass
+            except Exception:
+                logging.exception("PyHP worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                # os._exit 不会调用 atexit, 先写入队列中的日志
+                logging.shutdown()
+                os._exit(code)
+
+        self._children[pid] = time.monotonic()
+
+    def _ready(self):
+        """工作进程开始接受连接"""
+        os.write(self._ready_w, b"1")
+
+    def _read_ready(self) -> int:
+        """读取已开始接受连接的工作进程数"""
+        ready = 0
+        while True:
+            try:
+                data = os.read(self._ready_r, 1024)
+            except BlockingIOError:
+                return ready
+
+            if not data:
+                return ready
+
+            ready += len(data)
+
+    def _wait_ready(self, workers: int) -> int:
+        """等待 workers 个工作进程开始接受连接 (最多 ready_timeout 秒), 返回已开始接受连接的工作进程数"""
+        ready = 0
+        deadline = time.monotonic() + self.ready_timeout
+        while ready < workers and not self._stopping:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            select.select([self._ready_r], [], [], min(timeout, self.poll_interval))
+            ready += self._read_ready()
+
+        return ready
+
+    def _kill(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _stop(self, signum, frame):
+        """SIGTERM / SIGINT: 关闭所有工作进程"""
+        self._stopping = True
+        self._kill([*self._children, *self._retiring])
+
+    def _request_reload(self, signum, frame):
+        """SIGHUP: 在主循环中重载"""
+        self._reload_requested = True
+
+    def _reload(self):
+        """使用新的解释器启动工作进程, 新进程开始接受连接后关闭旧进程 (旧进程处理完正在处理的请求后退出)"""
+        logging.info("PyHP reloading %s workers" % self._workers)
+        # 丢弃之前启动的工作进程写入的字节
+        self._read_ready()
+        # 等待时收到 SIGTERM / SIGINT 也会关闭旧进程
+        old_children, self._children = self._children, {}
+        self._retiring.update(old_children)
+        fresh, self._fresh = self._fresh, True
+        for _ in range(self._workers):
+            if not self._stopping:
+                self._spawn()
+
+        ready = self._wait_ready(self._workers)
+        if self._stopping:
+            return
+
+        if not ready:
+            logging.error("PyHP reload failed, no new worker is ready in %ss, keep old workers" % self.ready_timeout)
+            self._retiring.difference_update(old_children)
+            self._retiring.update(self._children)
+            self._kill(self._children)
+            self._children = old_children
+            self._fresh = fresh
+            return
+
+        if ready < self._workers:
+            logging.warning("PyHP reload: only %s of %s new workers are ready" % (ready, self._workers))
+
+        self._kill(old_children)
+        logging.info("PyHP reloaded, stopping %s old workers" % len(old_children))
+
+    def run(self):
+        """启动所有工作进程并等待, 直到收到 SIGTERM / SIGINT 且所有工作进程退出, 收到 SIGHUP 时重载"""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        for _ in range(self._workers):
+            self._spawn()
+
+        if self._on_ready is not None:
+            self._wait_ready(self._workers)
+            self._on_ready()
+
+        while self._children or self._retiring:
+            if self._reload_requested and not self._stopping:
+                self._reload_requested = False
+                self._reload()
+
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+
+            if pid == 0:
+                time.sleep(self.poll_interval)
+                continue
+
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+
+            start_time = self._children.pop(pid, None)
+            if start_time is None or self._stopping:
+                continue
+
+            logging.warning("PyHP worker %s exited with code %s, restarting" % (
+                pid, os.waitstatus_to_exitcode(status)
+            ))
+            if time.monotonic() - start_time < self.restart_delay:
+                time.sleep(self.restart_delay)
+
+            if not self._stopping:
+                self._spawn()
+
+        self._sock.close()
+        os.close(self._ready_r)
+        os.close(self._ready_w)
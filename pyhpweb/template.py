@@ -0,0 +1,431 @@
+import ast
+import hashlib
+import inspect
+import marshal
+import os
+import sys
+from collections import OrderedDict
+from importlib.util import MAGIC_NUMBER
+from threading import Lock
+from types import CodeType
+from typing import Optional, Union
+from pyhpweb.constant import Py_Code_Pattern
+from pyhpweb.tools import _walk_web_files
+
+
+# 页面编译方式改变时增加, 使旧的磁盘缓存失效
+Bytecode_Format = 3
+
+
+def _format_py_code_block(py_code_block: str):
+    """格式化代码块为 exec 可运行代码"""
+    py_code_lines = py_code_block.replace("<?py ", "", 1).replace("<?py", "", 1) \
+        .rstrip("?>").strip("\n").splitlines(True)
+    if not py_code_lines:
+        return ""
+
+    remove_indent = ""
+    for str_ in py_code_lines[0]:
+        if str_ != " ":
+            break
+        remove_indent = f"{remove_indent}{str_}"
+
+    return "".join(
+        py_code.replace(remove_indent, "", 1) for py_code in py_code_lines
+    )
+
+
+class _Async_Include_Transformer(ast.NodeTransformer):
+    """
+    使用了 await 的页面中顶层 (不在函数, 类, lambda 与推导式中) 的 include / include_parallel 调用
+    ----------------
+    include(...) 转为 await include_async(...), include_parallel(...) 转为 await __pyhp_run_sync__(include_parallel, ...),
+    没有使用 await 的被包含页面在线程池中生成, 不阻塞事件循环
+    """
+
+    def _skip(self, node: ast.AST) -> ast.AST:
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = _skip
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _skip
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Name) or node.func.id not in ("include", "include_parallel"):
+            return node
+
+        if node.func.id == "include":
+            call = ast.Call(func=ast.Name("include_async", ast.Load()), args=node.args, keywords=node.keywords)
+        else:
+            call = ast.Call(
+                func=ast.Name("__pyhp_run_sync__", ast.Load()), 
+                args=[ast.Name("include_parallel", ast.Load()), *node.args], 
+                keywords=node.keywords
+            )
+
+        return ast.fix_missing_locations(ast.copy_location(ast.Await(ast.copy_location(call, node)), node))
+
+
+class Py_Template:
+    """
+    已编译的 PyHP 页面
+    ----------------
+    整个页面被编译为一个代码对象, 静态 HTML 片段与代码块按页面顺序写入输出列表\n
+    每个代码块都被包在 try 中, 代码块出错时只在该代码块位置输出错误, 后面的代码块继续运行\n
+    代码块中可以在顶层使用 await, 使用了 await 的页面 (is_async) 运行时返回协程, 需要在事件循环中运行,
+    其中顶层的 include / include_parallel 在线程池中生成 (查看 _Async_Include_Transformer)
+
+    页面运行时需要在全局变量中提供:
+        __pyhp_echo__: 写入输出 (静态 HTML 片段)
+        __pyhp_error__: 在 except 中调用, 输出当前错误
+
+    分析页面时使用 profiled_code, 每个代码块前后调用 (第一次使用时编译):
+        __pyhp_block_start__: 代码块开始, 参数为代码块序号
+        __pyhp_block_end__: 代码块结束 (包括出错与 exit()), 参数为代码块序号
+
+    html_data:
+        HTML 数据 (str)
+    html_path:
+        HTML 文件路径 (用于代码块错误回溯)
+    version:
+        页面文件版本 (st_mtime_ns, st_size), 用于判断缓存是否失效
+    code / block_lines:
+        已编译的代码对象与每个代码块的起始行 (从 Bytecode_Cache 读取), 为 None 时编译 html_data
+    """
+
+    def __init__(
+        self,
+        html_data: str,
+        html_path: str,
+        version: Optional[tuple[int, int]] = None,
+        code: Optional[CodeType] = None,
+        block_lines: Optional[list[int]] = None
+    ) -> None:
+        self.path = html_path
+        self.version = version
+        self._html_data = html_data
+        self._profiled_code: Optional[CodeType] = None
+        self._leading_html: Optional[bool] = None
+        # 每个代码块在页面的起始行
+        self.block_lines: list[int] = []
+
+        if code is None or block_lines is None:
+            code = self._compile(html_data)
+        else:
+            self.block_lines = block_lines
+
+        self.code: CodeType = code
+        # 页面是否使用了 await
+        self.is_async: bool = bool(self.code.co_flags & inspect.CO_COROUTINE)
+        # 页面 (包括页面中的函数) 使用的所有名称, 用于判断需要提前解析的请求数据
+        self.names: frozenset[str] = frozenset(self._get_code_names(self.code))
+
+    @property
+    def block_count(self) -> int:
+        return len(self.block_lines)
+
+    @property
+    def leading_html(self) -> bool:
+        """第一个代码块前是否有静态 HTML"""
+        if self._leading_html is None:
+            match = Py_Code_Pattern.search(self._html_data)
+            self._leading_html = match is not None and match.start() > 0
+
+        return self._leading_html
+
+    @property
+    def profiled_code(self) -> CodeType:
+        """每个代码块前后调用 __pyhp_block_start__ / __pyhp_block_end__ 的代码对象"""
+        if self._profiled_code is None:
+            self._profiled_code = self._compile(self._html_data, True)
+
+        return self._profiled_code
+
+    def _compile(self, html_data: str, profile: bool = False) -> CodeType:
+        """编译整个页面, profile 为 True 时记录每个代码块的开始与结束"""
+        body: list[ast.stmt] = []
+        block_lines: list[int] = []
+        index, lineno = 0, 1
+        for py_code_block in Py_Code_Pattern.finditer(html_data):
+            start, end = py_code_block.span()
+            if start > index:
+                body.append(self._echo_node(html_data[index:start], lineno))
+                lineno += html_data.count("\n", index, start)
+
+            node = self._py_code_block_node(py_code_block.group(), lineno)
+            if profile:
+                body += self._profile_block_nodes(node, len(block_lines))
+            else:
+                body.append(node)
+
+            block_lines.append(node.lineno)
+            lineno += html_data.count("\n", start, end)
+            index = end
+
+        if index < len(html_data):
+            body.append(self._echo_node(html_data[index:], lineno))
+
+        self.block_lines = block_lines
+        module = ast.Module(body=body, type_ignores=[])
+        code = compile(module, self.path, "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+        if code.co_flags & inspect.CO_COROUTINE:
+            code = compile(
+                _Async_Include_Transformer().visit(module), self.path, "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+            )
+
+        return code
+
+    @staticmethod
+    def _profile_block_nodes(node: ast.stmt, block_index: int) -> list[ast.stmt]:
+        """__pyhp_block_start__(序号); try: 代码块 finally: __pyhp_block_end__(序号)"""
+        index = ast.Constant(block_index)
+        end_index = ast.Constant(block_index)
+        start = Py_Template._call_node("__pyhp_block_start__", [index], node.lineno)
+        end = Py_Template._call_node("__pyhp_block_end__", [end_index], node.lineno)
+        wrapper = ast.Try(body=[node], handlers=[], orelse=[], finalbody=[end])
+        Py_Template._set_lineno(node.lineno, wrapper)
+        return [start, wrapper]
+
+    @staticmethod
+    def _get_code_names(code: CodeType) -> set[str]:
+        """代码对象与其中所有函数, 类, 推导式使用的名称"""
+        names = set(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                names.update(Py_Template._get_code_names(const))
+
+        return names
+
+    @staticmethod
+    def _set_lineno(lineno: int, *nodes: Union[ast.expr, ast.stmt, ast.excepthandler]):
+        """设置生成节点的位置"""
+        for node in nodes:
+            node.lineno = node.end_lineno = lineno
+            node.col_offset = node.end_col_offset = 0
+
+    @staticmethod
+    def _call_node(name: str, args: list[ast.expr], lineno: int) -> ast.stmt:
+        """name(*args)"""
+        func = ast.Name(name, ast.Load())
+        call = ast.Call(func=func, args=args, keywords=[])
+        node = ast.Expr(call)
+        Py_Template._set_lineno(lineno, func, call, node, *args)
+        return node
+
+    @staticmethod
+    def _echo_node(html_data: str, lineno: int) -> ast.stmt:
+        """__pyhp_echo__(html_data)"""
+        return Py_Template._call_node("__pyhp_echo__", [ast.Constant(html_data)], lineno)
+
+    def _py_code_block_node(self, py_code_block: str, lineno: int) -> ast.stmt:
+        """代码块转为 try: 代码块 except Exception: __pyhp_error__() except SystemExit: pass\n
+        代码块中调用 exit() 时只结束该代码块, 之后的代码块继续运行\n
+        lineno 为代码块在页面的起始行, 用于错误回溯显示页面中的行号"""
+        py_code = _format_py_code_block(py_code_block)
+        # 格式化代码块时去掉了 <?py 后的空行
+        code_head = py_code_block[4:]
+        lineno += len(code_head) - len(code_head.lstrip("\n"))
+
+        try:
+            block = ast.parse(py_code, self.path)
+        except SyntaxError as err:
+            # 编译错误在运行代码块时抛出
+            block = ast.parse("raise SyntaxError(%r, %r)" % (
+                err.msg, (self.path, (err.lineno or 1) + lineno - 1, err.offset, err.text)
+            ))
+
+        # 使代码块行号与页面一致
+        block_body = ast.increment_lineno(block, lineno - 1).body
+
+        if not block_body:
+            block_body = [ast.Pass()]
+            self._set_lineno(lineno, *block_body)
+
+        error_type = ast.Name("Exception", ast.Load())
+        handler = ast.ExceptHandler(
+            type=error_type,
+            name=None,
+            body=[self._call_node("__pyhp_error__", [], lineno)]
+        )
+        exit_type = ast.Name("SystemExit", ast.Load())
+        exit_handler = ast.ExceptHandler(type=exit_type, name=None, body=[ast.Pass()])
+        node = ast.Try(body=block_body, handlers=[handler, exit_handler], orelse=[], finalbody=[])
+        self._set_lineno(lineno, error_type, handler, exit_type, exit_handler, *exit_handler.body, node)
+        return node
+
+
+def _replace_filename(code: CodeType, filename: str) -> CodeType:
+    """修改代码对象与其中所有函数, 类, 推导式的文件名"""
+    consts = tuple(
+        _replace_filename(const, filename) if isinstance(const, CodeType) else const for const in code.co_consts
+    )
+    return code.replace(co_filename=filename, co_consts=consts)
+
+
+class Bytecode_Cache:
+    """
+    已编译页面的磁盘缓存
+    ----------------
+    按页面内容的 sha256 保存 marshal 后的代码对象, 新进程 (重启, 新的工作进程) 读取后不需要重新编译页面\n
+    文件名包括 Python 版本 (sys.implementation.cache_tag) 与 Bytecode_Format, 
+    文件开头为 importlib.util.MAGIC_NUMBER, 版本不一致的文件不会被使用\n
+    内容相同的页面共用一个文件, 读取时修改代码对象的文件名; 读取或写入失败时与没有缓存相同\n
+    可以使用 python -m pyhpweb compile <web_path> 预先编译整个网站
+
+    path:
+        缓存目录, 不要放在网站目录中 (其他后缀的文件会被当作页面)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def _get_file(self, html_data: str) -> str:
+        digest = hashlib.sha256(html_data.encode("utf-8", "surrogatepass")).hexdigest()
+        return os.path.join(self.path, f"{digest}.{sys.implementation.cache_tag}-{Bytecode_Format}.pyhpc")
+
+    def exists(self, html_data: str) -> bool:
+        """页面是否已缓存"""
+        return os.path.isfile(self._get_file(html_data))
+
+    def load(self, html_data: str, html_path: str, version: Optional[tuple[int, int]] = None) -> Optional[Py_Template]:
+        """读取已编译的页面, 没有缓存或缓存无效时返回 None"""
+        try:
+            with open(self._get_file(html_data), "rb") as _file:
+                data = _file.read()
+        except OSError:
+            return None
+
+        if data[:len(MAGIC_NUMBER)] != MAGIC_NUMBER:
+            return None
+
+        try:
+            block_lines, code = marshal.loads(data[len(MAGIC_NUMBER):])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+        if not isinstance(code, CodeType):
+            return None
+
+        if code.co_filename != html_path:
+            code = _replace_filename(code, html_path)
+
+        return Py_Template(html_data, html_path, version, code, list(block_lines))
+
+    def save(self, template: Py_Template) -> bool:
+        """写入已编译的页面 (先写入临时文件再替换, 多个进程同时写入时不会读取到不完整的文件), 返回是否写入"""
+        file_path = self._get_file(template._html_data)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as _file:
+                _file.write(MAGIC_NUMBER + marshal.dumps((tuple(template.block_lines), template.code)))
+            os.replace(tmp_path, file_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+        return True
+
+    def compile_web_path(self, web_path: str, encoding: str = "utf-8", force: bool = False) -> dict[str, int]:
+        """编译网站目录中所有页面 (.html / .pyhtml / .pyh) 并写入缓存, force 为 False 时跳过已缓存的页面\n
+        返回 {"compiled": 编译的页面数, "cached": 已缓存的页面数, "failed": 读取或写入失败的页面数}"""
+        web_path = os.path.abspath(web_path)
+        result = {"compiled": 0, "cached": 0, "failed": 0}
+        for file_path, content_type in _walk_web_files(web_path):
+            if content_type != "text/html":
+                continue
+
+            try:
+                with open(file_path, "r", encoding=encoding) as _file:
+                    html_data = _file.read()
+            except (OSError, UnicodeDecodeError):
+                result["failed"] += 1
+                continue
+
+            if not force and self.exists(html_data):
+                result["cached"] += 1
+                continue
+
+            if self.save(Py_Template(html_data, file_path)):
+                result["compiled"] += 1
+            else:
+                result["failed"] += 1
+
+        return result
+
+
+class Template_Cache:
+    """
+    已编译页面缓存
+    ----------------
+    进程内共享, 按页面路径缓存 Py_Template, 超过 max_size 时淘汰最久未使用的页面\n
+    页面文件修改时间或大小改变时重新编译\n
+    设置 bytecode_cache 时优先读取磁盘上已编译的页面, 编译后写入磁盘
+
+    max_size:
+        最多缓存页面数量
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.bytecode_cache: Optional[Bytecode_Cache] = None
+        self._templates: OrderedDict[str, Py_Template] = OrderedDict()
+        self._lock = Lock()
+        if hasattr(os, "register_at_fork"):
+            # fork 时锁可能正被其他线程持有
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = Lock()
+
+    def get(self, html_path: str, encoding: str = "utf-8") -> Py_Template:
+        """获取页面, 没有缓存或页面已修改时读取并编译页面"""
+        stat = os.stat(html_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            template = self._templates.get(html_path)
+            if template is not None and template.version == version:
+                self._templates.move_to_end(html_path)
+                return template
+
+        with open(html_path, "r", encoding=encoding) as _file:
+            html_data = _file.read()
+
+        template = self._compile(html_data, html_path, version)
+
+        with self._lock:
+            self._templates[html_path] = template
+            self._templates.move_to_end(html_path)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+
+        return template
+
+    def _compile(self, html_data: str, html_path: str, version: tuple[int, int]) -> Py_Template:
+        """编译页面, 设置 bytecode_cache 时先读取磁盘缓存"""
+        bytecode_cache = self.bytecode_cache
+        if bytecode_cache is None:
+            return Py_Template(html_data, html_path, version)
+
+        template = bytecode_cache.load(html_data, html_path, version)
+        if template is None:
+            template = Py_Template(html_data, html_path, version)
+            bytecode_cache.save(template)
+
+        return template
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._templates.clear()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+# 进程内页面缓存
+Py_Template_Cache = Template_Cache()
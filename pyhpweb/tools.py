@@ -1,6 +1,9 @@
+import os
 import time
+from email.utils import parsedate_to_datetime
 from traceback import extract_tb, format_list
-from typing import Any, Union
+from typing import Any, Iterator, Optional, Union
+from pyhpweb.constant import Content_Type
 
 
 def _get_include_path(html_path: str, include_path: str):
@@ -30,6 +33,19 @@ def _get_include_path(html_path: str, include_path: str):
     return include_file_path
 
 
+def _walk_web_files(web_path: str) -> Iterator[tuple[str, str]]:
+    """网站目录中所有已知后缀 (Content_Type) 的文件, 返回 (文件路径, 数据类型), 跳过以 . 开头的文件与目录"""
+    for root, dirs, files in os.walk(web_path):
+        dirs[:] = sorted(_dir for _dir in dirs if not _dir.startswith("."))
+        for file_name in sorted(files):
+            if file_name.startswith(".") or "." not in file_name:
+                continue
+
+            content_type = Content_Type.get(file_name.rsplit(".", maxsplit=1)[-1])
+            if content_type is not None:
+                yield os.path.join(root, file_name), content_type
+
+
 def _traceback_to_html(traceback_):
     """错误回溯转 HTML 数据"""
     traceback_data = ""
@@ -52,7 +68,7 @@ def _get_response_header(
     if "charset" not in header["Content-Type"]:
         header["Content-Type"] += f";charset={encoding}"
     
-    if header["Content-Length"] is None:
+    if "Content-Length" in header and header["Content-Length"] is None:
         header["Content-Length"] = len(body)
     
     header_str =f"{response}\n"
@@ -61,11 +77,73 @@ def _get_response_header(
         header_str += f"{key}: {val}\n"
 
     if cookies:
-        header_str += f"{cookies}\n"
+        # 多个页面的 Cookie 合并时可能有空行, 空行会被当作响应头结束
+        header_str += "".join(f"{line}\n" for line in cookies.splitlines() if line)
 
     return header_str.encode(encoding)
 
 
+def _set_connection_header(response_data: bytes, keep_alive: bool) -> tuple[bytes, bool]:
+    """按 keep_alive 设置响应头 Connection, 返回 (响应数据, 是否保持连接)\n
+    页面已经设置 Connection: close 时不保持连接"""
+    header_end = response_data.find(b"\n\n")
+    if header_end < 0:
+        return response_data, False
+
+    header = response_data[:header_end]
+    if b"\nConnection: close" in header:
+        return response_data, False
+
+    if keep_alive:
+        return response_data, True
+
+    if b"\nConnection: keep-alive" in header:
+        header = header.replace(b"\nConnection: keep-alive", b"\nConnection: close", 1)
+    else:
+        header += b"\nConnection: close"
+
+    return header + response_data[header_end:], False
+
+
+def _add_response_header(response_data: bytes, header: bytes) -> bytes:
+    """在响应头最后加上一行响应头 (例如 b"Retry-After: 1")"""
+    header_end = response_data.find(b"\n\n")
+    if header_end < 0:
+        return response_data
+
+    return b"%b\n%b%b" % (response_data[:header_end], header, response_data[header_end:])
+
+
+def _etag_match(etags: str, etag: str) -> bool:
+    """请求头 If-None-Match 中是否有与 etag 一致的 ETag (弱比较, 忽略 W/)"""
+    if etags.strip() == "*":
+        return True
+
+    etag = etag.removeprefix("W/")
+    return any(item.strip().removeprefix("W/") == etag for item in etags.split(","))
+
+
+def _not_modified(
+    request_header: dict[str, str], 
+    etag: Optional[str] = None, 
+    last_modified: Optional[float] = None
+) -> bool:
+    """按请求头 If-None-Match / If-Modified-Since 判断是否可以响应 304 Not Modified\n
+    有 If-None-Match 时忽略 If-Modified-Since"""
+    if_none_match = request_header.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and _etag_match(if_none_match, etag)
+
+    if_modified_since = request_header.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    try:
+        return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
 def full_date(time_: Union[float, time.struct_time] = None) -> str:
     """请求头 Date"""
     if time_ is None:
@@ -29,7 +29,7 @@ setup(
     author="FengLiuFeseliud",
     author_email="17351198406@qq.com",
 
-    packages=find_packages(),
+    packages=find_packages(exclude=("tests", "tests.*")),
     include_package_data=True,
     platforms="any",
     install_requires=[
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from pyhpweb.cache import (
+    Fragment_Cache, Fragment_Cache_Entry, Page_Cache, Page_Cache_Entry, Page_Cache_Policy, Py_Fragment_Cache, 
+    _shareable
+)
+from pyhpweb.pyhp import Py_Html
+from time import monotonic
+
+
+def _fragment(version=(1, 1), expires=None) -> Fragment_Cache_Entry:
+    return Fragment_Cache_Entry(version, monotonic() + 60 if expires is None else expires, "", "", {}, {}, {})
+
+
+def test_shareable():
+    assert _shareable({"a": [1, (2.0, "3")], "b": None})
+    assert not _shareable({"a": [lambda: 1]})
+    assert not _shareable(object())
+    assert not _shareable(OrderedDict(a=1))
+
+
+def test_fragment_cache_vals_copied(tmp_path):
+    (tmp_path / "frag.pyhtml").write_text("<?py\n    counter = [1]\n    data = {'a': {1}}\n?>")
+    index = tmp_path / "index.pyhtml"
+    index.write_text(
+        "<?py\n    include('frag.pyhtml', cache=60)\n    counter.append(2)\n    data['a'].add(2)\n"
+        "    print(counter, sorted(data['a']))\n?>"
+    )
+    Py_Fragment_Cache.clear()
+    try:
+        html = [Py_Html(index.read_text(), str(index)).get_html().strip() for _ in range(3)]
+        assert html == ["[1, 2]\n[1, 2]"] * 3
+        assert Py_Fragment_Cache.stats["entries"] == 1
+    finally:
+        Py_Fragment_Cache.clear()
+
+
+def test_fragment_cache_lru():
+    cache = Fragment_Cache(max_size=2)
+    cache.set("a", _fragment())
+    cache.set("b", _fragment())
+    assert cache.get("a", (1, 1)) is not None
+    cache.set("c", _fragment())
+    assert cache.get("b", (1, 1)) is None
+    assert cache.get("a", (1, 1)) is not None
+    assert cache.get("c", (1, 1)) is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_fragment_cache_expired():
+    cache = Fragment_Cache()
+    cache.set("a", _fragment(expires=monotonic() - 1))
+    cache.set("b", _fragment())
+    assert cache.get("a", (1, 1)) is None
+    # 页面文件已修改
+    assert cache.get("b", (2, 1)) is None
+    assert len(cache) == 0
+    assert cache.stats["expired"] == 2
+
+
+def test_page_cache_expiry():
+    cache = Page_Cache()
+    fresh = Page_Cache_Entry(Page_Cache_Policy(60), (1, 1), b"fresh")
+    stale = Page_Cache_Entry(Page_Cache_Policy(0, stale_while_revalidate=60), (1, 1), b"stale")
+    expired = Page_Cache_Entry(Page_Cache_Policy(0), (1, 1), b"expired")
+    cache.set("fresh", fresh)
+    cache.set("stale", stale)
+    cache.set("expired", expired)
+    assert cache.get("fresh", (1, 1)) == (fresh, True)
+    assert cache.get("stale", (1, 1)) == (stale, False)
+    assert cache.get("expired", (1, 1)) == (None, False)
+    assert cache.get("fresh", (2, 1)) == (None, False)
+    assert len(cache) == 1
+    assert cache.stats["hits"] == 1
+    assert cache.stats["stale_hits"] == 1
+
+
+def test_page_cache_lru():
+    cache = Page_Cache(max_size=2)
+    for key in "abc":
+        cache.set(key, Page_Cache_Entry(Page_Cache_Policy(60), (1, 1), key.encode()))
+
+    assert cache.get("a", (1, 1))[0] is None
+    assert cache.get("c", (1, 1))[0] is not None
+    assert cache.stats["evictions"] == 1
@@ -0,0 +1,63 @@
+import asyncio
+import os
+from pyhpweb.multipart import Multipart_Parser
+
+
+Boundary = b"----pyhpboundary"
+
+
+def _body(*parts: tuple[bytes, bytes]) -> bytes:
+    body = b""
+    for disposition, data in parts:
+        body += b"--" + Boundary + b"\r\nContent-Disposition: form-data; " + disposition + b"\r\n\r\n" + data + b"\r\n"
+
+    return body + b"--" + Boundary + b"--\r\n"
+
+
+def _parse(body: bytes, upload_path: str, chunk_size: int = 65536, **kwargs):
+    async def parse():
+        reader = asyncio.StreamReader()
+        reader.feed_data(body)
+        reader.feed_eof()
+        parser = Multipart_Parser(
+            reader, Boundary, len(body), upload_path=upload_path, chunk_size=chunk_size, **kwargs
+        )
+        return await parser.parse()
+
+    return asyncio.run(parse())
+
+
+def test_multipart_fields_and_file(tmp_path):
+    file_data = b"line1\r\nline2\r\n--" + Boundary[:-1] + b"\r\n\r\n"
+    body = _body(
+        (b'name="a"', b"1"),
+        (b'name="file"; filename="data.bin"', file_data),
+        (b'name="b"', "中文".encode()),
+    )
+    for chunk_size in (65536, 7, 1):
+        form_data, files = _parse(body, str(tmp_path), chunk_size)
+        assert form_data == {"a": "1", "b": "中文"}
+        assert len(files) == 1
+        assert files[0]["file_name"] == "data.bin"
+        assert files[0]["file_size"] == len(file_data)
+        with open(files[0]["file_path"], "rb") as file:
+            assert file.read() == file_data
+
+
+def test_multipart_preamble_and_epilogue(tmp_path):
+    body = b"preamble\r\n" + _body((b'name="a"', b"")) + b"epilogue"
+    form_data, files = _parse(body, str(tmp_path), 5)
+    assert form_data == {"a": ""}
+    assert files == []
+
+
+def test_multipart_file_name_traversal(tmp_path):
+    upload_path = tmp_path / "upload"
+    body = _body(
+        (b'name="f1"; filename="../../evil.bin"', b"1"),
+        (b'name="f2"; filename="..\\..\\evil2.bin"', b"2"),
+    )
+    files = _parse(body, str(upload_path))[1]
+    assert [os.path.dirname(file["file_path"]) for file in files] == [str(upload_path)] * 2
+    assert sorted(os.listdir(upload_path)) == ["evil.bin", "evil2.bin"]
+    assert not os.path.exists(tmp_path / "evil.bin")
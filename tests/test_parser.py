@@ -0,0 +1,37 @@
+import pytest
+from pyhpweb.parser import _parse_request_head, httptools
+
+
+Parsers = [False, pytest.param(True, marks=pytest.mark.skipif(httptools is None, reason="httptools not installed"))]
+
+
+@pytest.mark.parametrize("use_httptools", Parsers)
+def test_parse_request_head(use_httptools):
+    data = b"GET /index.pyhtml?a=1 HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding:  gzip \r\n\r\n"
+    mode, url, http_version, header = _parse_request_head(data, use_httptools=use_httptools)
+    assert mode == "GET"
+    assert url == "/index.pyhtml?a=1"
+    assert http_version == "HTTP/1.1"
+    assert header == {"host": "localhost", "accept-encoding": "gzip"}
+
+
+@pytest.mark.parametrize("use_httptools", Parsers)
+def test_parse_request_head_repeated(use_httptools):
+    data = (
+        b"GET / HTTP/1.1\r\nAccept: text/html\r\naccept: */*\r\n"
+        b"Cookie: a=1\r\nCookie: b=2\r\n\r\n"
+    )
+    header = _parse_request_head(data, use_httptools=use_httptools)[3]
+    assert header["accept"] == "text/html, */*"
+    assert header["cookie"] == "a=1; b=2"
+
+
+@pytest.mark.parametrize("use_httptools", Parsers)
+@pytest.mark.parametrize("data", [
+    b"GET / HTTP/1.1\r\nHost localhost\r\n\r\n",
+    b"GET / HTTP/1.1\r\nHost : localhost\r\n\r\n",
+    b"GET / FTP/1.1\r\n\r\n",
+])
+def test_parse_request_head_invalid(use_httptools, data):
+    with pytest.raises(ValueError):
+        _parse_request_head(data, use_httptools=use_httptools)
@@ -0,0 +1,70 @@
+import pytest
+from types import SimpleNamespace
+from pyhpweb.error import RangeNotSatisfiableError
+from pyhpweb.static import Static_Cache_Entry, Static_File_Cache, _parse_range
+
+
+def _stat(mtime_ns: int, size: int):
+    return SimpleNamespace(st_mtime_ns=mtime_ns, st_size=size)
+
+
+def _entry(stat, response: bytes) -> Static_Cache_Entry:
+    return Static_Cache_Entry((stat.st_mtime_ns, stat.st_size), None, 0, {}, response, b"")
+
+
+def test_parse_range():
+    assert _parse_range("bytes=0-99", 1000) == (0, 99)
+    assert _parse_range("bytes=500-", 1000) == (500, 999)
+    assert _parse_range("bytes=900-2000", 1000) == (900, 999)
+    assert _parse_range("Bytes = 10-19", 1000) == (10, 19)
+
+
+def test_parse_range_suffix():
+    assert _parse_range("bytes=-100", 1000) == (900, 999)
+    assert _parse_range("bytes=-2000", 1000) == (0, 999)
+    with pytest.raises(RangeNotSatisfiableError):
+        _parse_range("bytes=-0", 1000)
+
+
+def test_parse_range_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiableError):
+        _parse_range("bytes=1000-", 1000)
+
+    with pytest.raises(RangeNotSatisfiableError):
+        _parse_range("bytes=20-10", 1000)
+
+
+def test_parse_range_unsupported():
+    assert _parse_range("items=0-10", 1000) is None
+    assert _parse_range("bytes=0-10,20-30", 1000) is None
+    assert _parse_range("bytes=a-10", 1000) is None
+
+
+def test_static_cache_lru_by_bytes():
+    cache = Static_File_Cache(max_bytes=10, max_file_size=8)
+    stats = {name: _stat(1, 4) for name in "abc"}
+    for name in "ab":
+        cache.set(name, _entry(stats[name], b"1234"))
+
+    # 使用 a 后 b 是最久没有使用的响应
+    assert cache.get("a", stats["a"]) is not None
+    cache.set("c", _entry(stats["c"], b"1234"))
+    assert cache.get("b", stats["b"]) is None
+    assert cache.get("a", stats["a"]) is not None
+    assert cache.stats["bytes"] == 8
+    assert cache.stats["evictions"] == 1
+
+
+def test_static_cache_modified():
+    cache = Static_File_Cache(max_bytes=100, max_file_size=100)
+    cache.set("a", _entry(_stat(1, 4), b"1234"))
+    assert cache.get("a", _stat(2, 4)) is None
+    assert len(cache) == 0
+    assert cache.stats["bytes"] == 0
+
+
+def test_static_cache_cacheable():
+    cache = Static_File_Cache(max_bytes=100, max_file_size=10)
+    assert cache.cacheable(10)
+    assert not cache.cacheable(11)
+    assert not Static_File_Cache(max_bytes=5, max_file_size=10).cacheable(8)